@@ -0,0 +1,66 @@
+# bench_gae.py
+# -*- coding: utf-8 -*-
+"""
+GAE 基准：对比旧的逐步张量循环与 ppo_agent.compute_gae（NumPy 批量反向扫描）。
+用法：
+    python bench_gae.py
+    python bench_gae.py --repeat 50
+"""
+import argparse
+import time
+
+import torch
+
+from ppo_agent import PPOAgent
+
+
+def gae_reference(rewards, values, dones, gamma=0.99, lam=0.95):
+    """旧实现（逐步索引标量张量），仅作对照"""
+    T = rewards.shape[0]
+    adv = torch.zeros_like(rewards, dtype=torch.float32)
+    gae = 0.0
+    for t in reversed(range(T)):
+        mask = 1.0 - dones[t]
+        delta = rewards[t] + gamma * values[t + 1] * mask - values[t]
+        gae = delta + gamma * lam * mask * gae
+        adv[t] = gae
+    ret = adv + values[:-1]
+    return adv, ret
+
+
+def make_batch(T, K, seed=0, done_prob=1 / 64):
+    g = torch.Generator().manual_seed(seed)
+    shape = (T,) if K == 1 else (T, K)
+    rewards = torch.rand(shape, generator=g)
+    values = torch.rand((T + 1,) + shape[1:], generator=g)
+    dones = (torch.rand(shape, generator=g) < done_prob).float()
+    return rewards, values, dones
+
+
+def timeit(fn, repeat):
+    fn()  # warmup
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GAE 旧循环 vs 批量 NumPy 扫描")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'T':>6} {'K':>4} {'loop(ms)':>10} {'batched(ms)':>12} {'speedup':>8}")
+    for T, K in [(256, 1), (2048, 1), (256, 8), (256, 64), (2048, 16)]:
+        rewards, values, dones = make_batch(T, K)
+        adv_ref, ret_ref = gae_reference(rewards, values, dones)
+        adv, ret = PPOAgent._compute_gae(rewards, values, dones)
+        assert torch.allclose(adv, adv_ref, atol=1e-4) and torch.allclose(ret, ret_ref, atol=1e-4)
+
+        t_loop = timeit(lambda: gae_reference(rewards, values, dones), args.repeat)
+        t_new = timeit(lambda: PPOAgent._compute_gae(rewards, values, dones), args.repeat)
+        print(f"{T:>6} {K:>4} {t_loop * 1e3:>10.3f} {t_new * 1e3:>12.3f} {t_loop / t_new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+# benchmarks.py
+# -*- coding: utf-8 -*-
+"""
+环境 / Agent / 服务端热点路径的性能基准（纯 CPU，可单独运行）：
+  env_step          ToyAllocEnv.step 吞吐（steps/s）
+  vec_env_step      VecToyAllocEnv(K=64).step 吞吐（env-steps/s）
+  env_step_replay / vec_env_step_replay
+                    同上，但容量从 ScenarioBank 回放（AR(1) 场景，固定 seed，各机器一致）
+  qnet_env_step     VecQNetEnv(K=1024).step 吞吐（时隙/s，每个时隙最多 10 个请求的分配）
+  get_action_bN     PPOAgent.get_action 单次延迟，batch = 1 / 16 / 256（ms）
+  act_det_b256      PPOAgent.act(deterministic=True) 延迟，batch = 256（ms）
+  update_N          PPOAgent.update 墙钟时间，N = 256 / 4096 条转移（ms）
+  gae_TxK           PPOAgent._compute_gae 时间（ms；输入同 bench_gae.make_batch，与旧循环的对照见 bench_gae.py）
+  gnn_nN            GraphEncoder 前向，8 张 N 节点 / 3N 条边的图拼成一批（ms）
+  predict_p50/p99   /predict 延迟（ms，进程内 TestClient）
+  predict_rps       /predict 每秒请求数
+
+结果写成 JSON，并与基线比较：某项比基线差超过 --threshold（默认 20%）即视为回退，退出码 1。
+仓库里的 bench_baseline.json 是参考机器上完整跑（非 --quick、1 线程）的结果；
+本次的 meta.quick / meta.threads 与基线不同时拒绝比较，退出码 2。
+用法：
+    python benchmarks.py                                  # 跑全部，写 bench_results.json，与 bench_baseline.json 比较
+    python benchmarks.py --only env,gae --quick --baseline quick_baseline.json
+    python benchmarks.py --save-baseline                  # 把本次结果存为基线
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Callable, Dict
+
+import numpy as np
+import torch
+
+from bench_gae import make_batch
+from graph_encoder import GraphBatch, GraphEncoder
+from ppo_agent import PPOAgent
+from qnet_env import VecQNetEnv
+from scenario_bank import ScenarioBank
+from toy_env import ToyAllocEnv, VecToyAllocEnv
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# 单项结果：{"value": float, "unit": str, "higher_is_better": bool}
+Result = Dict[str, object]
+
+
+def _result(value: float, unit: str, higher_is_better: bool) -> Result:
+    return {"value": float(value), "unit": unit, "higher_is_better": higher_is_better}
+
+
+def _best_of(fn: Callable[[], None], repeat: int, number: int) -> float:
+    """重复 repeat 轮、每轮调用 number 次，返回单次调用的最短平均耗时（秒）"""
+    fn()  # warmup
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - t0) / number)
+    return best
+
+
+# ========== 各项基准 ==========
+def bench_env(quick: bool) -> Dict[str, Result]:
+    n_steps = 2000 if quick else 20000
+    repeat = 3 if quick else 5
+    actions = np.random.default_rng(0).random((n_steps, 8), dtype=np.float32)
+
+    def run_env(env):
+        env.reset()
+        for i in range(n_steps):
+            _, _, done, _ = env.step(actions[i])
+            if done:
+                env.reset()
+
+    K = 64
+    vact = np.random.default_rng(0).random((K, 8), dtype=np.float32)
+
+    def time_vec(venv):
+        venv.reset()
+        return _best_of(lambda: venv.step(vact), repeat=repeat, number=max(1, n_steps // K))
+
+    env = ToyAllocEnv(n_requests=8, cap_max=5, horizon=64, seed=0, ar_rho=0.9)
+    t_env = _best_of(lambda: run_env(env), repeat=repeat, number=1)
+    t_vec = time_vec(VecToyAllocEnv(num_envs=K, n_requests=8, cap_max=5, horizon=64, seed=0, ar_rho=0.9))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bank = ScenarioBank.build(tmp, process="ar1", num_scenarios=1024, horizon=64, n=8, cap_max=5, seed=0)
+        env = ToyAllocEnv(n_requests=8, cap_max=5, horizon=64, seed=0, scenarios=bank, scenario_start=0)
+        t_env_replay = _best_of(lambda: run_env(env), repeat=repeat, number=1)
+        t_vec_replay = time_vec(VecToyAllocEnv(num_envs=K, n_requests=8, cap_max=5, horizon=64, seed=0,
+                                               scenarios=bank, scenario_start=0))
+        del bank, env
+
+    QK = 1024
+    qenv = VecQNetEnv(num_envs=QK, seed=0)
+    qenv.reset()
+    qact = np.random.default_rng(0).random((QK, qenv.action_dim))
+    t_qnet = _best_of(lambda: qenv.step(qact), repeat=repeat, number=5 if quick else 20)
+    return {
+        "env_step": _result(n_steps / t_env, "steps/s", True),
+        "vec_env_step": _result(K / t_vec, "steps/s", True),
+        "env_step_replay": _result(n_steps / t_env_replay, "steps/s", True),
+        "vec_env_step_replay": _result(K / t_vec_replay, "steps/s", True),
+        "qnet_env_step": _result(QK / t_qnet, "steps/s", True),
+    }
+
+
+def bench_get_action(quick: bool) -> Dict[str, Result]:
+    torch.manual_seed(0)
+    agent = PPOAgent(obs_dim=9, act_dim=8, hidden_size=128)
+    out = {}
+    for b in (1, 16, 256):
+        s = np.random.default_rng(b).random((b, 9), dtype=np.float32)
+        if b == 1:
+            s = s[0]
+        t = _best_of(lambda: agent.get_action(s), repeat=3 if quick else 5, number=50 if quick else 200)
+        out[f"get_action_b{b}"] = _result(t * 1e3, "ms", False)
+    s = np.random.default_rng(0).random((256, 9), dtype=np.float32)
+    t = _best_of(lambda: agent.act(s, deterministic=True), repeat=3 if quick else 5, number=50 if quick else 200)
+    out["act_det_b256"] = _result(t * 1e3, "ms", False)
+    return out
+
+
+def bench_update(quick: bool) -> Dict[str, Result]:
+    out = {}
+    for n in (256, 4096):
+        torch.manual_seed(0)
+        agent = PPOAgent(obs_dim=9, act_dim=8, hidden_size=128, buffer_size=n)
+        rng = np.random.default_rng(n)
+        states = rng.random((n, 9), dtype=np.float32)
+        actions, _, logprobs = agent.get_action(states)
+        values = rng.random(n, dtype=np.float32)
+        rewards = rng.random(n, dtype=np.float32)
+        dones = (np.arange(n) % 64 == 63).astype(np.float32)
+
+        def run():
+            agent.replay_buffer.clear_memo()
+            agent.replay_buffer.add_rollout(states, actions, logprobs, values, rewards, dones)
+            agent.update()
+
+        t = _best_of(run, repeat=2 if quick else 3, number=1)
+        out[f"update_{n}"] = _result(t * 1e3, "ms", False)
+    return out
+
+
+def bench_gae(quick: bool) -> Dict[str, Result]:
+    out = {}
+    for T, K in ((256, 1), (256, 16)):
+        rewards, values, dones = make_batch(T, K)
+        t = _best_of(lambda: PPOAgent._compute_gae(rewards, values, dones),
+                     repeat=3 if quick else 5, number=20 if quick else 100)
+        out[f"gae_{T}x{K}"] = _result(t * 1e3, "ms", False)
+    return out
+
+
+def bench_server(quick: bool) -> Dict[str, Result]:
+    from fastapi.testclient import TestClient
+    import server
+
+    client = TestClient(server.app)
+    body = {
+        "sd": {"src": 1, "dst": 7}, "demand": 3, "path": [1, 4, 7], "path_width_candidate": 4,
+        "per_edge_free_links": [3, 5], "src_remaining_qubits": 6, "dst_remaining_qubits": 5,
+        "priority": 2, "wait_time": 1, "global_load": 0.4, "recent_success_rate": 0.7,
+    }
+    n = 300 if quick else 3000
+    for _ in range(20):
+        client.post("/predict", json=body)
+    lat = np.empty(n)
+    t_all = time.perf_counter()
+    for i in range(n):
+        t0 = time.perf_counter()
+        r = client.post("/predict", json=body)
+        lat[i] = time.perf_counter() - t0
+    total = time.perf_counter() - t_all
+    assert r.status_code == 200, r.text
+    return {
+        "predict_p50": _result(np.percentile(lat, 50) * 1e3, "ms", False),
+        "predict_p99": _result(np.percentile(lat, 99) * 1e3, "ms", False),
+        "predict_rps": _result(n / total, "req/s", True),
+    }
+
+
+def bench_gnn(quick: bool) -> Dict[str, Result]:
+    torch.manual_seed(0)
+    rng = np.random.default_rng(0)
+    enc = GraphEncoder(node_dim=8, edge_dim=4, hidden_size=64)
+    out = {}
+    for n in (80, 800):
+        graphs = [{"node_features": rng.random((n, 8), dtype=np.float32),
+                   "edge_features": rng.random((3 * n, 4), dtype=np.float32),
+                   "edge_index": rng.integers(0, n, size=(3 * n, 2))} for _ in range(8)]
+        g = GraphBatch.from_graphs(graphs)
+        with torch.inference_mode():
+            t = _best_of(lambda: enc(g), repeat=3 if quick else 5, number=10 if quick else 50)
+        out[f"gnn_n{n}"] = _result(t * 1e3, "ms", False)
+    return out
+
+
+BENCHES = {
+    "env": bench_env,
+    "get_action": bench_get_action,
+    "update": bench_update,
+    "gae": bench_gae,
+    "gnn": bench_gnn,
+    "server": bench_server,
+}
+
+
+# ========== 与基线比较 ==========
+def compare(results: Dict[str, Result], baseline: Dict[str, Result], threshold: float):
+    """返回 [(name, base, cur, 变化比例, 是否回退)]；变化比例 >0 表示变差"""
+    rows = []
+    for name, cur in results.items():
+        base = baseline.get(name)
+        if base is None or base["value"] == 0:
+            continue
+        ratio = cur["value"] / base["value"]
+        worse = (1.0 / ratio - 1.0) if cur["higher_is_better"] else (ratio - 1.0)
+        rows.append((name, base["value"], cur["value"], worse, worse > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RL 热点路径性能基准")
+    parser.add_argument("--only", default=None, help=f"逗号分隔，可选 {','.join(BENCHES)}")
+    parser.add_argument("--quick", action="store_true", help="减少迭代次数，快速冒烟")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="torch.set_num_threads（默认取基线 meta 里的线程数，没有基线时用 torch 默认值）")
+    parser.add_argument("-o", "--out", default=os.path.join(HERE, "bench_results.json"))
+    parser.add_argument("--baseline", default=os.path.join(HERE, "bench_baseline.json"))
+    parser.add_argument("--threshold", type=float, default=0.2, help="允许的相对变差比例")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果写为基线")
+    args = parser.parse_args()
+
+    baseline_meta = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline_meta = json.load(f).get("meta", {})
+        if args.threads is None:
+            args.threads = baseline_meta.get("threads")
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    names = args.only.split(",") if args.only else list(BENCHES)
+
+    results: Dict[str, Result] = {}
+    for name in names:
+        t0 = time.perf_counter()
+        results.update(BENCHES[name](args.quick))
+        print(f"[bench] {name} done in {time.perf_counter() - t0:.1f}s")
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "torch": torch.__version__,
+            "machine": platform.machine(),
+            "threads": torch.get_num_threads(),
+            "quick": args.quick,
+        },
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved results to {args.out}")
+
+    for name, r in results.items():
+        print(f"  {name:<16} {r['value']:>12.4f} {r['unit']}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if baseline_meta is None:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return
+    # 迭代次数 / 线程数不同的结果没有可比性：拒绝比较（退出码 2），而不是报出虚假的回退或提升
+    mismatch = [f"{k}: baseline={baseline_meta.get(k)!r} run={report['meta'][k]!r}"
+                for k in ("quick", "threads") if baseline_meta.get(k) != report["meta"][k]]
+    if mismatch:
+        print(f"Not comparing with {args.baseline} ({'; '.join(mismatch)}); "
+              f"rerun with matching --quick/--threads or --save-baseline")
+        sys.exit(2)
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+
+    rows = compare(results, baseline, args.threshold)
+    regressed = [r for r in rows if r[4]]
+    print(f"\nvs baseline (threshold {args.threshold:.0%}):")
+    for name, base, cur, worse, bad in rows:
+        flag = "REGRESSION" if bad else "ok"
+        print(f"  {name:<16} {base:>12.4f} -> {cur:>12.4f}  ({worse:+.1%} worse)  {flag}")
+    if regressed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
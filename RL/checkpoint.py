@@ -0,0 +1,158 @@
+# checkpoint.py
+# -*- coding: utf-8 -*-
+"""
+可断点续训的 checkpoint：
+- capture_rng_state / restore_rng_state：python / numpy / torch（含 cuda）全局随机数状态
+- snapshot(obj)：把嵌套 dict/list 中的 tensor clone 到 CPU、ndarray 拷贝，得到与训练状态脱钩的快照
+  （在训练线程上做，只是内存拷贝；之后优化器继续 step 也不会改到快照）
+- CheckpointWriter：后台线程 torch.save，先写 tmp 再 os.replace 原子改名，只保留最近 keep 个
+- latest_checkpoint(dir) / load_training_state(path)：续训时找最新文件并读回
+
+文件仍是 {"model": state_dict, "config": {...}, ...}，export_policy.py 照常可读。
+"""
+import copy
+import os
+import queue
+import random
+import re
+import threading
+from typing import List, Optional
+
+import numpy as np
+import torch
+
+CKPT_PATTERN = re.compile(r"^ppo_ep(\d+)\.pt$")
+
+
+def checkpoint_path(save_dir: str, episode_i: int) -> str:
+    return os.path.join(save_dir, f"ppo_ep{episode_i}.pt")
+
+
+def list_checkpoints(save_dir: str) -> List[str]:
+    """save_dir 下的 ppo_ep*.pt，按回合号从旧到新"""
+    if not os.path.isdir(save_dir):
+        return []
+    found = []
+    for name in os.listdir(save_dir):
+        m = CKPT_PATTERN.match(name)
+        if m:
+            found.append((int(m.group(1)), os.path.join(save_dir, name)))
+    return [p for _, p in sorted(found)]
+
+
+def latest_checkpoint(save_dir: str) -> Optional[str]:
+    ckpts = list_checkpoints(save_dir)
+    return ckpts[-1] if ckpts else None
+
+
+def capture_rng_state() -> dict:
+    state = {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def restore_rng_state(state: dict):
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+def snapshot(obj):
+    """深拷贝一份可序列化的快照：tensor -> CPU clone，其余对象 deepcopy"""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {k: snapshot(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot(v) for v in obj)
+    return copy.deepcopy(obj)
+
+
+def load_training_state(path: str, map_location="cpu") -> dict:
+    # 里面有 numpy / Generator 等非张量对象，需要完整反序列化（只读自己写的文件）
+    return torch.load(path, map_location=map_location, weights_only=False)
+
+
+class CheckpointWriter:
+    """后台线程串行写 checkpoint。
+
+    save(state, path) 只把快照放进长度 1 的队列就返回；上一份还没写完时会等它，
+    所以内存里最多同时存在两份快照。写入失败的异常在下一次 save()/close() 时抛出。
+    """
+
+    def __init__(self, save_dir: str, keep: int = 3):
+        self.save_dir = save_dir
+        self.keep = int(keep)
+        self._q: "queue.Queue" = queue.Queue(maxsize=1)
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name="ckpt-writer", daemon=True)
+        self._thread.start()
+
+    def save(self, state: dict, path: str):
+        self._raise_pending()
+        self._q.put((state, path))
+
+    def _run(self):
+        while True:
+            item = self._q.get()
+            try:
+                if item is None:
+                    return
+                state, path = item
+                self._write(state, path)
+                self._rotate()
+                print(f"Saved checkpoint to {path}")
+            except BaseException as e:  # 交给训练线程处理
+                self._error = e
+            finally:
+                self._q.task_done()
+
+    def _write(self, state: dict, path: str):
+        tmp = f"{path}.tmp.{os.getpid()}"
+        try:
+            with open(tmp, "wb") as f:
+                torch.save(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _rotate(self):
+        if self.keep <= 0:
+            return
+        for old in list_checkpoints(self.save_dir)[:-self.keep]:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+
+    def _raise_pending(self):
+        if self._error is not None:
+            err, self._error = self._error, None
+            raise RuntimeError("checkpoint write failed") from err
+
+    def flush(self):
+        """等待已排队的 checkpoint 全部落盘"""
+        self._q.join()
+        self._raise_pending()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._q.put(None)
+            self._thread.join()
+        self._raise_pending()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
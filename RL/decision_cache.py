@@ -0,0 +1,75 @@
+# decision_cache.py
+# -*- coding: utf-8 -*-
+"""
+有界 LRU 决策缓存：同一 (sd, path, per_edge_free_links, 剩余 qubit, demand, ...) 组合在时隙间反复出现
+（RequestSelector.updateQc 重新入队、FailPairs 等），直接复用上次的 w，跳过策略前向。
+- 键：11 维特征按 quant 量化后的 int64 字节串（整数特征不受影响，浮点特征在 quant 网格内视为相同）
+- 满了按 LRU 淘汰；一个缓存只属于一个模型快照（server.set_model 为每个 ServedModel 新建一份），
+  换模型时随旧快照整体丢弃，不要在共享路径上 clear()（在途请求还在用旧快照）
+- hits / misses / evictions 计数用于观察节省的延迟
+"""
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List
+
+import numpy as np
+
+
+class DecisionCache:
+
+    def __init__(self, max_size: int = 4096, quant: float = 1e-3):
+        self.max_size = int(max_size)
+        self.quant = float(quant)
+        self._data: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def keys(self, X: np.ndarray) -> List[bytes]:
+        """X: [N, D] -> N 个规范化键"""
+        q = np.round(np.asarray(X, dtype=np.float64) / self.quant).astype(np.int64)
+        return [row.tobytes() for row in q]
+
+    def lookup(self, X: np.ndarray, infer: Callable[[np.ndarray], np.ndarray]) -> np.ndarray:
+        """逐行查缓存；未命中的行合成一个子矩阵调用一次 infer，再写回缓存"""
+        keys = self.keys(X)
+        out = np.empty(len(keys), dtype=np.int64)
+        miss_rows = []
+        with self._lock:
+            for i, k in enumerate(keys):
+                w = self._data.get(k)
+                if w is None:
+                    miss_rows.append(i)
+                else:
+                    self._data.move_to_end(k)
+                    out[i] = w
+            self.hits += len(keys) - len(miss_rows)
+            self.misses += len(miss_rows)
+        if not miss_rows:
+            return out
+
+        w_miss = infer(X[miss_rows])
+        out[miss_rows] = w_miss
+        with self._lock:
+            for i, w in zip(miss_rows, w_miss.tolist()):
+                self._data[keys[i]] = w
+                self._data.move_to_end(keys[i])
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        return out
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,260 @@
+# evaluate.py
+# -*- coding: utf-8 -*-
+"""
+离线评估 checkpoint，输出排行榜：挑出要上线（server.py / Kotlin 导出）的模型，不必重新训练。
+
+- 每个 checkpoint 的策略用 export_policy.numpy_policy 转成 NumpyPolicy，确定性动作 (tanh(mu) + 1) / 2
+- 每个 (环境配置, 种子) 用 make_vec_env 建 K = episodes 个并行环境，一次前向算 K 个动作，跑满一个回合
+  （种子固定 -> 所有 checkpoint 面对完全相同的容量序列；scenario_dir 指向场景库时按同一游标回放）
+- 环境配置 = checkpoint 里 train_config 的环境字段 + 这里给的覆盖（如 max_requests=15、scenario_dir=...），
+  旧 ckpt 没有 train_config 时按 TrainConfig 默认值
+- 多个 checkpoint 分给进程池（spawn，每个进程 1 个 BLAS 线程）
+- 结果缓存在 eval_cache.json：键为 checkpoint 文件的 sha256 + 评估配置的 sha256，再跑只评估新文件
+
+每个 checkpoint 报告：回合回报均值、95% 置信区间（正态近似）、每步平均 util / unfair、各环境配置下的均值。
+
+用法：
+    python evaluate.py ckpt/
+    python evaluate.py ckpt/ sweeps/lr/t003_s42/ --seeds 0 1 2 3 --episodes 64 \\
+        --env-config train --env-config var:max_requests=15 --workers 4 --out leaderboard.csv
+    python evaluate.py ckpt/ --export-best best.npz        # 排名第一的导出给 server.py
+"""
+import argparse
+import csv
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import fields
+from typing import Dict, List
+
+import numpy as np
+
+from checkpoint import list_checkpoints, load_training_state
+from export_policy import export_npz, numpy_policy
+from np_policy import NumpyPolicy
+from ppo_training import TrainConfig, make_vec_env, parse_value
+from threads import thread_env
+
+EVAL_VERSION = 1            # 评估逻辑改动时加一，旧缓存自动失效
+CACHE_NAME = "eval_cache.json"
+Z_95 = 1.96
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def spec_key(spec: dict) -> str:
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def eval_spec(seeds: List[int], episodes: int, env_configs: Dict[str, dict]) -> dict:
+    return {"version": EVAL_VERSION, "seeds": [int(s) for s in seeds], "episodes": int(episodes),
+            "env_configs": env_configs}
+
+
+def _load_policy(path: str):
+    """-> (NumpyPolicy, TrainConfig, 训练回合数)"""
+    ckpt = load_training_state(path)
+    policy = numpy_policy(ckpt.get("model", ckpt), ckpt.get("config"))
+    known = {f.name for f in fields(TrainConfig)}
+    cfg = TrainConfig(**{k: v for k, v in ckpt.get("train_config", {}).items() if k in known})
+    return policy, cfg, ckpt.get("episode")
+
+
+def rollout(policy: NumpyPolicy, env) -> Dict[str, np.ndarray]:
+    """K 个环境各跑完第一个回合：回报、每步平均 util / unfair（环境没有 unfair 时为 nan），形状 [K]"""
+    obs = env.reset()
+    if obs.shape[1] != policy.obs_dim:
+        raise ValueError(f"env obs_dim {obs.shape[1]} != policy obs_dim {policy.obs_dim}")
+    K = obs.shape[0]
+    ret, util, unfair, steps = np.zeros(K), np.zeros(K), np.zeros(K), np.zeros(K)
+    alive = np.ones(K, dtype=bool)
+    while alive.any():
+        obs, reward, done, info = env.step(policy.act(obs))
+        ret += reward * alive
+        util += info["util"] * alive
+        unfair += info.get("unfair", np.nan) * alive
+        steps += alive
+        alive &= ~done
+    return {"return": ret, "util": util / steps, "unfair": unfair / steps}
+
+
+def evaluate_checkpoint(path: str, spec: dict) -> dict:
+    """单个 checkpoint 在所有 (环境配置, 种子) 上的结果（在进程池里运行）"""
+    t0 = time.perf_counter()
+    policy, train_cfg, episode = _load_policy(path)
+    per_env, pooled = {}, {"return": [], "util": [], "unfair": []}
+    for name, overrides in spec["env_configs"].items():
+        cfg = train_cfg.override(overrides)
+        runs = [rollout(policy, make_vec_env(spec["episodes"], seed, cfg)) for seed in spec["seeds"]]
+        res = {k: np.concatenate([r[k] for r in runs]) for k in pooled}
+        per_env[name] = {k: float(v.mean()) for k, v in res.items()}
+        for k in pooled:
+            pooled[k].append(res[k])
+    ret = np.concatenate(pooled["return"])
+    return {
+        "episode": episode,
+        "mean": float(ret.mean()),
+        "std": float(ret.std(ddof=1)) if ret.size > 1 else 0.0,
+        "ci95": float(Z_95 * ret.std(ddof=1) / np.sqrt(ret.size)) if ret.size > 1 else 0.0,
+        "util": float(np.concatenate(pooled["util"]).mean()),
+        "unfair": float(np.concatenate(pooled["unfair"]).mean()),
+        "n": int(ret.size),
+        "per_env": per_env,
+        "eval_time": time.perf_counter() - t0,
+    }
+
+
+def _evaluate_or_error(path: str, spec: dict) -> dict:
+    """评估失败（图编码器策略、观测维度与环境配置不符等）只记在这一行，不影响其它 checkpoint"""
+    try:
+        return evaluate_checkpoint(path, spec)
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+
+def _load_cache(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_cache(cache: dict, path: str):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=1)
+    os.replace(tmp, path)
+
+
+def find_checkpoints(paths: List[str]) -> List[str]:
+    """目录展开为其中的 ppo_ep*.pt（按回合号），文件原样保留"""
+    found = []
+    for p in paths:
+        found.extend(list_checkpoints(p) if os.path.isdir(p) else [p])
+    return found
+
+
+def evaluate_all(ckpts: List[str], spec: dict, cache_path: str, workers: int = 1) -> List[dict]:
+    """返回按 mean 降序的结果行；命中缓存的不再评估，新结果写回缓存"""
+    skey = spec_key(spec)
+    cache = _load_cache(cache_path)
+    rows, todo = [], []
+    for path in ckpts:
+        key = f"{file_sha256(path)}:{skey}"
+        if key in cache:
+            rows.append({"checkpoint": path, "cached": True, **cache[key]})
+        else:
+            todo.append((path, key))
+
+    if todo:
+        if workers > 1:
+            with thread_env(1), ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+                results = list(pool.map(_evaluate_or_error, [p for p, _ in todo], [spec] * len(todo)))
+        else:
+            results = [_evaluate_or_error(p, spec) for p, _ in todo]
+        for (path, key), res in zip(todo, results):
+            if "error" not in res:
+                cache[key] = res
+            rows.append({"checkpoint": path, "cached": False, **res})
+        _save_cache(cache, cache_path)
+
+    rows.sort(key=lambda r: -r["mean"] if "error" not in r else np.inf)      # 失败的排在最后
+    return rows
+
+
+_COLUMNS = ("checkpoint", "episode", "mean", "ci95", "std", "util", "unfair", "n")
+
+
+def _env_names(rows: List[dict]) -> List[str]:
+    return next((list(r["per_env"]) for r in rows if "error" not in r), [])
+
+
+def write_csv(rows: List[dict], path: str):
+    names = _env_names(rows)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(list(_COLUMNS) + [f"mean[{n}]" for n in names])
+        for r in rows:
+            if "error" not in r:
+                w.writerow([r[c] for c in _COLUMNS] + [r["per_env"][n]["return"] for n in names])
+
+
+def print_leaderboard(rows: List[dict]):
+    names = _env_names(rows)
+    header = ["#", "checkpoint", "episode", "mean", "±ci95", "util", "unfair", *names, ""]
+    lines, failed = [header], []
+    for i, r in enumerate(rows, 1):
+        if "error" in r:
+            failed.append(r)
+            continue
+        lines.append([str(i), r["checkpoint"], str(r["episode"]), f"{r['mean']:.3f}", f"{r['ci95']:.3f}",
+                      f"{r['util']:.3f}", f"{r['unfair']:.3f}",
+                      *(f"{r['per_env'][n]['return']:.3f}" for n in names), "(cached)" if r["cached"] else ""])
+    widths = [max(len(line[i]) for line in lines) for i in range(len(header))]
+    for line in lines:
+        print("  ".join(cell.ljust(w) for cell, w in zip(line, widths)).rstrip())
+    for r in failed:
+        print(f"FAILED {r['checkpoint']}: {r['error']}")
+
+
+def parse_env_config(text: str):
+    """"name" 或 "name:key=val,key=val" -> (name, {key: val})"""
+    name, _, rest = text.partition(":")
+    overrides = {}
+    for item in filter(None, rest.split(",")):
+        key, value = item.split("=", 1)
+        overrides[key] = parse_value(value)
+    return name, overrides
+
+
+def main():
+    parser = argparse.ArgumentParser(description="checkpoint 离线评估与排行榜")
+    parser.add_argument("paths", nargs="+", help="checkpoint 目录（取其中 ppo_ep*.pt）或 .pt 文件")
+    parser.add_argument("--seeds", type=int, nargs="+", default=list(range(8)))
+    parser.add_argument("--episodes", type=int, default=32, help="每个 (环境配置, 种子) 的并行回合数")
+    parser.add_argument("--env-config", action="append", default=None, metavar="NAME[:KEY=VAL,...]",
+                        help="评估环境：在 ckpt 的训练配置上覆盖字段，可重复；默认只有 train（不覆盖）")
+    parser.add_argument("--workers", type=int, default=1, help="评估进程数")
+    parser.add_argument("--cache", default=None, help=f"缓存文件（默认第一个目录下的 {CACHE_NAME}）")
+    parser.add_argument("--out", default=None, help="排行榜另存为 .csv 或 .json")
+    parser.add_argument("--export-best", default=None, metavar="NPZ", help="把排名第一的策略导出为 .npz")
+    args = parser.parse_args()
+
+    ckpts = find_checkpoints(args.paths)
+    if not ckpts:
+        raise SystemExit(f"no checkpoints found in {args.paths}")
+    env_configs = dict(parse_env_config(t) for t in (args.env_config or ["train"]))
+    spec = eval_spec(args.seeds, args.episodes, env_configs)
+    first_dir = next((p for p in args.paths if os.path.isdir(p)), os.path.dirname(ckpts[0]) or ".")
+    cache_path = args.cache or os.path.join(first_dir, CACHE_NAME)
+
+    t0 = time.perf_counter()
+    rows = evaluate_all(ckpts, spec, cache_path, workers=args.workers)
+    print_leaderboard(rows)
+    print(f"{len(rows)} checkpoints ({sum(not r['cached'] for r in rows)} evaluated) "
+          f"in {time.perf_counter() - t0:.1f}s, cache {cache_path}")
+
+    if args.out:
+        if args.out.endswith(".json"):
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump({"spec": spec, "rows": rows}, f, indent=2)
+        else:
+            write_csv(rows, args.out)
+    if args.export_best:
+        if "error" in rows[0]:
+            raise SystemExit("no checkpoint was evaluated successfully, nothing to export")
+        export_npz(rows[0]["checkpoint"], args.export_best)
+        print(f"Exported {rows[0]['checkpoint']} to {args.export_best}")
+
+
+if __name__ == "__main__":
+    main()
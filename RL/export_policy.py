@@ -0,0 +1,235 @@
+# export_policy.py
+# -*- coding: utf-8 -*-
+"""
+把 ppo_training.py 保存的 ckpt（{"model": state_dict, "config": {...}}）导出为推理用权重文件。
+只保留策略部分 PPOAgent.pi_body + mu_head，价值网络 / log_std / 优化器状态都不需要。
+
+两种格式：
+- npz：给 np_policy.NumpyPolicy / server.py 用
+- kotlin：给模拟器在 JVM 进程内推理用的扁平二进制，权重布局与 quantum.rl.MLP 相同
+  （W 为 Array(out) { DoubleArray(in) }，逐层 sum = b[i]; sum += W[i][j] * x[j]）。全部小端：
+    0    4s   magic b"QPOL"
+    4    u32  version (= 1)
+    8    u32  层数 L（隐层 + 均值头）
+    12   u32  输出变换：0 = 无，1 = (tanh(y) + 1) / 2（PPOAgent 的确定性动作）
+    16   L 个 (u32 in, u32 out, u32 激活)，激活：0 = linear，1 = tanh，2 = ReLU
+    之后逐层 float64 W [out][in]（行主序），再 float64 b [out]
+  MLP 是 1 个 tanh 隐层 + 线性输出，PPO 策略是若干 ReLU 隐层 + 线性均值头，所以每层带激活码。
+  kotlin_forward 是按同样累加顺序写的参考前向（float64），用来和 torch / JVM 端核对数值。
+
+用法：
+    python export_policy.py ckpt/ppo_ep500.pt                 # -> ckpt/ppo_ep500.npz
+    python export_policy.py ckpt/ppo_ep500.pt -o policy.npz
+    python export_policy.py ckpt/ppo_ep500.pt --format kotlin --check 1000 --golden 16
+"""
+import argparse
+import os
+import struct
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+from np_policy import NumpyPolicy
+
+KOTLIN_MAGIC = b"QPOL"
+KOTLIN_VERSION = 1
+ACT_LINEAR, ACT_TANH, ACT_RELU = 0, 1, 2
+SQUASH_NONE, SQUASH_TANH01 = 0, 1
+
+# 一层：(W [out, in] float64, b [out] float64, 激活码)
+KotlinLayer = Tuple[np.ndarray, np.ndarray, int]
+
+
+def policy_layers(state_dict: Dict[str, torch.Tensor]) -> Tuple[List[Tuple[np.ndarray, np.ndarray]], Tuple[np.ndarray, np.ndarray]]:
+    """从 PPOAgent.state_dict() 中按层序取出 pi_body 的 Linear 和 mu_head。
+    返回 (hidden, mu)，其中 W 为 torch 原始形状 [out, in]。
+    """
+    idx = sorted({int(k.split(".")[1]) for k in state_dict if k.startswith("pi_body.") and k.endswith(".weight")})
+    hidden = [
+        (state_dict[f"pi_body.{i}.weight"].detach().cpu().numpy(),
+         state_dict[f"pi_body.{i}.bias"].detach().cpu().numpy())
+        for i in idx
+    ]
+    mu = (state_dict["mu_head.weight"].detach().cpu().numpy(),
+          state_dict["mu_head.bias"].detach().cpu().numpy())
+    return hidden, mu
+
+
+def numpy_policy(state_dict: Dict[str, torch.Tensor], config: Optional[dict] = None) -> NumpyPolicy:
+    """PPOAgent.state_dict() -> NumpyPolicy（W 转置为 [in, out]）；维度优先取 ckpt 的 config，否则按权重形状推断"""
+    if any(k.startswith("pi_encoder.") for k in state_dict):
+        raise ValueError("policies with a graph encoder are not supported by the NumPy forward")
+    config = config or {}
+    hidden, (W_mu, b_mu) = policy_layers(state_dict)
+    return NumpyPolicy([(W.T, b) for W, b in hidden], (W_mu.T, b_mu),
+                       obs_dim=config.get("obs_dim", hidden[0][0].shape[1]),
+                       act_dim=config.get("act_dim", W_mu.shape[0]),
+                       hidden_size=config.get("hidden_size", hidden[0][0].shape[0]))
+
+
+def load_checkpoint(ckpt_path: str):
+    """读取 ckpt，兼容只存了 state_dict 的文件（export_policy_path 导出的那种）"""
+    # 可续训的 ckpt 里还有优化器 / RNG 等非张量对象
+    ckpt = torch.load(ckpt_path, map_location="cpu", weights_only=False)
+    if "model" in ckpt:
+        return ckpt["model"], ckpt.get("config", {})
+    return ckpt, {}
+
+
+def export_npz(ckpt_path: str, out_path: str) -> str:
+    policy = numpy_policy(*load_checkpoint(ckpt_path))
+
+    arrays = {}
+    for i, (W, b) in enumerate(policy.hidden):
+        arrays[f"W{i}"] = W     # [in, out]
+        arrays[f"b{i}"] = b
+    arrays["W_mu"] = policy.W_mu
+    arrays["b_mu"] = policy.b_mu
+    arrays["obs_dim"] = np.int64(policy.obs_dim)
+    arrays["act_dim"] = np.int64(policy.act_dim)
+    arrays["hidden_size"] = np.int64(policy.hidden_size)
+
+    np.savez(out_path, **arrays)
+    return out_path
+
+
+# ---------- Kotlin MLP 布局 ----------
+def kotlin_layers(state_dict: Dict[str, torch.Tensor]) -> List[KotlinLayer]:
+    """PPOAgent 策略 -> [(W [out, in], b, act)]：隐层 ReLU，均值头 linear"""
+    if any(k.startswith("pi_encoder.") for k in state_dict):
+        raise ValueError("policies with a graph encoder cannot be expressed as a Kotlin MLP")
+    hidden, (W_mu, b_mu) = policy_layers(state_dict)
+    layers = [(W.astype(np.float64), b.astype(np.float64), ACT_RELU) for W, b in hidden]
+    layers.append((W_mu.astype(np.float64), b_mu.astype(np.float64), ACT_LINEAR))
+    return layers
+
+
+def write_kotlin(layers: List[KotlinLayer], out_path: str, squash: int = SQUASH_TANH01) -> str:
+    for k in range(1, len(layers)):
+        if layers[k][0].shape[1] != layers[k - 1][0].shape[0]:
+            raise ValueError(f"layer {k} input {layers[k][0].shape[1]} != layer {k - 1} output {layers[k - 1][0].shape[0]}")
+    tmp = out_path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(struct.pack("<4sIII", KOTLIN_MAGIC, KOTLIN_VERSION, len(layers), squash))
+        for W, _, act in layers:
+            f.write(struct.pack("<III", W.shape[1], W.shape[0], act))
+        for W, b, _ in layers:
+            f.write(np.ascontiguousarray(W, dtype="<f8").tobytes())
+            f.write(np.ascontiguousarray(b, dtype="<f8").tobytes())
+    os.replace(tmp, out_path)
+    return out_path
+
+
+def read_kotlin(path: str) -> Tuple[List[KotlinLayer], int]:
+    """读回 write_kotlin 的文件，返回 (layers, squash)"""
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, n_layers, squash = struct.unpack_from("<4sIII", data, 0)
+    if magic != KOTLIN_MAGIC or version != KOTLIN_VERSION:
+        raise ValueError(f"{path}: not a policy file (magic={magic!r}, version={version})")
+    off = 16
+    shapes = []
+    for _ in range(n_layers):
+        shapes.append(struct.unpack_from("<III", data, off))
+        off += 12
+    layers = []
+    for n_in, n_out, act in shapes:
+        W = np.frombuffer(data, dtype="<f8", count=n_out * n_in, offset=off).reshape(n_out, n_in)
+        off += 8 * n_out * n_in
+        b = np.frombuffer(data, dtype="<f8", count=n_out, offset=off)
+        off += 8 * n_out
+        layers.append((W, b, act))
+    if off != len(data):
+        raise ValueError(f"{path}: {len(data) - off} trailing bytes")
+    return layers, squash
+
+
+def kotlin_forward(layers: List[KotlinLayer], X: np.ndarray, squash: int = SQUASH_TANH01) -> np.ndarray:
+    """参考前向，X [B, in] -> [B, out]（float64）。
+    输入先按 FloatArray 截成 float32 再转 double；每个输出从 b[i] 开始、按 j 递增累加 W[i][j] * x[j]，
+    与 MLP.forward 的循环顺序一致（对 B 个样本和 out 个输出向量化，j 维逐列累加）。
+    """
+    h = np.asarray(X, dtype=np.float32).astype(np.float64)
+    if h.ndim == 1:
+        return kotlin_forward(layers, h[None], squash)[0]
+    for W, b, act in layers:
+        s = np.broadcast_to(b, (h.shape[0], W.shape[0])).copy()
+        for j in range(W.shape[1]):
+            s += h[:, j:j + 1] * W[:, j]
+        if act == ACT_TANH:
+            s = np.tanh(s)
+        elif act == ACT_RELU:
+            s = np.maximum(s, 0.0)
+        h = s
+    if squash == SQUASH_TANH01:
+        h = (np.tanh(h) + 1.0) / 2.0
+    return h
+
+
+def torch_policy_act(state_dict: Dict[str, torch.Tensor], X: np.ndarray) -> np.ndarray:
+    """用 torch（float32）跑同一策略的确定性动作，作为 kotlin_forward 的对照"""
+    hidden, (W_mu, b_mu) = policy_layers(state_dict)
+    with torch.inference_mode():
+        h = torch.as_tensor(np.asarray(X, dtype=np.float32))
+        for W, b in hidden:
+            h = torch.relu(h @ torch.as_tensor(W).T + torch.as_tensor(b))
+        mu = h @ torch.as_tensor(W_mu).T + torch.as_tensor(b_mu)
+        return ((torch.tanh(mu) + 1.0) / 2.0).numpy()
+
+
+def export_kotlin(ckpt_path: str, out_path: str) -> str:
+    state_dict, _ = load_checkpoint(ckpt_path)
+    return write_kotlin(kotlin_layers(state_dict), out_path)
+
+
+def check_kotlin(ckpt_path: str, bin_path: str, n: int = 1000, seed: int = 0) -> float:
+    """随机输入上比较导出文件的参考前向与 torch 策略，返回最大绝对误差（float32 前向的舍入量级）"""
+    state_dict, _ = load_checkpoint(ckpt_path)
+    layers, squash = read_kotlin(bin_path)
+    X = np.random.default_rng(seed).uniform(-1.0, 1.0, size=(n, layers[0][0].shape[1])).astype(np.float32)
+    return float(np.abs(kotlin_forward(layers, X, squash) - torch_policy_act(state_dict, X)).max())
+
+
+def write_golden(bin_path: str, out_path: str, n: int = 16, seed: int = 0) -> str:
+    """JVM 端单测用的对拍数据（小端）：u32 n, u32 in, u32 out, float32 X [n][in], float64 Y [n][out]"""
+    layers, squash = read_kotlin(bin_path)
+    n_in = layers[0][0].shape[1]
+    X = np.random.default_rng(seed).uniform(-1.0, 1.0, size=(n, n_in)).astype("<f4")
+    Y = kotlin_forward(layers, X, squash).astype("<f8")
+    with open(out_path, "wb") as f:
+        f.write(struct.pack("<III", n, n_in, Y.shape[1]))
+        f.write(X.tobytes())
+        f.write(Y.tobytes())
+    return out_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出 PPO 策略为推理权重（NumPy .npz 或 Kotlin MLP 布局的 .bin）")
+    parser.add_argument("ckpt", help="ppo_training.py 保存的 .pt 文件")
+    parser.add_argument("-o", "--out", default=None, help="输出路径，默认与 ckpt 同名 .npz / .bin")
+    parser.add_argument("--format", choices=["npz", "kotlin"], default="npz")
+    parser.add_argument("--check", type=int, default=0, metavar="N",
+                        help="kotlin 格式：在 N 个随机输入上与 torch 前向比较并打印最大误差")
+    parser.add_argument("--golden", type=int, default=0, metavar="N",
+                        help="kotlin 格式：另写 N 组输入 / 参考输出到 <out>.golden.bin")
+    args = parser.parse_args()
+
+    if args.format == "npz":
+        out = args.out or os.path.splitext(args.ckpt)[0] + ".npz"
+        export_npz(args.ckpt, out)
+        print(f"Exported policy to {out}")
+        return
+
+    out = args.out or os.path.splitext(args.ckpt)[0] + ".bin"
+    export_kotlin(args.ckpt, out)
+    print(f"Exported policy to {out}")
+    if args.check:
+        print(f"max |kotlin_forward - torch| over {args.check} inputs: {check_kotlin(args.ckpt, out, args.check):.3e}")
+    if args.golden:
+        golden = write_golden(out, os.path.splitext(out)[0] + ".golden.bin", args.golden)
+        print(f"Wrote {args.golden} golden vectors to {golden}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# graph_encoder.py
+# -*- coding: utf-8 -*-
+"""
+稀疏图编码器：把 RLStateWriter 导出的 SlotState 拓扑（node_features / edge_features / edges）编码成定长向量，
+作为 PPOAgent 的输入，替代固定长度的扁平观测。
+
+- 单张图用 dict 表示：{"node_features": [N, node_dim], "edge_features": [E, edge_dim], "edge_index": [E, 2]}
+  （edge_index 为图内局部节点编号 (u, v)，与 SlotStore[i] 的输出一致；链路无向，编码时两个方向都发消息）
+- GraphSet：一组图按 CSR 打包（node_ptr / edge_ptr，与 SlotStore.range 的输出同构），可按下标取子集
+- GraphBatch：若干图拼成一张不相交的大图（节点编号加偏移），一次前向处理不同规模的图
+- GraphEncoder：消息传递 + 均值池化；聚合用 index_add_（scatter-add），开销随边数 E 线性增长，而不是 N^2
+
+用法：
+    enc = GraphEncoder(node_dim, edge_dim, hidden_size=64)
+    agent = PPOAgent(obs_dim=enc.out_dim, act_dim=..., encoder=enc)
+    a, v, logp = agent.get_action(graph)          # graph 为上面的 dict；一批图传 list
+"""
+from typing import Dict, Sequence
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+Graph = Dict[str, np.ndarray]
+
+
+def _ranges(ptr: np.ndarray, idx: np.ndarray):
+    """CSR 中第 idx 个段拼起来的行下标（向量化，不逐段循环），以及各段长度"""
+    starts = ptr[idx]
+    counts = ptr[idx + 1] - starts
+    total = int(counts.sum())
+    offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+    return np.arange(total, dtype=np.int64) + offsets, counts
+
+
+class GraphBatch:
+    """不相交拼接后的一批图：
+      x          [ΣN, node_dim]
+      edge_index [2, 2ΣE]  (src, dst)，全局节点编号，每条无向链路两个方向各一条
+      edge_attr  [2ΣE, edge_dim]
+      batch      [ΣN]      每个节点属于第几张图
+    """
+
+    def __init__(self, x: torch.Tensor, edge_index: torch.Tensor, edge_attr: torch.Tensor,
+                 batch: torch.Tensor, num_graphs: int):
+        self.x = x
+        self.edge_index = edge_index
+        self.edge_attr = edge_attr
+        self.batch = batch
+        self.num_graphs = int(num_graphs)
+
+    def __len__(self):
+        return self.num_graphs
+
+    @classmethod
+    def from_csr(cls, node_features: np.ndarray, edge_features: np.ndarray, edge_index: np.ndarray,
+                 node_ptr: np.ndarray, edge_ptr: np.ndarray, device="cpu") -> "GraphBatch":
+        """edge_index 为各图局部编号 [ΣE, 2]；按 node_ptr 给每条边加上所属图的节点偏移"""
+        B = len(node_ptr) - 1
+        n_counts = np.diff(node_ptr)
+        e_counts = np.diff(edge_ptr)
+        shift = np.repeat(np.asarray(node_ptr[:-1], dtype=np.int64), e_counts)
+        u = np.asarray(edge_index[:, 0], dtype=np.int64) + shift
+        v = np.asarray(edge_index[:, 1], dtype=np.int64) + shift
+        ei = np.stack([np.concatenate([u, v]), np.concatenate([v, u])])
+        ea = np.concatenate([edge_features, edge_features], axis=0)
+        batch = np.repeat(np.arange(B, dtype=np.int64), n_counts)
+        return cls(
+            x=torch.as_tensor(np.asarray(node_features, dtype=np.float32), device=device),
+            edge_index=torch.as_tensor(ei, device=device),
+            edge_attr=torch.as_tensor(np.asarray(ea, dtype=np.float32), device=device),
+            batch=torch.as_tensor(batch, device=device),
+            num_graphs=B,
+        )
+
+    @classmethod
+    def from_graphs(cls, graphs: Sequence[Graph], device="cpu") -> "GraphBatch":
+        return GraphSet.from_graphs(graphs).batch(device=device)
+
+    def to(self, device) -> "GraphBatch":
+        return GraphBatch(self.x.to(device), self.edge_index.to(device), self.edge_attr.to(device),
+                          self.batch.to(device), self.num_graphs)
+
+
+class GraphSet:
+    """CSR 打包的一组图（字段与 SlotStore.range 的输出相同），用作轨迹缓冲里的状态。
+    图按时间主序存放；num_envs=K 时每 K 张图是同一时刻的 K 个环境。
+    gs[idx]（idx 为下标数组 / 张量 / 切片）返回对应图拼成的 GraphBatch。
+    """
+
+    def __init__(self, node_features: np.ndarray, edge_features: np.ndarray, edge_index: np.ndarray,
+                 node_ptr: np.ndarray, edge_ptr: np.ndarray, num_envs: int = 1, device="cpu"):
+        self.node_features = node_features
+        self.edge_features = edge_features
+        self.edge_index = edge_index
+        self.node_ptr = np.asarray(node_ptr, dtype=np.int64)
+        self.edge_ptr = np.asarray(edge_ptr, dtype=np.int64)
+        self.num_envs = int(num_envs)
+        self.device = torch.device(device)
+
+    @classmethod
+    def from_graphs(cls, graphs: Sequence[Graph], num_envs: int = 1) -> "GraphSet":
+        if len(graphs) == 0:
+            raise ValueError("GraphSet needs at least one graph")
+        nf = [np.asarray(g["node_features"], dtype=np.float32) for g in graphs]
+        ef = [np.asarray(g["edge_features"], dtype=np.float32) for g in graphs]
+        ei = [np.asarray(g["edge_index"], dtype=np.int64).reshape(-1, 2) for g in graphs]
+        node_ptr = np.concatenate([[0], np.cumsum([len(a) for a in nf])])
+        edge_ptr = np.concatenate([[0], np.cumsum([len(a) for a in ei])])
+        edge_dim = ef[0].shape[1] if ef[0].ndim == 2 else 0
+        return cls(np.concatenate(nf), np.concatenate(ef).reshape(-1, edge_dim), np.concatenate(ei),
+                   node_ptr, edge_ptr, num_envs=num_envs)
+
+    @classmethod
+    def from_slot_range(cls, rng: Dict[str, np.ndarray]) -> "GraphSet":
+        """直接包装 SlotStore.range(a, b) 的结果（零拷贝）"""
+        return cls(rng["node_features"], rng["edge_features"], rng["edge_index"], rng["node_ptr"], rng["edge_ptr"])
+
+    def __len__(self):
+        return len(self.node_ptr) - 1
+
+    def to(self, device) -> "GraphSet":
+        return GraphSet(self.node_features, self.edge_features, self.edge_index,
+                        self.node_ptr, self.edge_ptr, self.num_envs, device)
+
+    def batch(self, idx=None, device=None) -> GraphBatch:
+        device = self.device if device is None else device
+        if idx is None:
+            return GraphBatch.from_csr(self.node_features, self.edge_features, self.edge_index,
+                                       self.node_ptr, self.edge_ptr, device=device)
+        if isinstance(idx, slice):
+            idx = np.arange(len(self))[idx]
+        elif isinstance(idx, torch.Tensor):
+            idx = idx.detach().cpu().numpy()
+        idx = np.atleast_1d(np.asarray(idx, dtype=np.int64))
+        rows, n_counts = _ranges(self.node_ptr, idx)
+        erows, e_counts = _ranges(self.edge_ptr, idx)
+        node_ptr = np.concatenate([[0], np.cumsum(n_counts)])
+        edge_ptr = np.concatenate([[0], np.cumsum(e_counts)])
+        return GraphBatch.from_csr(self.node_features[rows], self.edge_features[erows], self.edge_index[erows],
+                                   node_ptr, edge_ptr, device=device)
+
+    __getitem__ = batch
+
+    def last_step(self) -> GraphBatch:
+        """最后一个时刻的 num_envs 张图（PPO 的 bootstrap 价值用）"""
+        return self.batch(slice(len(self) - self.num_envs, len(self)))
+
+
+class GraphEncoder(nn.Module):
+    """消息传递图编码器（num_layers 层），输出每张图一个 out_dim 维向量：
+      h0        = ReLU(W_in x)
+      m_{u->v}  = ReLU(W_msg [h_u, e_uv])                  每条有向边一条消息
+      agg_v     = Σ_u m_{u->v} / deg(v)                    index_add_ 按目标节点求和（scatter-add）
+      h_v      <- h_v + ReLU(W_upd [h_v, agg_v])           残差更新
+      out       = mean_{v ∈ graph} h_v                     按 batch 向量做均值池化
+    网络形状只取决于 node_dim / edge_dim，与节点数、边数无关。
+    """
+
+    def __init__(self, node_dim: int, edge_dim: int, hidden_size: int = 64, num_layers: int = 2):
+        super().__init__()
+        self.node_dim = node_dim
+        self.edge_dim = edge_dim
+        self.out_dim = hidden_size
+        self.inp = nn.Linear(node_dim, hidden_size)
+        self.msg = nn.ModuleList(nn.Linear(hidden_size + edge_dim, hidden_size) for _ in range(num_layers))
+        self.upd = nn.ModuleList(nn.Linear(2 * hidden_size, hidden_size) for _ in range(num_layers))
+
+    def forward(self, g: GraphBatch) -> torch.Tensor:
+        src, dst = g.edge_index[0], g.edge_index[1]
+        n = g.x.shape[0]
+        h = torch.relu(self.inp(g.x))
+
+        deg = torch.zeros(n, device=h.device, dtype=h.dtype).index_add_(
+            0, dst, torch.ones_like(dst, dtype=h.dtype))
+        inv_deg = (1.0 / deg.clamp(min=1.0)).unsqueeze(-1)
+        for msg, upd in zip(self.msg, self.upd):
+            m = torch.relu(msg(torch.cat([h[src], g.edge_attr], dim=-1)))      # [2ΣE, H]
+            agg = torch.zeros_like(h).index_add_(0, dst, m) * inv_deg            # [ΣN, H]
+            h = h + torch.relu(upd(torch.cat([h, agg], dim=-1)))
+
+        pooled = torch.zeros(g.num_graphs, h.shape[1], device=h.device, dtype=h.dtype).index_add_(0, g.batch, h)
+        counts = torch.zeros(g.num_graphs, device=h.device, dtype=h.dtype).index_add_(
+            0, g.batch, torch.ones_like(g.batch, dtype=h.dtype))
+        return pooled / counts.clamp(min=1.0).unsqueeze(-1)
+
+
+def as_graph_batch(states, device="cpu") -> GraphBatch:
+    """接受单张图 dict、图列表、GraphSet 或 GraphBatch，统一成 GraphBatch"""
+    if isinstance(states, GraphBatch):
+        return states.to(device)
+    if isinstance(states, GraphSet):
+        return states.batch(device=device)
+    if isinstance(states, dict):
+        states = [states]
+    return GraphBatch.from_graphs(list(states), device=device)
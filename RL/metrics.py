@@ -0,0 +1,177 @@
+# metrics.py
+# -*- coding: utf-8 -*-
+"""
+轻量的计时与指标工具（无第三方依赖）：
+- PhaseTimer:    训练循环各阶段（get_action / env_step / add_memo / update / plot ...）的累计与每次 update 的耗时
+- MetricsLogger: 把每回合 / 每次 update 的指标逐行写入 JSONL
+- Counter / Histogram / render_prometheus: 服务端 /metrics 的 Prometheus 文本格式
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+# ========== 训练侧 ==========
+class _Phase:
+    __slots__ = ("timer", "name", "t0")
+
+    def __init__(self, timer: "PhaseTimer", name: str):
+        self.timer = timer
+        self.name = name
+        self.t0 = 0.0
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        dt = time.perf_counter() - self.t0
+        self.timer.window[self.name] += dt
+        self.timer.total[self.name] += dt
+        return False
+
+
+class PhaseTimer:
+    """with timer.phase("env_step"): ...
+    enabled=False 时 phase() 返回空上下文，开销只剩一次方法调用。
+    window 是上次 reset_window() 以来的耗时，total 是全程累计。
+    """
+
+    _NULL = nullcontext()
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.window: Dict[str, float] = defaultdict(float)
+        self.total: Dict[str, float] = defaultdict(float)
+        self._phases: Dict[str, _Phase] = {}
+
+    def phase(self, name: str):
+        if not self.enabled:
+            return self._NULL
+        p = self._phases.get(name)
+        if p is None:
+            p = self._phases[name] = _Phase(self, name)
+        return p
+
+    def reset_window(self) -> Dict[str, float]:
+        """返回本窗口（通常是一次 update 周期）的各阶段耗时并清零"""
+        out = dict(self.window)
+        self.window.clear()
+        return out
+
+
+class MetricsLogger:
+    """JSONL 指标日志：每条记录一行 {"kind": ..., ...}；path=None 时什么也不做"""
+
+    def __init__(self, path: Optional[str], flush_every: int = 50):
+        self.path = path
+        self.flush_every = flush_every
+        self._n = 0
+        self._f = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._f = open(path, "a", encoding="utf-8")
+
+    def log(self, kind: str, **fields):
+        if self._f is None:
+            return
+        self._f.write(json.dumps({"kind": kind, **fields}, separators=(",", ":")) + "\n")
+        self._n += 1
+        if self._n % self.flush_every == 0:
+            self._f.flush()
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+def read_metrics_log(path: str) -> Dict[str, List[dict]]:
+    """按 kind 分组读回 MetricsLogger 写的 JSONL"""
+    out: Dict[str, List[dict]] = defaultdict(list)
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                rec = json.loads(line)
+                out[rec.get("kind", "")].append(rec)
+    return out
+
+
+# ========== 服务端（Prometheus 文本格式） ==========
+LATENCY_BUCKETS = (25e-6, 50e-6, 100e-6, 250e-6, 500e-6, 1e-3, 2.5e-3, 5e-3, 10e-3, 25e-3, 50e-3, 100e-3, 250e-3)
+BATCH_BUCKETS = (1, 2, 4, 8, 15, 32, 64, 128, 256)
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        with self._lock:
+            self._values[tuple(label_values)] += amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            for lv, v in sorted(self._values.items()):
+                yield f"{self.name}{_fmt_labels(self.labels, lv)} {v}"
+
+
+class Histogram:
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                 labels: Sequence[str] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}   # [counts..., +Inf, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(label_values)
+            if s is None:
+                s = self._series[label_values] = [0.0] * (len(self.buckets) + 2)
+            s[i] += 1
+            s[-1] += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            for lv, s in sorted(self._series.items()):
+                cum = 0.0
+                for b, c in zip(self.buckets, s):
+                    cum += c
+                    le = 'le="%g"' % b
+                    yield f"{self.name}_bucket{_fmt_labels(self.labels, lv, le)} {cum}"
+                cum += s[len(self.buckets)]
+                le = 'le="+Inf"'
+                yield f"{self.name}_bucket{_fmt_labels(self.labels, lv, le)} {cum}"
+                yield f"{self.name}_sum{_fmt_labels(self.labels, lv)} {s[-1]}"
+                yield f"{self.name}_count{_fmt_labels(self.labels, lv)} {cum}"
+
+
+def render_prometheus(metrics: Iterable, extra_lines: Iterable[str] = ()) -> str:
+    lines: List[str] = []
+    for m in metrics:
+        lines.extend(m.render())
+    lines.extend(extra_lines)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,80 @@
+# microbatch.py
+# -*- coding: utf-8 -*-
+"""
+asyncio 微批队列：把并发到达的单条请求攒成小批，一次向量化推理后分别唤醒各自的调用方。
+- submit(item) 把 (item, future) 放进队列并 await 结果
+- 后台任务取到第一条后，最多再等 max_wait_us 微秒或攒满 max_batch_size 条，
+  然后调用 fn(items) -> results（与 items 等长、同顺序），逐个 set_result
+- 后台任务在第一次 submit 时于当前事件循环里惰性启动
+max_wait_us 就是单条请求为凑批额外付出的延迟上限，可按 p99 预算调小。
+"""
+import asyncio
+from typing import Callable, List, Optional, Sequence
+
+
+class MicroBatcher:
+
+    def __init__(self, fn: Callable[[List], Sequence], max_batch_size: int = 32, max_wait_us: int = 500):
+        self.fn = fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0, int(max_wait_us)) / 1e6
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # 统计
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, item):
+        self._ensure_started()
+        fut = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, fut))
+        return await fut
+
+    async def _collect(self):
+        """阻塞到第一条请求，再在 max_wait 内尽量攒满一批"""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            items = [it for it, _ in batch]
+            try:
+                results = self.fn(items)
+            except Exception as e:  # 整批失败：把异常交给每个调用方
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(items)
+            for (_, fut), res in zip(batch, results):
+                if not fut.done():   # 调用方可能已取消
+                    fut.set_result(res)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
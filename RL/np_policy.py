@@ -0,0 +1,53 @@
+# np_policy.py
+# -*- coding: utf-8 -*-
+"""
+纯 NumPy 的 PPO 策略推理（服务端用，不依赖 torch）：
+- 权重来自 export_policy.py 导出的 .npz（PPOAgent.pi_body + mu_head）
+- 前向: h = ReLU(x @ W_i + b_i) ... ; mu = h @ W_mu + b_mu
+- 输出确定性动作 a = (tanh(mu) + 1) / 2 ∈ [0,1]^act_dim（与 get_action 的 squash 一致，只是不采样）
+
+.npz 字段约定：
+  W0, b0, W1, b1, ...   隐层，W 形状为 [in, out]（已转置，便于 x @ W）
+  W_mu, b_mu            均值头
+  obs_dim, act_dim, hidden_size   标量
+"""
+import numpy as np
+
+
+class NumpyPolicy:
+
+    def __init__(self, hidden, mu, obs_dim: int, act_dim: int, hidden_size: int = 0):
+        self.hidden = [(np.ascontiguousarray(W, dtype=np.float32), np.asarray(b, dtype=np.float32)) for W, b in hidden]
+        W_mu, b_mu = mu
+        self.W_mu = np.ascontiguousarray(W_mu, dtype=np.float32)
+        self.b_mu = np.asarray(b_mu, dtype=np.float32)
+        self.obs_dim = int(obs_dim)
+        self.act_dim = int(act_dim)
+        self.hidden_size = int(hidden_size)
+
+    @classmethod
+    def from_npz(cls, path: str) -> "NumpyPolicy":
+        with np.load(path) as z:
+            n_hidden = sum(1 for k in z.files if k.startswith("W") and k[1:].isdigit())
+            hidden = [(z[f"W{i}"], z[f"b{i}"]) for i in range(n_hidden)]
+            return cls(hidden, (z["W_mu"], z["b_mu"]),
+                       obs_dim=int(z["obs_dim"]), act_dim=int(z["act_dim"]),
+                       hidden_size=int(z["hidden_size"]))
+
+    def mean(self, X: np.ndarray) -> np.ndarray:
+        """X: [B, obs_dim] -> mu: [B, act_dim]（tanh 之前）"""
+        h = np.asarray(X, dtype=np.float32)
+        for W, b in self.hidden:
+            h = h @ W
+            h += b
+            np.maximum(h, 0.0, out=h)
+        mu = h @ self.W_mu
+        mu += self.b_mu
+        return mu
+
+    def act(self, X: np.ndarray) -> np.ndarray:
+        """确定性动作：a = (tanh(mu) + 1) / 2，形状 [B, act_dim]"""
+        y = np.tanh(self.mean(X))
+        y += 1.0
+        y *= 0.5
+        return y
@@ -0,0 +1,234 @@
+# parallel_rollout.py
+# -*- coding: utf-8 -*-
+"""
+多进程并行采样（learner / worker 结构）：
+- N 个 worker 进程，各自持有一个环境（ToyAllocEnv 或任何 reset/step 接口相同的环境）和一份 CPU 策略副本
+- 轨迹写进共享内存数组 [N, T, ...]，learner 直接以 [T, N, ...] 视图读出，无需序列化
+- learner 每次 agent.update() 之后通过 collect() 把新权重发给所有 worker，再收集下一批
+- 可复现：worker i 的环境种子与 torch/numpy 种子都是 seed + i，worker 内 torch 单线程
+- 每个 worker 采完 T 步后把当前观测写进 last_obs [N, obs_dim]，作为 learner 计算 bootstrap 值的 s_T
+- masked=True 时额外收集环境的动作有效位 env.mask（变长请求集），collect 的 batch 末尾多一个 masks
+
+用法：
+    with ParallelRollout(make_env, num_workers=4, rollout_steps=64, obs_dim=9, act_dim=8) as pr:
+        batch, ep_returns = pr.collect(agent)
+        agent.replay_buffer.add_rollout(*batch, last_obs=pr.last_obs, truncs=pr.truncs, trunc_values=pr.trunc_values)
+        agent.update()
+
+注意 env_fn 需可被 pickle（模块顶层函数或 functools.partial），worker 用 spawn 方式启动。
+"""
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import torch
+
+from ppo_agent import PPOAgent
+
+
+def _field_shapes(num_workers: int, T: int, obs_dim: int, act_dim: int,
+                  masked: bool = False) -> Dict[str, Tuple[int, ...]]:
+    shapes = {
+        "states":   (num_workers, T, obs_dim),
+        "actions":  (num_workers, T, act_dim),
+        "logprobs": (num_workers, T),
+        "values":   (num_workers, T),
+        "rewards":  (num_workers, T),
+        "dones":    (num_workers, T),
+        "truncs":   (num_workers, T),
+        "trunc_values": (num_workers, T),
+        "last_obs": (num_workers, obs_dim),
+    }
+    if masked:
+        shapes["masks"] = (num_workers, T, act_dim)
+    return shapes
+
+
+def _attach(shm_names: Dict[str, str], shapes: Dict[str, Tuple[int, ...]]):
+    """按名字打开共享内存并映射成 float32 数组；返回 (shm 句柄, 数组) 两个 dict"""
+    shms = {k: shared_memory.SharedMemory(name=n) for k, n in shm_names.items()}
+    arrays = {k: np.ndarray(shapes[k], dtype=np.float32, buffer=shms[k].buf) for k in shapes}
+    return shms, arrays
+
+
+def _worker(rank, env_fn, seed, shm_names, shapes, obs_dim, act_dim, hidden_size, max_steps_per_ep, conn):
+    torch.set_num_threads(1)
+    np.random.seed(seed + rank)
+    torch.manual_seed(seed + rank)
+
+    env = env_fn(seed + rank)
+    agent = PPOAgent(obs_dim=obs_dim, act_dim=act_dim, hidden_size=hidden_size, buffer_size=1)
+    shms, arr = _attach(shm_names, shapes)
+    T = shapes["rewards"][1]
+
+    state = env.reset()
+    ep_reward = 0.0
+    ep_steps = 0
+    try:
+        while True:
+            cmd, payload = conn.recv()
+            if cmd == "close":
+                break
+            if cmd == "get_state":
+                conn.send({"env": env, "state": state, "ep_reward": ep_reward, "ep_steps": ep_steps,
+                           "numpy": np.random.get_state(), "torch": torch.get_rng_state()})
+                continue
+            if cmd == "set_state":
+                env, state = payload["env"], payload["state"]
+                ep_reward, ep_steps = payload["ep_reward"], payload["ep_steps"]
+                np.random.set_state(payload["numpy"])
+                torch.set_rng_state(payload["torch"])
+                conn.send(True)
+                continue
+            agent.load_state_dict(payload)
+
+            ep_returns: List[float] = []
+            for t in range(T):
+                mask = getattr(env, "mask", None)
+                action, value, logprob = agent.get_action(state, mask=mask)
+                if "masks" in arr:
+                    arr["masks"][rank, t] = 1.0 if mask is None else mask
+                next_state, reward, done, info = env.step(action)
+                ep_reward += float(reward)
+                ep_steps += 1
+                # 步数上限截断不是终止：done 只记环境自己的终止，截断处用截断前观测的价值 bootstrap（同 ppo_training.main）
+                trunc = not done and max_steps_per_ep is not None and ep_steps >= max_steps_per_ep
+                if trunc:
+                    with torch.inference_mode():
+                        arr["trunc_values"][rank, t] = agent.forward(np.asarray(next_state)[None])[2].item()
+
+                arr["states"][rank, t] = state
+                arr["actions"][rank, t] = action
+                arr["logprobs"][rank, t] = logprob.item()
+                arr["values"][rank, t] = value
+                arr["rewards"][rank, t] = reward
+                arr["dones"][rank, t] = float(done)
+                arr["truncs"][rank, t] = float(trunc)
+
+                if done or trunc:
+                    ep_returns.append(ep_reward)
+                    ep_reward, ep_steps = 0.0, 0
+                    next_state = env.reset()
+                state = next_state
+            arr["last_obs"][rank] = state
+            conn.send(ep_returns)
+    finally:
+        for shm in shms.values():
+            shm.close()
+        conn.close()
+
+
+class ParallelRollout:
+
+    def __init__(
+        self,
+        env_fn: Callable[[int], object],
+        num_workers: int,
+        rollout_steps: int,
+        obs_dim: int,
+        act_dim: int,
+        hidden_size: int = 64,
+        seed: int = 0,
+        max_steps_per_ep=None,
+        masked: bool = False
+    ):
+        self.num_workers = int(num_workers)
+        self.T = int(rollout_steps)
+        self.masked = masked
+        self.shapes = _field_shapes(self.num_workers, self.T, obs_dim, act_dim, masked)
+
+        # 共享内存由 learner 创建和回收
+        self._shms = {
+            k: shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 4)
+            for k, shape in self.shapes.items()
+        }
+        self.arrays = {k: np.ndarray(shape, dtype=np.float32, buffer=self._shms[k].buf)
+                       for k, shape in self.shapes.items()}
+        shm_names = {k: shm.name for k, shm in self._shms.items()}
+
+        ctx = mp.get_context("spawn")
+        self._conns = []
+        self._procs = []
+        for rank in range(self.num_workers):
+            parent, child = ctx.Pipe()
+            p = ctx.Process(
+                target=_worker,
+                args=(rank, env_fn, seed, shm_names, self.shapes, obs_dim, act_dim,
+                      hidden_size, max_steps_per_ep, child),
+                daemon=True,
+            )
+            p.start()
+            child.close()
+            self._conns.append(parent)
+            self._procs.append(p)
+
+    def collect(self, agent: PPOAgent):
+        """下发当前权重，等待所有 worker 各采 T 步。
+        返回 ((states, actions, logprobs, values, rewards, dones[, masks]), ep_returns)，
+        数组为共享内存上的 [T, N, ...] 视图（下一次 collect 会被覆盖，需先拷进 buffer），
+        ep_returns 为本轮完成的回合回报（按 worker 顺序拼接）。
+        """
+        weights = {k: v.detach().cpu() for k, v in agent.state_dict().items()}
+        for conn in self._conns:
+            conn.send(("collect", weights))
+        ep_returns: List[float] = []
+        for conn in self._conns:
+            ep_returns.extend(conn.recv())
+
+        fields = ("states", "actions", "logprobs", "values", "rewards", "dones") + (("masks",) if self.masked else ())
+        batch = tuple(np.swapaxes(self.arrays[k], 0, 1) for k in fields)
+        return batch, ep_returns
+
+    @property
+    def truncs(self) -> np.ndarray:
+        """上一次 collect 里按 max_steps_per_ep 截断的位置 [T, N]（1.0 / 0.0），done 不含截断"""
+        return np.swapaxes(self.arrays["truncs"], 0, 1)
+
+    @property
+    def trunc_values(self) -> np.ndarray:
+        """截断处截断前观测的价值 [T, N]（其余位置无意义），bootstrap 用"""
+        return np.swapaxes(self.arrays["trunc_values"], 0, 1)
+
+    @property
+    def last_obs(self) -> np.ndarray:
+        """上一次 collect 之后各 worker 的当前观测 [N, obs_dim]（共享内存视图，bootstrap 用）"""
+        return self.arrays["last_obs"]
+
+    def get_state(self) -> List[dict]:
+        """各 worker 的环境对象、当前观测、未完成回合的累计量和 RNG 状态（用于断点续训）"""
+        for conn in self._conns:
+            conn.send(("get_state", None))
+        return [conn.recv() for conn in self._conns]
+
+    def set_state(self, states: List[dict]):
+        if len(states) != self.num_workers:
+            raise ValueError(f"expected {self.num_workers} worker states, got {len(states)}")
+        for conn, st in zip(self._conns, states):
+            conn.send(("set_state", st))
+        for conn in self._conns:
+            conn.recv()
+
+    def close(self):
+        for conn in self._conns:
+            try:
+                conn.send(("close", None))
+            except (BrokenPipeError, OSError):
+                pass
+        for p in self._procs:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+        for conn in self._conns:
+            conn.close()
+        self.arrays = {}
+        for shm in self._shms.values():
+            shm.close()
+            shm.unlink()
+        self._shms = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,100 @@
+# plot_training.py
+# -*- coding: utf-8 -*-
+"""
+训练曲线后处理：从 ppo_training.py 写的 metrics.jsonl 画回合奖励曲线与损失曲线。
+headless 训练节点只写日志，画图放到这里单独执行。
+
+用法：
+    python plot_training.py                      # 读 ./ckpt/metrics.jsonl 的最后一次运行，图存到 ./ckpt
+    python plot_training.py path/metrics.jsonl -o figs/ --run 0
+"""
+import argparse
+import json
+import os
+from typing import Dict, List
+
+import numpy as np
+
+
+def _truncate_after_resume(run: Dict[str, List[dict]], resume: dict):
+    """续训从 checkpoint 重跑：丢掉断点之后已经写过的回合 / update 记录，避免重复"""
+    run["episode"] = [r for r in run.get("episode", []) if r["episode"] <= resume["episode"]]
+    run["update"] = [r for r in run.get("update", []) if r["update"] <= resume["update"]]
+
+
+def load_runs(path: str) -> List[Dict[str, List[dict]]]:
+    """按 run_start 切分日志，每次运行返回 {kind: [记录...]}；resume 记录接在当前运行后面"""
+    runs: List[Dict[str, List[dict]]] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            rec = json.loads(line)
+            kind = rec.get("kind", "")
+            if kind == "run_start" or not runs:
+                runs.append({})
+            elif kind == "resume":
+                _truncate_after_resume(runs[-1], rec)
+            runs[-1].setdefault(kind, []).append(rec)
+    return runs
+
+
+def plot_curves(ep_rewards, pi_losses_curve, vf_losses_curve, save_dir):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    # ========== 画图（奖励/损失）==========刚加
+    # 1) 回合奖励曲线
+    plt.figure()
+    plt.plot(ep_rewards, label="episode reward")
+    if len(ep_rewards) >= 10:
+        # 简单滑窗平均
+        k = 10
+        smooth = np.convolve(ep_rewards, np.ones(k) / k, mode='valid')
+        plt.plot(range(k - 1, k - 1 + len(smooth)), smooth, label="moving avg (k=10)")
+    plt.xlabel("Episode")
+    plt.ylabel("Reward")
+    plt.title("PPO on ToyAllocEnv - Reward")
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig(os.path.join(save_dir, "reward_curve.png"))
+    print(f"Saved figure: {os.path.join(save_dir, 'reward_curve.png')}")
+
+    # 2) 损失曲线
+    plt.figure()
+    plt.plot(pi_losses_curve, label="pi_loss")
+    plt.plot(vf_losses_curve, label="vf_loss")
+    plt.xlabel("Update #")
+    plt.ylabel("Loss")
+    plt.title("PPO Loss Curves")
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig(os.path.join(save_dir, "loss_curves.png"))
+    print(f"Saved figure: {os.path.join(save_dir, 'loss_curves.png')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="从 metrics.jsonl 画 PPO 奖励/损失曲线")
+    parser.add_argument("log", nargs="?", default="./ckpt/metrics.jsonl")
+    parser.add_argument("-o", "--out-dir", default=None, help="图片目录，默认与日志同目录")
+    parser.add_argument("--run", type=int, default=-1, help="日志中的第几次运行（默认最后一次）")
+    args = parser.parse_args()
+
+    runs = load_runs(args.log)
+    if not runs:
+        raise SystemExit(f"{args.log} is empty")
+    run = runs[args.run]
+    ep_rewards = [r["reward"] for r in run.get("episode", [])]
+    updates = run.get("update", [])
+    pi_losses = [r["pi_loss"] for r in updates]
+    vf_losses = [r["vf_loss"] for r in updates]
+
+    out_dir = args.out_dir or os.path.dirname(os.path.abspath(args.log))
+    os.makedirs(out_dir, exist_ok=True)
+    plot_curves(ep_rewards, pi_losses, vf_losses, out_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# policy_adapter.py
+# -*- coding: utf-8 -*-
+"""
+把训练出的策略接到 server.py 的逐请求接口上（纯 NumPy，不依赖 torch）。
+
+server 对每个请求算 11 维特征 X（列顺序见 server.featurize）和规则上界 Wmax = min(demand, width_cand, min_edge_free)，
+策略只负责给出比例动作 a ∈ [0,1]，最终 w = floor(a * Wmax)。按策略的输入 / 输出维度识别三种布局：
+  request   11 -> 1                每个请求单独前向
+  toy       n+1 / 2n+1 -> n        ToyAllocEnv（n 个请求一组）：cap_i = min(Wmax_i, CAP_MAX)，
+                                   观测 [cap/CAP_MAX, Σcap/(n*CAP_MAX)(, mask)]，与环境里 floor(a_i * cap_i) 的分配一一对应
+  qnet      9n+3 -> n              VecQNetEnv（Qp 最多 n 个请求一组），每个请求的 8 维观测由请求特征近似：
+                                   Dd = aDemand = demand，AT ≈ clip(3 - wait_time, 1, 5)（到达时 AT ~ U[1,5]，请求里没有），
+                                   Pi = priority，WT = wait_time，hops = len(path) - 1（按默认拓扑的最大跳数归一化），
+                                   静态路径宽度 = min(min_edge_free, src/dst 剩余比特)，期望成功率 = recent_success_rate；
+                                   全局特征 |Qc|/15 = global_load，|Qp|/10 = 本组请求数，t/horizon 取 0.5
+一个批（一个时隙的 Qp）按顺序每 n 个请求拼成一条观测，不足 n 个的位置按环境的填充方式补 0（变长布局带 mask）。
+
+用法：
+    adapted = adapt(NumpyPolicy.from_npz("ckpt/ppo_ep500.npz"))    # 维度都对不上时抛 ValueError
+    a = adapted.ratios(X, w_max)                                   # (N,) ∈ [0,1]
+"""
+import functools
+
+import numpy as np
+
+from np_policy import NumpyPolicy
+
+FEATURE_DIM = 11        # server.featurize 的特征数
+TOY_CAP_MAX = 5         # ppo_training.make_toy_env 的 cap_max
+QNET_REQ_FEATURES = 8   # qnet_env.REQ_FEATURES
+QNET_GLOBAL_FEATURES = 3
+
+
+class RequestPolicy:
+    """11 -> 1 的逐请求策略"""
+    layout = "request"
+
+    def __init__(self, policy: NumpyPolicy):
+        self.policy = policy
+        self.obs_dim = policy.obs_dim
+        self.act_dim = policy.act_dim
+
+    def ratios(self, X: np.ndarray, w_max: np.ndarray) -> np.ndarray:
+        """X: (N, 11) 请求特征，w_max: (N,) 规则上界 -> (N,) 比例动作"""
+        return self.policy.act(X)[:, 0]
+
+
+class SlotPolicy(RequestPolicy):
+    """一条观测对应 n 个请求的时隙策略：按 n 个一组拼观测，一次前向算完整个批"""
+
+    def __init__(self, policy: NumpyPolicy):
+        super().__init__(policy)
+        self.n = policy.act_dim
+
+    def _obs(self, X: np.ndarray, w_max: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        """X: (G, n, 11)，w_max / mask: (G, n) -> (G, obs_dim)"""
+        raise NotImplementedError
+
+    def ratios(self, X: np.ndarray, w_max: np.ndarray) -> np.ndarray:
+        N = X.shape[0]
+        G = max(-(-N // self.n), 1)
+        Xg = np.zeros((G * self.n, X.shape[1]), dtype=np.float32)
+        Xg[:N] = X
+        wg = np.zeros(G * self.n, dtype=np.float32)
+        wg[:N] = w_max
+        mask = np.arange(G * self.n) < N
+        obs = self._obs(Xg.reshape(G, self.n, -1), wg.reshape(G, self.n), mask.reshape(G, self.n))
+        return self.policy.act(obs).reshape(-1)[:N]
+
+
+class ToyPolicy(SlotPolicy):
+    layout = "toy"
+
+    def __init__(self, policy: NumpyPolicy):
+        super().__init__(policy)
+        self.variable = policy.obs_dim == 2 * self.n + 1
+
+    def _obs(self, X, w_max, mask):
+        caps = np.minimum(w_max, TOY_CAP_MAX) * mask
+        parts = [caps / TOY_CAP_MAX, caps.sum(axis=1, keepdims=True) / (self.n * TOY_CAP_MAX)]
+        if self.variable:
+            parts.append(mask)
+        return np.concatenate(parts, axis=1).astype(np.float32)
+
+
+@functools.lru_cache(maxsize=1)
+def qnet_max_hops() -> int:
+    """训练用的默认拓扑（ppo_training.make_env 不改拓扑参数）上的最大跳数，即 qnet 观测里 hops 的归一化分母"""
+    from qnet_env import VecQNetEnv
+    return VecQNetEnv(num_envs=1).max_hops
+
+
+class QNetPolicy(SlotPolicy):
+    layout = "qnet"
+
+    def __init__(self, policy: NumpyPolicy):
+        super().__init__(policy)
+        self.max_hops = qnet_max_hops()
+
+    def _obs(self, X, w_max, mask):
+        G, n = mask.shape
+        f = np.empty((G, n, QNET_REQ_FEATURES), dtype=np.float32)
+        f[..., 0] = X[..., 0] / 5.0                                         # Dd
+        f[..., 1] = X[..., 0] / 5.0                                         # aDemand
+        f[..., 2] = np.clip(3.0 - X[..., 8], 1.0, 5.0) / 5.0                # AT
+        f[..., 3] = X[..., 7] / 5.0                                         # Pi
+        f[..., 4] = X[..., 8] / 10.0                                        # WT
+        f[..., 5] = np.maximum(X[..., 2] - 1.0, 0.0) / self.max_hops        # hops
+        f[..., 6] = np.minimum(X[..., 3], np.minimum(X[..., 5], X[..., 6])) / 7.0
+        f[..., 7] = X[..., 10]
+        f *= mask[..., None]
+        obs = np.empty((G, self.policy.obs_dim), dtype=np.float32)
+        o = n * QNET_REQ_FEATURES
+        obs[:, :o] = f.reshape(G, -1)
+        obs[:, o] = np.clip(X[:, 0, 9], 0.0, 1.0)                           # |Qc|/15 ≈ global_load
+        obs[:, o + 1] = mask.sum(axis=1) / n
+        obs[:, o + 2] = 0.5
+        obs[:, o + QNET_GLOBAL_FEATURES:] = mask
+        return obs
+
+
+def adapt(policy: NumpyPolicy, source: str = "policy") -> RequestPolicy:
+    """按 (obs_dim, act_dim) 选布局；都对不上时抛 ValueError"""
+    obs_dim, n = policy.obs_dim, policy.act_dim
+    if obs_dim == FEATURE_DIM and n == 1:
+        return RequestPolicy(policy)
+    if n >= 1 and obs_dim in (n + 1, 2 * n + 1):
+        return ToyPolicy(policy)
+    if n >= 1 and obs_dim == n * QNET_REQ_FEATURES + QNET_GLOBAL_FEATURES + n:
+        return QNetPolicy(policy)
+    raise ValueError(
+        f"{source} has obs_dim={obs_dim}, act_dim={n}; server supports 11 -> 1 (per request), "
+        f"n+1 or 2n+1 -> n (toy) and {QNET_REQ_FEATURES + 1}n+{QNET_GLOBAL_FEATURES} -> n (qnet)"
+    )
@@ -1,75 +1,243 @@
 # ppo_agent.py
 # -*- coding: utf-8 -*-
-from dataclasses import dataclass
-from typing import List, Tuple, Optional
+import copy
+import time
+from typing import Tuple, Optional
 import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
+from graph_encoder import GraphSet, as_graph_batch
+
 # ========== 工具 ==========
 LOG2 = np.log(2.0)
+LOG_SQRT_2PI = 0.5 * np.log(2.0 * np.pi)
+# _logprob_squashed 先把动作夹到 [1e-6, 1-1e-6] 再求 atanh；act() 直接用 z 时按同一边界夹 z，两者一致
+Z_CLAMP = float(np.arctanh(1.0 - 2e-6))
 
 def atanh(x: torch.Tensor) -> torch.Tensor:
     x = x.clamp(-1 + 1e-6, 1 - 1e-6)
     return 0.5 * (torch.log1p(x) - torch.log1p(-x))
+
+
+def compute_gae(rewards: np.ndarray, values: np.ndarray, dones: np.ndarray,
+                gamma: float = 0.99, lam: float = 0.95,
+                truncs: Optional[np.ndarray] = None, trunc_values: Optional[np.ndarray] = None
+                ) -> Tuple[np.ndarray, np.ndarray]:
+    """批量 GAE（NumPy）：一次处理 K 条并行轨迹。
+    - rewards/dones: [T] 或 [T, K]（按时间为首维，与 RolloutBuffer 布局一致）
+    - values:        [T+1] 或 [T+1, K]，最后一行是各环境自己的 bootstrap 值 v_T
+    - truncs / trunc_values（可选，形状同 rewards）：truncs_t=1 表示第 t 步后因步数上限截断（环境没有终止、随后被重置），
+      这一步用截断前观测的价值 trunc_values_t 做 bootstrap，并在此切断递推（下一行已是新回合）
+    先整体向量化算出 δ_t 与折扣系数 γλ(1-done_t)，再做一次反向扫描：
+      A_t = δ_t + γλ(1-done_t) A_{t+1}
+    扫描每步只是对 K 维连续行的一次乘加，不再有逐元素的张量索引。
+    返回 (adv, ret)，形状与 rewards 相同。
+    """
+    r = np.asarray(rewards, dtype=np.float32)
+    v = np.asarray(values, dtype=np.float32)
+    not_done = 1.0 - np.asarray(dones, dtype=np.float32)
+
+    v_next, cont = v[1:], not_done
+    if truncs is not None:
+        cut = np.asarray(truncs, dtype=np.float32) > 0.5
+        v_next = np.where(cut, np.asarray(trunc_values, dtype=np.float32), v_next)
+        cont = not_done * ~cut
+    deltas = r + gamma * v_next * not_done - v[:-1]
+    coef = (gamma * lam) * cont
+    adv = np.empty_like(deltas)
+    T = deltas.shape[0]
+    if deltas.ndim == 1:
+        # 单条轨迹：纯 Python float 扫描比 0 维数组运算快得多
+        d, c = deltas.tolist(), coef.tolist()
+        gae = 0.0
+        out = [0.0] * T
+        for t in range(T - 1, -1, -1):
+            gae = d[t] + c[t] * gae
+            out[t] = gae
+        adv[:] = out
+    else:
+        gae = np.zeros(deltas.shape[1:], dtype=np.float32)
+        for t in range(T - 1, -1, -1):
+            np.multiply(coef[t], gae, out=gae)
+            gae += deltas[t]
+            adv[t] = gae
+    return adv, adv + v[:-1]
 # =========================
-# Replay Buffer
+# Rollout Buffer
 # =========================
-@dataclass
-class ReplayMemory:
-    """简洁版 PPO 记忆模块：按 step 追加，按需整体取样/清空。
-    存储字段：
-      - states:   [T, obs_dim]            观测
-      - actions:  [T, act_dim]            动作（连续向量）
-      - logprobs: [T]                     旧策略下的 log π(a|s)
-      - values:   [T]                     旧价值 v(s)
-      - rewards:  [T]                     单步奖励 r_t
-      - dones:    [T]                     终止标记（True/False）
+class RolloutBuffer:
+    """预分配的 PPO 轨迹缓冲：所有字段都是固定容量的连续张量，靠写指针 ptr 追加。
+    存储字段（num_envs=None 时没有 K 这一维）：
+      - states:   [T, (K,) obs_dim]       观测
+      - actions:  [T, (K,) act_dim]       动作（连续向量）
+      - logprobs: [T, (K,)]               旧策略下的 log π(a|s)
+      - values:   [T, (K,)]               旧价值 v(s)
+      - rewards:  [T, (K,)]               单步奖励 r_t
+      - dones:    [T, (K,)]               终止标记（1.0/0.0）
+      - masks:    [T, (K,) act_dim]       动作维的有效位（变长请求集；未给 mask 时为全 1，has_mask=False）
+      - truncs / trunc_values: [T, (K,)]  步数上限截断标记与截断前观测的价值（见 compute_gae；未给时 has_trunc=False）
+      - last_states: [(K,) obs_dim]       最后一步转移之后的观测 s_T（bootstrap 用；未给 last_obs 时 has_last=False）
+    add_memo 只做原地拷贝，不分配新张量；sample 返回 [:ptr] 视图（零拷贝）；clear_memo 只重置指针。
     """
 
-    states:   List[torch.Tensor]
-    actions:  List[torch.Tensor]
-    logprobs: List[torch.Tensor]
-    values:   List[torch.Tensor]
-    rewards:  List[torch.Tensor]
-    dones:    List[torch.Tensor]
+    def __init__(self, capacity: int, obs_dim: int, act_dim: int, num_envs: Optional[int] = None, device="cpu"):
+        self.capacity = int(capacity)
+        self.num_envs = num_envs
+        lead = (self.capacity,) if num_envs is None else (self.capacity, int(num_envs))
+        self.states   = torch.zeros(lead + (obs_dim,), dtype=torch.float32, device=device)
+        self.actions  = torch.zeros(lead + (act_dim,), dtype=torch.float32, device=device)
+        self.logprobs = torch.zeros(lead, dtype=torch.float32, device=device)
+        self.values   = torch.zeros(lead, dtype=torch.float32, device=device)
+        self.rewards  = torch.zeros(lead, dtype=torch.float32, device=device)
+        self.dones    = torch.zeros(lead, dtype=torch.float32, device=device)
+        self.masks    = torch.ones(lead + (act_dim,), dtype=torch.float32, device=device)
+        self.has_mask = False
+        self.truncs       = torch.zeros(lead, dtype=torch.float32, device=device)
+        self.trunc_values = torch.zeros(lead, dtype=torch.float32, device=device)
+        self.has_trunc = False
+        self.last_states = torch.zeros(lead[1:] + (obs_dim,), dtype=torch.float32, device=device)
+        self.has_last = False
+        self.ptr = 0
 
-    def add_memo(
-        self,
-        state: torch.Tensor,
-        action: torch.Tensor,
-        logprob: torch.Tensor,
-        value: torch.Tensor,
-        reward: float,
-        done: bool
-    ):
-        """写入一步的轨迹样本"""
-        self.states.append(state.detach())
-        self.actions.append(action.detach())
-        self.logprobs.append(logprob.detach())
-        self.values.append(value.detach())
-        self.rewards.append(torch.as_tensor(reward, dtype=torch.float32))
-        self.dones.append(torch.as_tensor(done, dtype=torch.float32))
+    def __len__(self):
+        return self.ptr
+
+    def _put_states(self, idx, states):
+        self._put(self.states[idx], states)
+
+    def _put_masks(self, idx, masks):
+        if masks is None:
+            self.masks[idx] = 1.0
+        else:
+            self._put(self.masks[idx], masks)
+            self.has_mask = True
+
+    def _put_truncs(self, idx, truncs, trunc_values):
+        if truncs is None:
+            self.truncs[idx] = 0.0
+        else:
+            self._put(self.truncs[idx], truncs)
+            self._put(self.trunc_values[idx], trunc_values)
+            self.has_trunc = True
+
+    def _put_last(self, last_obs):
+        self.has_last = last_obs is not None
+        if self.has_last:
+            self._put(self.last_states, last_obs)
+
+    @staticmethod
+    def _put(dst: torch.Tensor, x):
+        """把 x（tensor / np.ndarray / 标量）原地写入 dst"""
+        if isinstance(x, torch.Tensor):
+            dst.copy_(x.detach())
+        elif isinstance(x, np.ndarray):
+            dst.copy_(torch.from_numpy(x))
+        else:
+            dst.fill_(float(x))
+
+    def add_memo(self, state, action, logprob, value, reward, done, mask=None, last_obs=None):
+        """写入一步的轨迹样本（单环境为标量/向量，多环境为首维 K 的数组）；mask 为动作维有效位，
+        last_obs 为这一步之后的观测（即 next_state，供 update() 计算 bootstrap 值 v(s_T)）"""
+        if self.ptr >= self.capacity:
+            raise RuntimeError(f"RolloutBuffer 已满（capacity={self.capacity}），请先 update() 再 clear_memo()")
+        i = self.ptr
+        self._put_states(i, state)
+        self._put(self.actions[i], action)
+        self._put(self.logprobs[i], logprob)
+        self._put(self.values[i], value)
+        self._put(self.rewards[i], reward)
+        self._put(self.dones[i], done)
+        self._put_masks(i, mask)
+        self._put_last(last_obs)
+        self.ptr += 1
+
+    def add_rollout(self, states, actions, logprobs, values, rewards, dones, masks=None, last_obs=None,
+                    truncs=None, trunc_values=None):
+        """一次写入 T 步（首维为时间，例如并行 worker 收集的 [T, K, ...] 数组）；last_obs 为第 T 步之后的观测，
+        truncs / trunc_values 为回合中途按步数上限截断的位置及截断前观测的价值（见 compute_gae）"""
+        T = len(rewards)
+        if self.ptr + T > self.capacity:
+            raise RuntimeError(f"RolloutBuffer 已满（capacity={self.capacity}），请先 update() 再 clear_memo()")
+        sl = slice(self.ptr, self.ptr + T)
+        self._put_states(sl, states)
+        self._put(self.actions[sl], actions)
+        self._put(self.logprobs[sl], logprobs)
+        self._put(self.values[sl], values)
+        self._put(self.rewards[sl], rewards)
+        self._put(self.dones[sl], dones)
+        self._put_masks(sl, masks)
+        self._put_truncs(sl, truncs, trunc_values)
+        self._put_last(last_obs)
+        self.ptr += T
 
     def sample(self) -> Tuple[torch.Tensor, ...]:
-        """一次性打包为张量（PPO 通常按全批次/mini-batch 迭代）"""
-        states   = torch.stack(self.states,   dim=0)
-        actions  = torch.stack(self.actions,  dim=0)
-        logprobs = torch.stack(self.logprobs, dim=0)
-        values   = torch.stack(self.values,   dim=0)
-        rewards  = torch.stack(self.rewards,  dim=0)
-        dones    = torch.stack(self.dones,    dim=0)
+        """返回已写入部分 [:ptr] 的视图（不拷贝）"""
+        n = self.ptr
+        return (self.states[:n], self.actions[:n], self.logprobs[:n],
+                self.values[:n], self.rewards[:n], self.dones[:n])
+
+    def sample_masks(self) -> Optional[torch.Tensor]:
+        """[:ptr] 的动作有效位视图；本轮没写过 mask 时返回 None"""
+        return self.masks[:self.ptr] if self.has_mask else None
+
+    def sample_truncs(self) -> Optional[Tuple[torch.Tensor, torch.Tensor]]:
+        """[:ptr] 的 (truncs, trunc_values) 视图；本轮没写过截断信息时返回 None"""
+        return (self.truncs[:self.ptr], self.trunc_values[:self.ptr]) if self.has_trunc else None
+
+    def sample_last(self) -> Optional[torch.Tensor]:
+        """最后一步之后的观测 [1, (K,) obs_dim]（与 states 同布局）；没给过 last_obs 时返回 None"""
+        return self.last_states.unsqueeze(0) if self.has_last else None
+
+    def clear_memo(self):
+        """重置写指针，开始新一轮收集（存储复用）"""
+        self.ptr = 0
+        self.has_mask = False
+        self.has_trunc = False
+        self.has_last = False
+
+
+class GraphRolloutBuffer(RolloutBuffer):
+    """状态为图（见 graph_encoder）的轨迹缓冲：其余字段同 RolloutBuffer，
+    状态按步存成 Python 列表（每步 1 张或 K 张图），sample() 时打包成 CSR 的 GraphSet（时间主序）。
+    """
+
+    def __init__(self, capacity: int, act_dim: int, num_envs: Optional[int] = None, device="cpu"):
+        super().__init__(capacity, 0, act_dim, num_envs=num_envs, device=device)
+        self.graphs = [None] * self.capacity
+        self.last_graphs = None
+
+    def _put_states(self, idx, states):
+        if isinstance(idx, slice):
+            self.graphs[idx] = list(states)
+        else:
+            self.graphs[idx] = states
+
+    def _put_last(self, last_obs):
+        self.has_last = last_obs is not None
+        self.last_graphs = last_obs
+
+    def sample(self):
+        _, actions, logprobs, values, rewards, dones = super().sample()
+        steps = self.graphs[:self.ptr]
+        if self.num_envs is None:
+            states = GraphSet.from_graphs(steps)
+        else:
+            states = GraphSet.from_graphs([g for step in steps for g in step], num_envs=self.num_envs)
         return states, actions, logprobs, values, rewards, dones
 
+    def sample_last(self) -> Optional[GraphSet]:
+        if not self.has_last:
+            return None
+        if self.num_envs is None:
+            return GraphSet.from_graphs([self.last_graphs])
+        return GraphSet.from_graphs(list(self.last_graphs), num_envs=self.num_envs)
+
     def clear_memo(self):
-        """清空缓存，开始新一轮收集"""
-        self.states.clear()
-        self.actions.clear()
-        self.logprobs.clear()
-        self.values.clear()
-        self.rewards.clear()
-        self.dones.clear()
+        super().clear_memo()
+        self.graphs = [None] * self.capacity
+        self.last_graphs = None
 
 
 # =========================
@@ -78,9 +246,12 @@ class ReplayMemory:
 class PPOAgent(nn.Module):
     """不拆分 AC 的 PPO 实现：内部自带策略/价值网络。
     - forward(s) -> mu, std, v
-    - get_action(s) -> action(np), value(float), logprob(tensor)
-    - update(memory) -> 进行若干 epoch 的mini-batch PPO优化
-    - 属性 replay_buffer: ReplayMemory
+    - act(S, deterministic=False) -> actions(np [B]), values(np [B]), logprobs(tensor [B])；批量、inference_mode
+    - get_action(s) -> action(np), value(float), logprob(tensor)（单条/批量，内部走 act）
+    - update() -> 进行若干 epoch 的mini-batch PPO优化（可按 target_kl 提前停止）
+    - mask（可选，[B, act_dim]）：变长请求集的有效位，填充位不计入 log π / 熵 / 损失，动作置 0
+    - encoder（可选，如 graph_encoder.GraphEncoder）：状态改为图，策略/价值各用一份编码器，obs_dim 取 encoder.out_dim
+    - 属性 replay_buffer: RolloutBuffer
     """
 
     def __init__(
@@ -99,12 +270,21 @@ class PPOAgent(nn.Module):
         vf_coef: float = 0.5,
         update_epochs: int = 10,
         minibatch_size: int = 64,
+        target_kl: Optional[float] = None,   # 近似 KL 超过该值即提前结束本次 update（None 不限制）
         # 其它
         init_log_std: float = -0.5,
-        max_grad_norm: Optional[float] = 0.5
+        max_grad_norm: Optional[float] = 0.5,
+        buffer_size: int = 2048,
+        num_envs: Optional[int] = None,
+        encoder: Optional[nn.Module] = None
     ):
         super().__init__()
         self.device = torch.device(device)
+        # 图编码器：与 pi/vf 分开优化的结构保持一致，价值侧用一份独立拷贝
+        self.pi_encoder = encoder
+        self.vf_encoder = copy.deepcopy(encoder) if encoder is not None else None
+        if encoder is not None:
+            obs_dim = encoder.out_dim
         self.obs_dim = obs_dim
         self.act_dim = act_dim
         # 策略网络（高斯策略，连续动作）
@@ -123,11 +303,13 @@ class PPOAgent(nn.Module):
         )
 
         # 优化器
-        self.pi_opt = torch.optim.Adam(
-            list(self.pi_body.parameters()) + list(self.mu_head.parameters()) + [self.log_std],
-            lr=pi_lr
-        ) # 策略优化器
-        self.vf_opt = torch.optim.Adam(self.vf.parameters(), lr=vf_lr) # 价值优化器
+        self._pi_params = list(self.pi_body.parameters()) + list(self.mu_head.parameters()) + [self.log_std]
+        self._vf_params = list(self.vf.parameters())
+        if encoder is not None:
+            self._pi_params += list(self.pi_encoder.parameters())
+            self._vf_params += list(self.vf_encoder.parameters())
+        self.pi_opt = torch.optim.Adam(self._pi_params, lr=pi_lr) # 策略优化器
+        self.vf_opt = torch.optim.Adam(self._vf_params, lr=vf_lr) # 价值优化器
 
         # PPO/GAE 超参
         self.gamma = gamma
@@ -137,84 +319,132 @@ class PPOAgent(nn.Module):
         self.vf_coef = vf_coef
         self.update_epochs = update_epochs
         self.minibatch_size = minibatch_size
+        self.target_kl = target_kl
         self.max_grad_norm = max_grad_norm
         # 记忆
-        self.replay_buffer = ReplayMemory(
-            states=[], actions=[], logprobs=[], values=[], rewards=[], dones=[]
-        ) # {s,a,策略,估计的价值,r,done}
+        if encoder is None:
+            self.replay_buffer = RolloutBuffer(
+                buffer_size, obs_dim, act_dim, num_envs=num_envs
+            ) # {s,a,策略,估计的价值,r,done}，容量需 >= 两次 update 之间的步数
+        else:
+            self.replay_buffer = GraphRolloutBuffer(buffer_size, act_dim, num_envs=num_envs)
         self.to(self.device)
 
     # ---------- 前向传播 ----------
-    def forward(self, states: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    def _inputs(self, states):
+        """(策略输入, 价值输入)：扁平观测原样转张量；有编码器时把图编码成 [B, obs_dim]"""
+        if self.pi_encoder is None:
+            s = torch.as_tensor(states, dtype=torch.float32, device=self.device)
+            return s, s
+        g = as_graph_batch(states, self.device)
+        return self.pi_encoder(g), self.vf_encoder(g)
+
+    def forward(self, states) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
         """返回 (mu, std, v)：策略的均值和标准差、以及价值"""
-        h = self.pi_body(states) # 状态输入策略网络
+        s_pi, s_vf = self._inputs(states)
+        h = self.pi_body(s_pi) # 状态输入策略网络
         mu = self.mu_head(h)     # 均值（动作期望），注意mu是否做约束tanh / clip
         std = torch.exp(self.log_std).clamp(1e-6, 1e3) # 标准差
-        v = self.vf(states).squeeze(-1) # 状态输入价值网络
+        v = self.vf(s_vf).squeeze(-1) # 状态输入价值网络
         return mu, std, v # 返回动作分布参数（均值 mu、标准差 std）和状态价值 v
 
     # ---------- logprob（带 tanh+0.5 缩放校正） ----------
-    def _logprob_squashed(self, mu: torch.Tensor, std: torch.Tensor, action_01: torch.Tensor) -> torch.Tensor:
+    def _logprob_squashed(self, mu: torch.Tensor, std: torch.Tensor, action_01: torch.Tensor,
+                          mask: Optional[torch.Tensor] = None) -> torch.Tensor:
         """
         给定策略参数(mu,std)与 [0,1] 动作，计算 log π(a)。
         a = (tanh(z)+1)/2,  z ~ N(mu,std)
         log π(a) = log N(z | mu,std) + Σ [ log(0.5) + log(1 - tanh(z)^2) ]
         其中 z = atanh(2a-1)
         不知道干嘛，一会儿看下
+        mask 给出时只对有效维求和（填充维的概率不计入）
         """
         a = action_01.clamp(1e-6, 1 - 1e-6)
         y = 2.0 * a - 1.0  # [-1,1]
         z = atanh(y)  # 反变换
         base = torch.distributions.Normal(mu, std)
-        log_base = base.log_prob(z).sum(-1)  # Σ log N(z)
+        log_base = base.log_prob(z)  # log N(z)
         # tanh 的雅可比： log(1 - tanh(z)^2)
-        log_j_tanh = torch.log1p(-y.pow(2) + 1e-12).sum(-1)  # Σ log(1 - y^2)
-        # 仿射缩放 0.5 的雅可比： Σ log(0.5) = -act_dim*log(2)
-        log_j_aff = -self.act_dim * LOG2
-        return log_base + log_j_tanh + log_j_aff
+        log_j_tanh = torch.log1p(-y.pow(2) + 1e-12)  # log(1 - y^2)
+        if mask is None:
+            # 仿射缩放 0.5 的雅可比： Σ log(0.5) = -act_dim*log(2)
+            return log_base.sum(-1) + log_j_tanh.sum(-1) - self.act_dim * LOG2
+        return ((log_base + log_j_tanh) * mask).sum(-1) - mask.sum(-1) * LOG2
 
     # ---------- 动作采样 ----------
-    @torch.no_grad()
-    def get_action(self, state: np.ndarray) -> Tuple[np.ndarray, float, torch.Tensor]:
-        """给单个或一批 state，返回 (action(np), value(float), logprob(tensor))。
-        - action: 连续动作（可为 w 分配向量），建议在 env 内部进行非负/预算投影；
-        - value: 价值标量（若为 batch 则返回 float(v[0])）；
-        - logprob: 用于 PPO 更新的策略（不要转 np）。
+    @torch.inference_mode()
+    def act(self, states, deterministic: bool = False, mask=None):
+        """批量行动：states [B, obs_dim]（np 或 tensor；有编码器时为图列表 / GraphBatch）。
+        - 采样模式：返回 (actions np [B, act_dim], values np [B], logprobs tensor [B])；
+          log π 直接由采样的 z 计算（不再 clamp + atanh 反推），雅可比项与 _logprob_squashed 相同
+        - deterministic=True：a = (tanh(mu)+1)/2，不跑价值网络、不采样，返回 (actions, None, None)，供部署用
+        - mask [B, act_dim]：填充维动作置 0，且不计入 log π
         """
-        s = torch.as_tensor(state, dtype=torch.float32, device=self.device)
-        if s.ndim == 1:
-            s = s.unsqueeze(0)   # [1, obs_dim]
+        if self.pi_encoder is None:
+            s = s_vf = torch.as_tensor(states, dtype=torch.float32, device=self.device)
+        else:
+            g = as_graph_batch(states, self.device)
+            s = self.pi_encoder(g)
+            s_vf = None if deterministic else self.vf_encoder(g)
+        mu = self.mu_head(self.pi_body(s))
+        m = None if mask is None else torch.as_tensor(mask, dtype=torch.float32, device=self.device)
+        if deterministic:
+            a = 0.5 * (torch.tanh(mu) + 1.0)
+            return (a if m is None else a * m).cpu().numpy(), None, None
 
-        mu, std, v = self.forward(s)
-        base = torch.distributions.Normal(mu, std)
-        z = base.rsample()  # 重参数化
-        y = torch.tanh(z)  # [-1,1]
-        a = 0.5 * (y + 1.0)  # [0,1]
-        logp = self._logprob_squashed(mu, std, a)
+        std = torch.exp(self.log_std).clamp(1e-6, 1e3)
+        z = mu + std * torch.randn_like(mu)      # 重参数化采样
+        a = 0.5 * (torch.tanh(z) + 1.0)          # [0,1]
+
+        # 与 update() 里重算的 logp 对齐：饱和区按 _logprob_squashed 的动作夹取边界夹 z
+        zc = z.clamp(-Z_CLAMP, Z_CLAMP)
+        yc = torch.tanh(zc)
+        log_base = -0.5 * ((zc - mu) / std).pow(2) - torch.log(std) - LOG_SQRT_2PI
+        log_j_tanh = torch.log1p(-yc.pow(2) + 1e-12)
+        if m is None:
+            logp = log_base.sum(-1) + log_j_tanh.sum(-1) - self.act_dim * LOG2
+        else:
+            logp = ((log_base + log_j_tanh) * m).sum(-1) - m.sum(-1) * LOG2
+            a = a * m
 
-        a_np = a.squeeze(0).cpu().numpy() if a.shape[0] == 1 else a.cpu().numpy()
-        v_scalar = v.squeeze(0).item() if v.shape[0] == 1 else v[0].item()
-        return a_np, v_scalar, logp.squeeze(0) if logp.shape[0] == 1 else logp
+        v = self.vf(s_vf).squeeze(-1)
+        return a.cpu().numpy(), v.cpu().numpy(), logp
+
+    def get_action(self, state: np.ndarray, mask=None) -> Tuple[np.ndarray, float, torch.Tensor]:
+        """给单个或一批 state（及可选的动作有效位 mask），返回 (action(np), value, logprob(tensor))。
+        - action: 连续动作（可为 w 分配向量），建议在 env 内部进行非负/预算投影；
+        - value: 单个 state 返回 float；batch [B, obs_dim] 返回 np.ndarray [B]（逐行价值）；
+        - logprob: 用于 PPO 更新的策略（不要转 np）。
+        """
+        single = isinstance(state, dict) or (self.pi_encoder is None and np.ndim(state) == 1)
+        if single:
+            states = [state] if isinstance(state, dict) else np.asarray(state)[None]
+            a, v, logp = self.act(states, mask=None if mask is None else np.asarray(mask)[None])
+            return a[0], float(v[0]), logp[0]
+        return self.act(state, mask=mask)
 
     # ---------- GAE优势函数估计 ----------
     @staticmethod
-    def _compute_gae(rewards, values, dones, gamma=0.99, lam=0.95):
-        """rewards/values/dones 均为 [T] 张量；values 需包含 bootstrap 的 v_{T}（即 len= T+1）"""
-        T = rewards.shape[0]
-        adv = torch.zeros(T, dtype=torch.float32, device=rewards.device)
-        gae = 0.0
-        for t in reversed(range(T)):
-            mask = 1.0 - float(dones[t])
-            delta = rewards[t] + gamma * values[t + 1] * mask - values[t]
-            gae = delta + gamma * lam * mask * gae
-            adv[t] = gae
-        ret = adv + values[:-1]
-        return adv, ret
+    def _compute_gae(rewards, values, dones, gamma=0.99, lam=0.95, truncs=None):
+        """rewards/values/dones 均为 [T] 或 [T, K] 张量（K 为并行环境数）；
+        values 需包含 bootstrap 的 v_{T}（即 len= T+1）；truncs 为可选的 (truncs, trunc_values)。
+        实际计算见 compute_gae（NumPy 反向扫描）"""
+        if truncs is not None:
+            truncs = tuple(x.detach().cpu().numpy() for x in truncs)
+        adv, ret = compute_gae(
+            rewards.detach().cpu().numpy(), values.detach().cpu().numpy(), dones.detach().cpu().numpy(),
+            gamma, lam, *(truncs or ())
+        )
+        return torch.from_numpy(adv).to(rewards.device), torch.from_numpy(ret).to(rewards.device)
 
     # ---------- 更新 ----------
     def update(self):
-        """对当前 replay_buffer 做一次 PPO 更新（多 epoch + mini-batch）"""
+        """对当前 replay_buffer 做一次 PPO 更新（多 epoch + mini-batch）。
+        每个 minibatch 先算近似 KL 和裁剪比例，KL 超过 target_kl 时跳过该步并结束本次更新。
+        返回平均损失/KL/clipfrac，以及实际跑的 epochs（至少完成一个 minibatch 才计数）、minibatches 数和耗时 update_time（秒）。
+        """
         states, actions, logp_old, values, rewards, dones = self.replay_buffer.sample()
+        masks = self.replay_buffer.sample_masks()
         states   = states.to(self.device)
         actions  = actions.to(self.device)
         logp_old = logp_old.to(self.device)
@@ -222,23 +452,46 @@ class PPOAgent(nn.Module):
         rewards  = rewards.to(self.device)
         dones    = dones.to(self.device)
 
-        # 计算 bootstrap 值 v_T
+        # 计算 bootstrap 值 v(s_T)：s_T 为最后一步转移之后的观测；
+        # 调用方没给 last_obs 时只能退化为 v(s_{T-1})
+        last = self.replay_buffer.sample_last()
+        last = states if last is None else last.to(self.device)
         with torch.no_grad():
-            _, _, v_last = self.forward(states[-1:])
-        values_with_boot = torch.cat([values, v_last], dim=0)  # [T+1]
+            last = last.last_step() if isinstance(last, GraphSet) else last[-1:]
+            _, _, v_last = self.forward(last)
+        v_last = v_last.reshape(1, *values.shape[1:])
+        values_with_boot = torch.cat([values, v_last], dim=0)  # [T+1] 或 [T+1, K]
 
         # GAE / Return
-        adv, ret = self._compute_gae(rewards, values_with_boot, dones, self.gamma, self.lam)
+        adv, ret = self._compute_gae(rewards, values_with_boot, dones, self.gamma, self.lam,
+                                     self.replay_buffer.sample_truncs())
+
+        # 多环境 [T, K, ...] 展平为 [T*K, ...]（GraphSet 本来就按时间主序平铺）
+        if rewards.ndim == 2:
+            if not isinstance(states, GraphSet):
+                states = states.reshape(-1, self.obs_dim)
+            actions  = actions.reshape(-1, self.act_dim)
+            logp_old = logp_old.reshape(-1)
+            if masks is not None:
+                masks = masks.reshape(-1, self.act_dim)
+            adv      = adv.reshape(-1)
+            ret      = ret.reshape(-1)
         adv = (adv - adv.mean()) / (adv.std() + 1e-8)
 
-        # 打乱索引
-        N = states.shape[0]
-        idx = torch.randperm(N, device=self.device)
-        # 刚加
+        N = adv.shape[0]
         pi_losses = []
         vf_losses = []
         entropies = []
+        kls = []
+        clipfracs = []
+        epochs_run = 0
+        minibatches_run = 0
+        early_stop = False
+        t0 = time.perf_counter()
         for _ in range(self.update_epochs):
+            mb_before = minibatches_run
+            # 每个 epoch 重新打乱索引
+            idx = torch.randperm(N, device=self.device)
             for start in range(0, N, self.minibatch_size):
                 j = idx[start:start + self.minibatch_size]
                 s_b = states[j]
@@ -246,17 +499,31 @@ class PPOAgent(nn.Module):
                 lp_old_b = logp_old[j]
                 adv_b = adv[j]
                 ret_b = ret[j]
+                m_b = None if masks is None else masks[j].to(self.device)
 
                 mu, std, vpred = self.forward(s_b)
-                lp = self._logprob_squashed(mu, std, a_b)
+                lp = self._logprob_squashed(mu, std, a_b, m_b)
 
                 # PPO Clip 损失
-                ratio = torch.exp(lp - lp_old_b)
+                log_ratio = lp - lp_old_b
+                ratio = torch.exp(log_ratio)
+
+                # 近似 KL(old||new) 与裁剪比例；超过 target_kl 则在本步更新前停止
+                with torch.no_grad():
+                    approx_kl = ((ratio - 1.0) - log_ratio).mean().item()
+                    clipfrac = ((ratio - 1.0).abs() > self.clip_ratio).float().mean().item()
+                kls.append(approx_kl)
+                clipfracs.append(clipfrac)
+                if self.target_kl is not None and approx_kl > self.target_kl:
+                    early_stop = True
+                    break
+
                 surr1 = ratio * adv_b
                 surr2 = torch.clamp(ratio, 1.0 - self.clip_ratio, 1.0 + self.clip_ratio) * adv_b
                 # 熵：对 squashed 分布精确熵较复杂，这里使用 base 熵近似或直接 0
                 base = torch.distributions.Normal(mu, std)
-                approx_entropy = base.entropy().sum(-1)
+                ent = base.entropy()
+                approx_entropy = ent.sum(-1) if m_b is None else (ent * m_b).sum(-1)
 
                 pi_loss = -torch.min(surr1, surr2).mean() - self.ent_coef * approx_entropy.mean()
                 vf_loss = F.mse_loss(vpred, ret_b)
@@ -265,23 +532,34 @@ class PPOAgent(nn.Module):
                 self.pi_opt.zero_grad(set_to_none=True)
                 pi_loss.backward()
                 if self.max_grad_norm is not None:
-                    nn.utils.clip_grad_norm_(list(self.pi_body.parameters()) + list(self.mu_head.parameters()) + [self.log_std], self.max_grad_norm)
+                    nn.utils.clip_grad_norm_(self._pi_params, self.max_grad_norm)
                 self.pi_opt.step()
 
                 self.vf_opt.zero_grad(set_to_none=True)
                 (self.vf_coef * vf_loss).backward()
                 if self.max_grad_norm is not None:
-                    nn.utils.clip_grad_norm_(self.vf.parameters(), self.max_grad_norm)
+                    nn.utils.clip_grad_norm_(self._vf_params, self.max_grad_norm)
                 self.vf_opt.step()
-                # 刚加的
                 # 收集 batch 级指标
+                minibatches_run += 1
                 pi_losses.append(pi_loss.detach().item())
                 vf_losses.append(vf_loss.detach().item())
                 entropies.append(approx_entropy.detach().mean().item())
+            # 至少走了一步 minibatch 才算跑了这个 epoch（第一个 minibatch 就早停时不计）
+            if minibatches_run > mb_before:
+                epochs_run += 1
+            if early_stop:
+                break
 
-                # 返回 epoch 平均损失，方便打印/画图
-            return {
-                "pi_loss": float(np.mean(pi_losses)) if pi_losses else 0.0,
-                "vf_loss": float(np.mean(vf_losses)) if vf_losses else 0.0,
-                "entropy": float(np.mean(entropies)) if entropies else 0.0,
-            }
+        # 返回全部 epoch 的平均损失，方便打印/画图；一步都没更新（首个 minibatch 即早停）时损失为 nan
+        return {
+            "pi_loss": float(np.mean(pi_losses)) if pi_losses else float("nan"),
+            "vf_loss": float(np.mean(vf_losses)) if vf_losses else float("nan"),
+            "entropy": float(np.mean(entropies)) if entropies else float("nan"),
+            "approx_kl": float(np.mean(kls)) if kls else 0.0,
+            "clipfrac": float(np.mean(clipfracs)) if clipfracs else 0.0,
+            "epochs": epochs_run,
+            "minibatches": minibatches_run,
+            "early_stop": early_stop,
+            "update_time": time.perf_counter() - t0,
+        }
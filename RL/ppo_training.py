@@ -19,56 +19,114 @@
                            - "util":       预算利用率
                            - ... 任何你想记录的指标
         - 累计 episode_reward += reward
-        - 写入记忆 agent.replay_buffer.add_memo(state, action, logprob, value, reward, done)
+        - 写入记忆 agent.replay_buffer.add_memo(state, action, logprob, value, reward, done, last_obs=next_state)
         - state = next_state
         - 判断是否该触发一次 agent.update()（例如回合结束、或累计步数达到 update_every）
     - 打印/日志/保存
     - REWARD_BUFFER 记录最近 K 个回合的累计奖励做移动平均
 """
 
+import ast
+import functools
 import os
+import time
 from collections import deque
-from typing import Optional
+from dataclasses import asdict, dataclass, fields, replace
+from typing import Callable, Dict, Optional
 
 import numpy as np
 import torch
-import matplotlib.pyplot as plt
 
 from ppo_agent import PPOAgent
-from toy_env import ToyAllocEnv
+from toy_env import ToyAllocEnv, VecToyAllocEnv
+from qnet_env import QNetEnv, VecQNetEnv
+from scenario_bank import ScenarioBank
+from parallel_rollout import ParallelRollout
+from traj_store import TrajectoryStore
+from metrics import MetricsLogger, PhaseTimer
+from checkpoint import (CheckpointWriter, capture_rng_state, checkpoint_path, latest_checkpoint,
+                        load_training_state, restore_rng_state, snapshot)
 
 # ========== 你的环境 ==========
-# 假设你已经在工程中有一个符合 OpenAI Gym-like 接口的环境：
+# 环境需符合 OpenAI Gym-like 接口（可直接传给 main(env=...)）：
 #   - reset() -> state(np.ndarray)
 #   - step(action: np.ndarray) -> (next_state(np.ndarray), reward(float), done(bool), info(dict))
-# 这里放一个占位导入（你用自己的替换掉即可）
-# from your_project.envs import YourEnv
-YourEnv = None  # 请替换成你自己的环境类
-
-# ========== 全局超参 ==========
-SEED               = 42
-DEVICE             = "cuda" if torch.cuda.is_available() else "cpu"
-
-MAX_EPISODES       = 500
-MAX_STEPS_PER_EP   = 256          # 每个 episode 最多步数（例如时隙数上限）
-UPDATE_EVERY       = 256          # 收集多少步触发一次 PPO 更新（一般与 MAX_STEPS_PER_EP 一致也可）
-PRINT_FREQ         = 10           # 打印频率（按 episode）
-SAVE_FREQ          = 100          # 保存频率（按 episode）
-REWARD_BUFFER_SIZE = 100          # 最近回合奖励的滑动窗口
-
-# PPO 超参（传给 Agent）
-GAMMA        = 0.99
-LAMBDA_GAE   = 0.95
-CLIP_RATIO   = 0.2
-PI_LR        = 3e-4
-VF_LR        = 1e-3
-ENT_COEF     = 0.0
-VF_COEF      = 0.5
-UPDATE_EPOCHS= 10
-MINIBATCH    = 64
-HIDDEN_SIZE  = 128
-INIT_LOG_STD = 0.0
-MAX_GRAD_NORM= 0.5
+#   - action_dim 属性；变长请求集另有 mask 属性
+
+# ========== 训练配置 ==========
+@dataclass
+class TrainConfig:
+    """全部训练超参。可 pickle，随采样进程 / 超参搜索的进程一起传过去（不依赖模块级全局变量）。"""
+    seed: int               = 42
+    device: str             = "cuda" if torch.cuda.is_available() else "cpu"
+
+    max_episodes: int       = 500
+    max_steps_per_ep: int   = 256            # 每个 episode 最多步数（例如时隙数上限）
+    update_every: int       = 256            # 收集多少步触发一次 PPO 更新（一般与 max_steps_per_ep 一致也可）
+    print_freq: int         = 10             # 打印频率（按 episode）
+    save_freq: int          = 100            # 保存频率（按 episode）
+    keep_checkpoints: int   = 3              # save_dir 里只保留最近几个 ppo_ep*.pt
+    reward_buffer_size: int = 100            # 最近回合奖励的滑动窗口
+    num_envs: int           = 8              # 并行环境数 K（>1 时走 main_vec：一次前向收集 K 条转移）
+    vec_rollout_steps: int  = 64             # main_vec 中每次更新前每个环境收集的步数（共 K*vec_rollout_steps 条）
+    max_requests: Optional[int] = None       # 设为整数（如 15）则每个时隙的请求数在 [1, max_requests] 间变化，观测/动作按上限填充并带掩码
+    num_workers: int        = 0              # >0 时走 main_parallel：N 个采样进程，每个每轮采 vec_rollout_steps 步
+    traj_dir: Optional[str] = None           # 设为目录（如 "./traj"）则每次 update 前把轨迹追加到磁盘 TrajectoryStore
+    timing: bool            = True           # 各阶段计时（get_action / env_step / add_memo / update / plot）
+    metrics_log: Optional[str] = "metrics.jsonl"  # 相对 save_dir 的指标日志（每回合 / 每次 update 一行），None 关闭
+    headless: bool          = False          # True：不导入/不画图、不打印逐步信息；曲线事后用 plot_training.py 从日志画
+    scenario_dir: Optional[str] = None       # 设为 scenario_bank.py build 生成的目录，则 toy 环境按游标回放其中的容量轨迹
+    env_name: str           = "toy"          # "toy"：ToyAllocEnv；"qnet"：qnet_env 中按 mainRL.kt 时隙调度建模的量子网络环境
+    num_threads: Optional[int] = None        # torch.set_num_threads（多个训练进程同时跑时限制每个进程的线程数）
+
+    # PPO 超参（传给 Agent）
+    gamma: float            = 0.99
+    lam: float              = 0.95           # GAE lambda
+    clip_ratio: float       = 0.2
+    pi_lr: float            = 3e-4
+    vf_lr: float            = 1e-3
+    ent_coef: float         = 0.0
+    vf_coef: float          = 0.5
+    update_epochs: int      = 10
+    minibatch: int          = 64
+    target_kl: Optional[float] = 0.02        # 近似 KL 超过即提前结束本次 update（None 关闭）
+    hidden_size: int        = 128
+    init_log_std: float     = 0.0
+    max_grad_norm: float    = 0.5
+
+    def agent_kwargs(self) -> dict:
+        return dict(hidden_size=self.hidden_size, device=self.device, gamma=self.gamma, lam=self.lam,
+                    clip_ratio=self.clip_ratio, pi_lr=self.pi_lr, vf_lr=self.vf_lr, ent_coef=self.ent_coef,
+                    vf_coef=self.vf_coef, update_epochs=self.update_epochs, target_kl=self.target_kl,
+                    minibatch_size=self.minibatch, init_log_std=self.init_log_std,
+                    max_grad_norm=self.max_grad_norm)
+
+    def override(self, items) -> "TrainConfig":
+        """按 "key=value" 字符串（或 dict）覆盖字段；值按 Python 字面量解析，解析不了的当字符串"""
+        if not isinstance(items, dict):
+            items = dict(item.split("=", 1) for item in items)
+        names = {f.name for f in fields(self)}
+        changes = {}
+        for key, value in items.items():
+            if key not in names:
+                raise KeyError(f"unknown TrainConfig field {key!r}")
+            changes[key] = parse_value(value) if isinstance(value, str) else value
+        return replace(self, **changes)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def parse_value(text: str):
+    """命令行里的值：能按 Python 字面量解析（数字 / None / True / 列表）就解析，否则原样当字符串"""
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+
+
+# 进度回调：(完成的回合数, global_step, 最近回合平均回报) -> True 表示提前结束训练（超参搜索用）
+ProgressFn = Callable[[int, int, float], bool]
 
 # ========== 随机数固定 ==========
 def set_seed(seed: int):
@@ -77,22 +135,163 @@ def set_seed(seed: int):
     if torch.cuda.is_available():
         torch.cuda.manual_seed_all(seed)
 
+def _setup(cfg: TrainConfig, save_dir: str):
+    os.makedirs(save_dir, exist_ok=True)
+    if cfg.num_threads:
+        torch.set_num_threads(cfg.num_threads)
+    set_seed(cfg.seed)
+
+# ========== 环境构造（需可被 pickle，供采样进程使用：functools.partial(make_env, cfg=cfg)） ==========
+def _scenario_bank(cfg: TrainConfig) -> Optional[ScenarioBank]:
+    return ScenarioBank(cfg.scenario_dir) if cfg.scenario_dir else None
+
+def make_toy_env(seed: int, cfg: Optional[TrainConfig] = None) -> ToyAllocEnv:
+    cfg = cfg or TrainConfig()
+    return ToyAllocEnv(n_requests=8, cap_max=5, horizon=64, seed=seed, unfair_lambda=0.2, ar_rho=0.9,
+                       max_requests=cfg.max_requests, scenarios=_scenario_bank(cfg))
+
+def make_env(seed: int, cfg: Optional[TrainConfig] = None):
+    cfg = cfg or TrainConfig()
+    return QNetEnv(seed=seed) if cfg.env_name == "qnet" else make_toy_env(seed, cfg)
+
+def make_vec_env(num_envs: int, seed: int, cfg: Optional[TrainConfig] = None):
+    cfg = cfg or TrainConfig()
+    if cfg.env_name == "qnet":
+        return VecQNetEnv(num_envs=num_envs, seed=seed)
+    return VecToyAllocEnv(num_envs=num_envs, n_requests=8, cap_max=5, horizon=64, seed=seed,
+                          unfair_lambda=0.2, ar_rho=0.9, max_requests=cfg.max_requests,
+                          scenarios=_scenario_bank(cfg))
+
+def _make_agent(cfg: TrainConfig, obs_dim: int, act_dim: int, buffer_size: int,
+                num_envs: Optional[int] = None) -> PPOAgent:
+    return PPOAgent(obs_dim=obs_dim, act_dim=act_dim, buffer_size=buffer_size, num_envs=num_envs,
+                    **cfg.agent_kwargs())
+
+def _open_traj_store(cfg: TrainConfig, obs_dim: int, act_dim: int) -> Optional[TrajectoryStore]:
+    return TrajectoryStore(cfg.traj_dir, obs_dim=obs_dim, act_dim=act_dim) if cfg.traj_dir else None
+
+def _open_metrics(cfg: TrainConfig, save_dir: str, ckpt: Optional[dict] = None):
+    timer = PhaseTimer(enabled=cfg.timing)
+    mlog = MetricsLogger(os.path.join(save_dir, cfg.metrics_log) if cfg.metrics_log else None)
+    if ckpt is None:
+        mlog.log("run_start", time=time.time(), seed=cfg.seed, config=cfg.to_dict())
+    else:
+        # 续训：同一次运行接着写；plot_training.py 会丢掉断点之后、被重跑的那部分记录
+        mlog.log("resume", time=time.time(), episode=ckpt["episode"], update=ckpt["n_update"])
+    return timer, mlog
+
+def _fmt_info(info: dict) -> str:
+    """把 env.step 返回的 info 格式化成一行（只打印 info 里实际有的键，各环境字段不同）"""
+    return " ".join(f"{k}={np.round(v, 3) if isinstance(v, (float, np.floating, np.ndarray)) else v}"
+                    for k, v in info.items())
+
+def _log_update(mlog: MetricsLogger, timer: PhaseTimer, metrics: dict, n_update: int, global_step: int):
+    """每次 update 后写一行：损失/KL 等指标 + 本周期各阶段耗时（秒）"""
+    mlog.log("update", update=n_update, global_step=global_step, **metrics, phases=timer.reset_window())
+
+def _close_metrics(mlog: MetricsLogger, timer: PhaseTimer):
+    total = dict(timer.total)
+    mlog.log("phase_total", **total)
+    mlog.close()
+    if timer.enabled and total:
+        print("Phase time (s): " + "  ".join(f"{k}={v:.2f}" for k, v in sorted(total.items(), key=lambda kv: -kv[1])))
+
+def _save_checkpoint(writer: CheckpointWriter, agent: PPOAgent, save_dir: str, mode: str,
+                     cfg: TrainConfig, obs_dim: int, act_dim: int, progress: dict):
+    """在训练线程上取快照（只做内存拷贝），torch.save 交给 writer 的后台线程。
+    progress 至少含 episode / global_step / n_update / reward_buffer / curves，以及各训练循环自己的环境状态。
+    """
+    state = snapshot({
+        "model": agent.state_dict(),
+        "config": {
+            "obs_dim": obs_dim,
+            "act_dim": act_dim,
+            "hidden_size": cfg.hidden_size,
+        },
+        "train_config": cfg.to_dict(),
+        "mode": mode,
+        "pi_opt": agent.pi_opt.state_dict(),
+        "vf_opt": agent.vf_opt.state_dict(),
+        "rng": capture_rng_state(),
+        **progress,
+    })
+    writer.save(state, checkpoint_path(save_dir, progress["episode"]))
+
+def _progress(episode_i, global_step, n_update, reward_buffer, ep_rewards, pi_losses_curve, vf_losses_curve, **extra):
+    return {
+        "episode": episode_i,
+        "global_step": global_step,
+        "n_update": n_update,
+        "reward_buffer": list(reward_buffer),
+        "curves": {"ep_rewards": ep_rewards, "pi_loss": pi_losses_curve, "vf_loss": vf_losses_curve},
+        **extra,
+    }
+
+def _load_resume(path: str, agent: PPOAgent, mode: str) -> dict:
+    """读回可续训的 ckpt 并恢复模型 / 优化器；RNG 由调用方在构造完所有对象之后再恢复"""
+    ckpt = load_training_state(path)
+    if "pi_opt" not in ckpt:
+        raise ValueError(f"{path} has no optimizer/RNG state and cannot be resumed")
+    if ckpt.get("mode") != mode:
+        raise ValueError(f"{path} was written by the '{ckpt.get('mode')}' loop, not '{mode}'")
+    agent.load_state_dict(ckpt["model"])
+    agent.pi_opt.load_state_dict(ckpt["pi_opt"])
+    agent.vf_opt.load_state_dict(ckpt["vf_opt"])
+    print(f"Resumed from {path} (episode {ckpt['episode']}, global_step {ckpt['global_step']})")
+    return ckpt
+
+def _resumed_counters(cfg: TrainConfig, ckpt: Optional[dict]):
+    """(episode_i, global_step, n_update, reward_buffer, ep_rewards, pi_losses_curve, vf_losses_curve)"""
+    if ckpt is None:
+        return 0, 0, 0, deque(maxlen=cfg.reward_buffer_size), [], [], []
+    c = ckpt["curves"]
+    return (ckpt["episode"], ckpt["global_step"], ckpt["n_update"],
+            deque(ckpt["reward_buffer"], maxlen=cfg.reward_buffer_size),
+            list(c["ep_rewards"]), list(c["pi_loss"]), list(c["vf_loss"]))
+
+def _avg(reward_buffer) -> float:
+    return float(np.mean(reward_buffer)) if len(reward_buffer) else float("nan")
+
+def _finish(agent, writer, mlog, timer, cfg, save_dir, export_policy_path, episode_i, global_step, n_update,
+            reward_buffer, ep_rewards, pi_losses_curve, vf_losses_curve, stopped) -> Dict[str, object]:
+    """三个训练循环共用的收尾：等 checkpoint 落盘、导出、画图、关日志，返回训练摘要"""
+    writer.close()
+
+    # 可选：导出策略参数或别的产物（比如均值向量/脚本化模型）
+    if export_policy_path:
+        torch.save(agent.state_dict(), export_policy_path)
+        print(f"Exported policy to {export_policy_path}")
+
+    if not cfg.headless:
+        with timer.phase("plot"):
+            _plot_curves(ep_rewards, pi_losses_curve, vf_losses_curve, save_dir)
+    _close_metrics(mlog, timer)
+    return {
+        "episodes": episode_i,
+        "global_step": global_step,
+        "n_update": n_update,
+        "final_avg_reward": _avg(reward_buffer),
+        "ep_rewards": list(ep_rewards),
+        "pi_loss": list(pi_losses_curve),
+        "vf_loss": list(vf_losses_curve),
+        "stopped": bool(stopped),
+    }
+
 # ========== 主训练 ==========
 def main(
     env: Optional[object] = None,
     save_dir: str = "./ckpt",
-    export_policy_path: Optional[str] = None
+    export_policy_path: Optional[str] = None,
+    resume: Optional[str] = None,
+    cfg: Optional[TrainConfig] = None,
+    progress_fn: Optional[ProgressFn] = None,
 ):
-    os.makedirs(save_dir, exist_ok=True)
-    set_seed(SEED)
+    cfg = cfg or TrainConfig()
+    _setup(cfg, save_dir)
 
-    # 1) 准备环境
-    env = ToyAllocEnv(n_requests=8, cap_max=5, horizon=64, seed=42, unfair_lambda=0.2, ar_rho=0.9)
+    # 1) 准备环境（未传入时按 cfg 构造）
     if env is None:
-        if YourEnv is None:
-            raise RuntimeError("请把 `YourEnv` 替换为你的环境类或传入 `env` 实例！")
-        # env = YourEnv(seed=SEED)
-        # 刚加
+        env = make_env(cfg.seed, cfg)
 
     # 2) 读取初始观测 & 维度
     state = env.reset()
@@ -106,21 +305,22 @@ def main(
         raise RuntimeError("请从环境获得 action 维度，例如 env.action_dim 或手动指定。")
 
     # 3) 实例化 Agent
-    agent = PPOAgent(
-        obs_dim=obs_dim, act_dim=act_dim, hidden_size=HIDDEN_SIZE, device=DEVICE,
-        gamma=GAMMA, lam=LAMBDA_GAE, clip_ratio=CLIP_RATIO, pi_lr=PI_LR, vf_lr=VF_LR,
-        ent_coef=ENT_COEF, vf_coef=VF_COEF, update_epochs=UPDATE_EPOCHS,
-        minibatch_size=MINIBATCH, init_log_std=INIT_LOG_STD, max_grad_norm=MAX_GRAD_NORM
-    )
-
-    reward_buffer = deque(maxlen=REWARD_BUFFER_SIZE)
-    global_step = 0
-    # 刚加
-    ep_rewards = []  # 每回合总回报
-    pi_losses_curve = []  # 每次 update 的平均策略损失
-    vf_losses_curve = []  # 每次 update 的平均价值损失
-
-    for episode_i in range(1, MAX_EPISODES + 1):
+    agent = _make_agent(cfg, obs_dim, act_dim, buffer_size=cfg.update_every)
+
+    traj_store = _open_traj_store(cfg, obs_dim, act_dim)
+    writer = CheckpointWriter(save_dir, keep=cfg.keep_checkpoints)
+    ckpt = _load_resume(resume, agent, "main") if resume else None
+    timer, mlog = _open_metrics(cfg, save_dir, ckpt)
+    # ep_rewards: 每回合总回报；pi/vf_losses_curve: 每次 update 的平均策略/价值损失
+    (start_ep, global_step, n_update, reward_buffer,
+     ep_rewards, pi_losses_curve, vf_losses_curve) = _resumed_counters(cfg, ckpt)
+    if ckpt is not None:
+        # 回合边界上 buffer 为空、环境下一步就是 reset，恢复环境对象与全局 RNG 即可精确接续
+        vars(env).update(ckpt["env"])
+        restore_rng_state(ckpt["rng"])
+
+    episode_i, stopped = start_ep, False
+    for episode_i in range(start_ep + 1, cfg.max_episodes + 1):
         state = env.reset()
         episode_reward = 0.0
         steps_this_ep = 0
@@ -128,24 +328,29 @@ def main(
         # 4) 单回合小循环
         while True:
             # 4.1 策略给出动作和价值
-            action, value, logprob = agent.get_action(state)
+            mask = getattr(env, "mask", None)   # 变长请求集的有效位（定长环境为 None）
+            with timer.phase("get_action"):
+                action, value, logprob = agent.get_action(state, mask=mask)
             # 4.2 与环境交互（请保证 env.step 能接受你的 action 形式）
-            next_state, reward, done, info = env.step(action)
+            with timer.phase("env_step"):
+                next_state, reward, done, info = env.step(action)
 
             # 刚加
-            if steps_this_ep in (0, 1):  # 只打印回合前两步，避免刷屏
+            if not cfg.headless and steps_this_ep in (0, 1):  # 只打印回合前两步，避免刷屏
                 print(f"[Ep {episode_i:03d} Step {steps_this_ep:02d}] "
-                      f"caps={info['caps']} action~[0,1]={np.round(action, 3)} "
-                      f"alloc={info['alloc']} util={info['util']:.3f} unfair={info['unfair']:.3f} reward={reward:.3f}")
+                      f"action~[0,1]={np.round(action, 3)} reward={reward:.3f} {_fmt_info(info)}")
             # 4.3 写入记忆
-            agent.replay_buffer.add_memo(
-                state=torch.as_tensor(state, dtype=torch.float32),
-                action=torch.as_tensor(action, dtype=torch.float32),
-                logprob=logprob,            # 已是 tensor
-                value=torch.as_tensor(value, dtype=torch.float32),
-                reward=reward,
-                done=done,
-            )
+            with timer.phase("add_memo"):
+                agent.replay_buffer.add_memo(
+                    state=state,
+                    action=action,
+                    logprob=logprob,            # 已是 tensor
+                    value=value,
+                    reward=reward,
+                    done=done,
+                    mask=mask,
+                    last_obs=next_state,        # bootstrap 用的 s_T
+                )
 
             # 4.4 累计奖励/步数 & 状态更新
             episode_reward += float(reward)
@@ -154,80 +359,297 @@ def main(
             state = next_state
 
             # 4.5 触发更新
-            if done or (steps_this_ep % UPDATE_EVERY == 0) or (steps_this_ep >= MAX_STEPS_PER_EP):
+            if done or (steps_this_ep % cfg.update_every == 0) or (steps_this_ep >= cfg.max_steps_per_ep):
+                if traj_store is not None:
+                    with timer.phase("traj_store"):
+                        traj_store.append(*agent.replay_buffer.sample())
                 try:
                     # agent.update()刚加
-                    metrics = agent.update()
+                    with timer.phase("update"):
+                        metrics = agent.update()
                 finally:
                     agent.replay_buffer.clear_memo()
             #     刚加
                 pi_losses_curve.append(metrics["pi_loss"])
                 vf_losses_curve.append(metrics["vf_loss"])
+                n_update += 1
+                _log_update(mlog, timer, metrics, n_update, global_step)
 
             # 4.6 回合结束判定
-            if done or (steps_this_ep >= MAX_STEPS_PER_EP):
+            if done or (steps_this_ep >= cfg.max_steps_per_ep):
                 break
 
         # 5) 统计与保存
         ep_rewards.append(episode_reward)
         reward_buffer.append(episode_reward)
+        mlog.log("episode", episode=episode_i, reward=episode_reward, steps=steps_this_ep, global_step=global_step)
         avg_reward = np.mean(reward_buffer)
 
-        if (episode_i % PRINT_FREQ) == 0:
+        if (episode_i % cfg.print_freq) == 0:
             print(f"[Episode {episode_i:04d}] "
                   f"reward={episode_reward:.3f}  avg@{len(reward_buffer)}={avg_reward:.3f}  "
                   f"steps={steps_this_ep}  global_step={global_step}")
 
-        if (episode_i % SAVE_FREQ) == 0:
-            save_path = os.path.join(save_dir, f"ppo_ep{episode_i}.pt")
-            torch.save({
-                "model": agent.state_dict(),
-                "config": {
-                    "obs_dim": obs_dim,
-                    "act_dim": act_dim,
-                    "hidden_size": HIDDEN_SIZE,
-                }
-            }, save_path)
-            print(f"Saved checkpoint to {save_path}")
+        if (episode_i % cfg.save_freq) == 0:
+            with timer.phase("checkpoint"):
+                _save_checkpoint(writer, agent, save_dir, "main", cfg, obs_dim, act_dim,
+                                 _progress(episode_i, global_step, n_update, reward_buffer,
+                                           ep_rewards, pi_losses_curve, vf_losses_curve, env=vars(env)))
+
+        if progress_fn is not None and progress_fn(episode_i, global_step, float(avg_reward)):
+            stopped = True
+            break
+
+    return _finish(agent, writer, mlog, timer, cfg, save_dir, export_policy_path, episode_i, global_step,
+                   n_update, reward_buffer, ep_rewards, pi_losses_curve, vf_losses_curve, stopped)
+
+
+# ========== 多环境训练（VecToyAllocEnv） ==========
+def main_vec(
+    num_envs: Optional[int] = None,
+    save_dir: str = "./ckpt",
+    export_policy_path: Optional[str] = None,
+    resume: Optional[str] = None,
+    cfg: Optional[TrainConfig] = None,
+    progress_fn: Optional[ProgressFn] = None,
+):
+    """与 main 相同的超参与保存/画图逻辑，但 K 个环境并行（K 默认 cfg.num_envs）：
+    每步一次 get_action 前向得到 K 个动作，缓冲区按 [T, K, ...] 存放，
+    每收集 cfg.vec_rollout_steps 步（K*vec_rollout_steps 条转移）做一次 agent.update()。
+    环境自动重置，累计完成 cfg.max_episodes 个回合后结束。
+    """
+    cfg = cfg or TrainConfig()
+    num_envs = num_envs or cfg.num_envs
+    _setup(cfg, save_dir)
+
+    env = make_vec_env(num_envs, cfg.seed, cfg)
+    state = env.reset()                  # [K, obs_dim]
+    obs_dim = state.shape[1]
+    act_dim = env.action_dim
+
+    agent = _make_agent(cfg, obs_dim, act_dim, buffer_size=cfg.vec_rollout_steps, num_envs=num_envs)
+
+    traj_store = _open_traj_store(cfg, obs_dim, act_dim)
+    writer = CheckpointWriter(save_dir, keep=cfg.keep_checkpoints)
+    ckpt = _load_resume(resume, agent, "vec") if resume else None
+    timer, mlog = _open_metrics(cfg, save_dir, ckpt)
+    (episode_i, global_step, n_update, reward_buffer,
+     ep_rewards, pi_losses_curve, vf_losses_curve) = _resumed_counters(cfg, ckpt)
+    running_reward = np.zeros(num_envs, dtype=np.float64)
+    if ckpt is not None:
+        # 断点在 update 之后：buffer 为空，恢复环境对象、当前观测和各环境未完成回合的累计回报
+        vars(env).update(ckpt["env"])
+        state = ckpt["obs"]
+        running_reward = ckpt["running_reward"]
+        restore_rng_state(ckpt["rng"])
+    next_save = (episode_i // cfg.save_freq + 1) * cfg.save_freq
+    stopped = False
+
+    while episode_i < cfg.max_episodes:
+        for _ in range(cfg.vec_rollout_steps):
+            mask = env.mask
+            with timer.phase("get_action"):
+                action, value, logprob = agent.get_action(state, mask=mask)      # 一次前向，K 个动作
+            with timer.phase("env_step"):
+                next_state, reward, done, info = env.step(action)
+
+            with timer.phase("add_memo"):
+                agent.replay_buffer.add_memo(
+                    state=state,
+                    action=action,
+                    logprob=logprob,
+                    value=value,
+                    reward=reward,
+                    done=done,
+                    mask=mask,
+                    last_obs=next_state,        # bootstrap 用的 s_T
+                )
+            running_reward += reward
+            global_step += num_envs
+            state = next_state
+
+            # 回合统计 / 打印 / 保存（按完成的回合计数）
+            for k in np.flatnonzero(done):
+                episode_i += 1
+                ep_rewards.append(float(running_reward[k]))
+                reward_buffer.append(float(running_reward[k]))
+                mlog.log("episode", episode=episode_i, reward=ep_rewards[-1], global_step=global_step)
+                running_reward[k] = 0.0
+
+                if (episode_i % cfg.print_freq) == 0:
+                    print(f"[Episode {episode_i:04d}] "
+                          f"reward={ep_rewards[-1]:.3f}  avg@{len(reward_buffer)}={np.mean(reward_buffer):.3f}  "
+                          f"global_step={global_step}")
+
+        if traj_store is not None:
+            with timer.phase("traj_store"):
+                traj_store.append(*agent.replay_buffer.sample())
+        try:
+            with timer.phase("update"):
+                metrics = agent.update()
+        finally:
+            agent.replay_buffer.clear_memo()
+        pi_losses_curve.append(metrics["pi_loss"])
+        vf_losses_curve.append(metrics["vf_loss"])
+        n_update += 1
+        _log_update(mlog, timer, metrics, n_update, global_step)
+
+        # 跨过 save_freq 的整数倍就在本轮 update 之后保存（此时 buffer 为空，可精确续训）
+        if episode_i >= next_save:
+            with timer.phase("checkpoint"):
+                _save_checkpoint(writer, agent, save_dir, "vec", cfg, obs_dim, act_dim,
+                                 _progress(episode_i, global_step, n_update, reward_buffer,
+                                           ep_rewards, pi_losses_curve, vf_losses_curve,
+                                           env=vars(env), obs=state, running_reward=running_reward))
+            next_save = (episode_i // cfg.save_freq + 1) * cfg.save_freq
+
+        if progress_fn is not None and progress_fn(episode_i, global_step, _avg(reward_buffer)):
+            stopped = True
+            break
+
+    return _finish(agent, writer, mlog, timer, cfg, save_dir, export_policy_path, episode_i, global_step,
+                   n_update, reward_buffer, ep_rewards, pi_losses_curve, vf_losses_curve, stopped)
 
-    # 可选：导出策略参数或别的产物（比如均值向量/脚本化模型）
-    if export_policy_path:
-        torch.save(agent.state_dict(), export_policy_path)
-        print(f"Exported policy to {export_policy_path}")
 
+# ========== 多进程并行采样训练 ==========
+def main_parallel(
+    num_workers: Optional[int] = None,
+    env_fn: Optional[Callable] = None,
+    save_dir: str = "./ckpt",
+    export_policy_path: Optional[str] = None,
+    resume: Optional[str] = None,
+    cfg: Optional[TrainConfig] = None,
+    progress_fn: Optional[ProgressFn] = None,
+):
+    """learner 在主进程做 update，num_workers 个进程各跑一个 env_fn(cfg.seed + i) 环境采样。
+    每轮：下发最新权重 -> 每个 worker 采 cfg.vec_rollout_steps 步 -> 共享内存取回 [T, N, ...] -> update。
+    env_fn 默认 functools.partial(make_env, cfg=cfg)：采样进程会重新导入本模块，配置必须随 env_fn 一起传过去。
+    同一 seed 下结果可复现。
+    """
+    cfg = cfg or TrainConfig()
+    num_workers = num_workers or cfg.num_workers
+    env_fn = env_fn or functools.partial(make_env, cfg=cfg)
+    _setup(cfg, save_dir)
+
+    probe = env_fn(cfg.seed)
+    obs_dim = probe.reset().size
+    act_dim = probe.action_dim
+
+    agent = _make_agent(cfg, obs_dim, act_dim, buffer_size=cfg.vec_rollout_steps, num_envs=num_workers)
+
+    traj_store = _open_traj_store(cfg, obs_dim, act_dim)
+    writer = CheckpointWriter(save_dir, keep=cfg.keep_checkpoints)
+    ckpt = _load_resume(resume, agent, "parallel") if resume else None
+    timer, mlog = _open_metrics(cfg, save_dir, ckpt)
+    (episode_i, global_step, n_update, reward_buffer,
+     ep_rewards, pi_losses_curve, vf_losses_curve) = _resumed_counters(cfg, ckpt)
+    if ckpt is not None:
+        restore_rng_state(ckpt["rng"])
+    next_save = (episode_i // cfg.save_freq + 1) * cfg.save_freq
+    stopped = False
+    t_start = time.perf_counter()
+
+    with ParallelRollout(env_fn, num_workers, cfg.vec_rollout_steps, obs_dim, act_dim,
+                         hidden_size=cfg.hidden_size, seed=cfg.seed, max_steps_per_ep=cfg.max_steps_per_ep,
+                         masked=getattr(probe, "mask", None) is not None) as collector:
+        if ckpt is not None:
+            collector.set_state(ckpt["workers"])    # 各 worker 的环境、观测、未完成回合与 RNG
+        while episode_i < cfg.max_episodes:
+            with timer.phase("collect"):
+                batch, ep_returns = collector.collect(agent)
+            with timer.phase("add_memo"):
+                agent.replay_buffer.add_rollout(*batch, last_obs=collector.last_obs,
+                                                truncs=collector.truncs, trunc_values=collector.trunc_values)
+            global_step += num_workers * cfg.vec_rollout_steps
+
+            for ep_reward in ep_returns:
+                episode_i += 1
+                ep_rewards.append(ep_reward)
+                reward_buffer.append(ep_reward)
+                mlog.log("episode", episode=episode_i, reward=ep_reward, global_step=global_step)
+                if (episode_i % cfg.print_freq) == 0:
+                    sps = global_step / (time.perf_counter() - t_start)
+                    print(f"[Episode {episode_i:04d}] "
+                          f"reward={ep_reward:.3f}  avg@{len(reward_buffer)}={np.mean(reward_buffer):.3f}  "
+                          f"global_step={global_step}  steps/s={sps:.0f}")
+
+            if traj_store is not None:
+                with timer.phase("traj_store"):
+                    traj_store.append(*agent.replay_buffer.sample())
+            try:
+                with timer.phase("update"):
+                    metrics = agent.update()
+            finally:
+                agent.replay_buffer.clear_memo()
+            pi_losses_curve.append(metrics["pi_loss"])
+            vf_losses_curve.append(metrics["vf_loss"])
+            n_update += 1
+            _log_update(mlog, timer, metrics, n_update, global_step)
+
+            if episode_i >= next_save:
+                with timer.phase("checkpoint"):
+                    _save_checkpoint(writer, agent, save_dir, "parallel", cfg, obs_dim, act_dim,
+                                     _progress(episode_i, global_step, n_update, reward_buffer,
+                                               ep_rewards, pi_losses_curve, vf_losses_curve,
+                                               workers=collector.get_state()))
+                next_save = (episode_i // cfg.save_freq + 1) * cfg.save_freq
+
+            if progress_fn is not None and progress_fn(episode_i, global_step, _avg(reward_buffer)):
+                stopped = True
+                break
+
+    return _finish(agent, writer, mlog, timer, cfg, save_dir, export_policy_path, episode_i, global_step,
+                   n_update, reward_buffer, ep_rewards, pi_losses_curve, vf_losses_curve, stopped)
+
+
+def train(
+    cfg: TrainConfig,
+    save_dir: str = "./ckpt",
+    export_policy_path: Optional[str] = None,
+    resume: Optional[str] = None,
+    progress_fn: Optional[ProgressFn] = None,
+) -> Dict[str, object]:
+    """按 cfg 选择训练循环（num_workers>0 -> main_parallel，num_envs>1 -> main_vec，否则 main），返回训练摘要"""
+    kw = dict(save_dir=save_dir, export_policy_path=export_policy_path, resume=resume, cfg=cfg,
+              progress_fn=progress_fn)
+    if cfg.num_workers > 0:
+        return main_parallel(**kw)
+    if cfg.num_envs > 1:
+        return main_vec(**kw)
+    return main(**kw)
+
+
+def _plot_curves(ep_rewards, pi_losses_curve, vf_losses_curve, save_dir):
+    # 懒加载：无界面 / headless 训练不导入 matplotlib
+    from plot_training import plot_curves
+    plot_curves(ep_rewards, pi_losses_curve, vf_losses_curve, save_dir)
 
-    # ========== 画图（奖励/损失）==========刚加
-    # 1) 回合奖励曲线
-    plt.figure()
-    plt.plot(ep_rewards, label="episode reward")
-    if len(ep_rewards) >= 10:
-        # 简单滑窗平均
-        k = 10
-        smooth = np.convolve(ep_rewards, np.ones(k) / k, mode='valid')
-        plt.plot(range(k - 1, k - 1 + len(smooth)), smooth, label="moving avg (k=10)")
-    plt.xlabel("Episode")
-    plt.ylabel("Reward")
-    plt.title("PPO on ToyAllocEnv - Reward")
-    plt.legend()
-    plt.tight_layout()
-    plt.savefig(os.path.join(save_dir, "reward_curve.png"))
-    print(f"Saved figure: {os.path.join(save_dir, 'reward_curve.png')}")
-
-    # 2) 损失曲线
-    plt.figure()
-    plt.plot(pi_losses_curve, label="pi_loss")
-    plt.plot(vf_losses_curve, label="vf_loss")
-    plt.xlabel("Update #")
-    plt.ylabel("Loss")
-    plt.title("PPO Loss Curves")
-    plt.legend()
-    plt.tight_layout()
-    plt.savefig(os.path.join(save_dir, "loss_curves.png"))
-    print(f"Saved figure: {os.path.join(save_dir, 'loss_curves.png')}")
 
 if __name__ == "__main__":
     # 你可以在这里实例化自己的环境再传给 main(env=...)
     # env = YourEnv(...)
-    # main(env)
-    main()
-    # raise SystemExit("请在你的项目里导入 main(env=你的环境) 调用；或替换上面的 YourEnv。")
+    # main(env, cfg=TrainConfig(...))
+    import argparse
+    parser = argparse.ArgumentParser(description="PPO 训练")
+    parser.add_argument("--headless", action="store_true",
+                        help="不画图、不打印逐步信息，指标只写 save_dir/metrics.jsonl（之后用 plot_training.py 画图）")
+    parser.add_argument("--save-dir", default="./ckpt")
+    parser.add_argument("--env", choices=["toy", "qnet"], default=None)
+    parser.add_argument("--set", nargs="*", default=[], metavar="KEY=VALUE",
+                        help="覆盖 TrainConfig 字段，例如 --set pi_lr=1e-4 num_envs=16 scenario_dir=scenarios/")
+    parser.add_argument("--resume", action="store_true",
+                        help="从 save_dir 里最新的 ppo_ep*.pt 接着训练（优化器、RNG、回报曲线一并恢复）")
+    args = parser.parse_args()
+    cfg = TrainConfig().override(args.set)
+    if args.headless:
+        cfg = replace(cfg, headless=True, metrics_log=cfg.metrics_log or "metrics.jsonl")
+    if args.env:
+        cfg = replace(cfg, env_name=args.env)
+
+    resume = None
+    if args.resume:
+        resume = latest_checkpoint(args.save_dir)
+        if resume is None:
+            print(f"No checkpoint in {args.save_dir}, starting from scratch")
+
+    train(cfg, save_dir=args.save_dir, resume=resume)
@@ -0,0 +1,402 @@
+# qnet_env.py
+# -*- coding: utf-8 -*-
+"""
+量子网络时隙调度环境（NumPy 向量化），对应 Kotlin mainRL.kt 的训练循环，但 K 个回合一起用数组推进：
+- P1 请求生成：每时隙 Poisson(lambda=20) 个请求，src/dst 随机节点，Dd / AT / Pi ~ U[1,5]，WT=0
+- P1 Qc 更新：旧队列 + 新请求按 Pd = (Pi + Dd + AT) / 3 升序（稳定排序），只保留前 15 个，多出的记为失败
+- P2 Qp 选择：Qc 按 Pd 排序，|Qc|<=10 时最多 8 个、否则最多 10 个，src/dst 节点不冲突
+- P3 分配：动作 a_j ∈ [0,1] 为 Qp 第 j 个请求的比例，Wmax = min(路径宽度, Dd)，w = floor(a_j * Wmax)；
+  路径宽度 = 路径上各链路本时隙剩余信道数的最小值（同一时隙内前面的请求先占用），且不超过两端节点量子比特数
+- 纠缠：每跳 Binomial(w, exp(-alpha * l))，端到端数 = 各跳最小值，再以 q^(hops-1) 的概率逐对通过交换；
+  w <= 5 且各跳 w 相同，所以按 (src, dst, w) 预先算出端到端成功数的分布，每个请求只抽一个均匀数
+- 时隙末：WT+1，AT-1；成功数 >= 剩余需求则完成，AT 到 0 未完成则超时失败，否则需求扣除本时隙成功数
+- 奖励：逐请求按 RewardCalculator.calcStepReward（完成 / 浪费 / 延迟 / 优先级 / 平滑 / 利用率，w=0 -> -0.8，
+  有分配但零成功再 -0.3，一次完成再 +0.5，截断到 [-1, 2]），环境奖励取本时隙 Qp 中有可行路径的请求的平均值；
+  timeout_penalty > 0 时每个超时 / 溢出失败的请求再扣该值（Kotlin 里没有，默认 0）
+
+与 Kotlin 的差异：路径固定为预计算的最少跳路径（不做 EXT 搜索），不建模中间节点的量子比特约束与恢复路径。
+
+接口与 VecToyAllocEnv / ToyAllocEnv 相同：
+    env = VecQNetEnv(num_envs=256, seed=0)
+    obs = env.reset()                               # [K, obs_dim]
+    obs, reward, done, info = env.step(action)      # action [K, QP_MAX]；env.mask 为 Qp 的有效位 [K, QP_MAX]
+    env = QNetEnv(seed=0)                           # 单环境版本，obs [obs_dim]，reward float，done bool
+"""
+import math
+from collections import deque
+from typing import Dict
+
+import numpy as np
+
+QC_MAX = 15          # RequestSelector.MaxListLength
+QP_MAX = 10          # selectProcessableRequests 的最大 Qp 长度
+ARRIVAL_MAX = 64     # 每时隙到达数上限（Poisson(20) 超过 64 的概率可忽略）
+DEMAND_MAX = 5       # Dd ~ U[1,5]，所以 w <= Wmax <= 5
+REQ_FEATURES = 8     # 每个 Qp 请求的观测特征数
+GLOBAL_FEATURES = 3
+
+# 请求队列 [K, QC_MAX, NUM_FIELDS] 的字段列
+SRC, DST, DEMAND, A_DEMAND, AT, PRIO, WT = range(7)
+NUM_FIELDS = 7
+
+
+def make_topology(n_nodes: int = 80, degree: int = 6, alpha: float = 0.01, q: float = 0.9,
+                  edge_len: float = 100.0, seed: int = 0) -> Dict[str, np.ndarray]:
+    """生成连通的随机几何拓扑（接近 Topo.generate 的规模与参数）：
+    节点均匀撒在 edge_len x edge_len 的正方形里，每个节点连最近的 degree//2+1 个邻居，
+    再把小连通分量接到最大分量上。链路信道数 ~ U[3,7]，节点量子比特数 ~ U[10,14]。
+    """
+    rng = np.random.default_rng(seed)
+    pos = rng.random((n_nodes, 2)) * edge_len
+    dist = np.linalg.norm(pos[:, None, :] - pos[None, :, :], axis=-1)
+    np.fill_diagonal(dist, np.inf)
+
+    adj = np.zeros((n_nodes, n_nodes), dtype=bool)
+    k = min(degree // 2 + 1, n_nodes - 1)
+    nearest = np.argsort(dist, axis=1)[:, :k]
+    adj[np.repeat(np.arange(n_nodes), k), nearest.ravel()] = True
+    adj |= adj.T
+
+    # 连通性修补
+    while True:
+        comp = _components(adj)
+        if comp.max() == 0:
+            break
+        big = np.bincount(comp).argmax()
+        for c in np.unique(comp):
+            if c == big:
+                continue
+            a_nodes, b_nodes = np.flatnonzero(comp == c), np.flatnonzero(comp == big)
+            sub = dist[np.ix_(a_nodes, b_nodes)]
+            i, j = np.unravel_index(np.argmin(sub), sub.shape)
+            adj[a_nodes[i], b_nodes[j]] = adj[b_nodes[j], a_nodes[i]] = True
+
+    u, v = np.nonzero(np.triu(adj))
+    return {
+        "pos": pos,
+        "edges": np.stack([u, v], axis=1),
+        "length": dist[u, v],
+        "width": rng.integers(3, 8, size=len(u)),
+        "qubits": rng.integers(10, 15, size=n_nodes),
+        "alpha": np.float64(alpha),
+        "q": np.float64(q),
+    }
+
+
+def _components(adj: np.ndarray) -> np.ndarray:
+    n = len(adj)
+    comp = -np.ones(n, dtype=np.int64)
+    c = 0
+    for s in range(n):
+        if comp[s] >= 0:
+            continue
+        comp[s] = c
+        todo = deque([s])
+        while todo:
+            x = todo.popleft()
+            for y in np.flatnonzero(adj[x] & (comp < 0)):
+                comp[y] = c
+                todo.append(y)
+        c += 1
+    return comp
+
+
+def route_tables(topo: Dict[str, np.ndarray]):
+    """所有节点对的最少跳路径（BFS），返回按 [src, dst] 索引的表：
+      hops [N, N]、path_eids [N, N, H]（填充为 E，即一条容量无限的虚拟链路）、
+      path_p [N, N, H]（每跳成功率 exp(-alpha*l)，填充为 1）、swap_p [N, N] = q^(hops-1)
+    src == dst 时 hops = 0，视为没有可行路径。
+    """
+    n = len(topo["qubits"])
+    E = len(topo["edges"])
+    eid = -np.ones((n, n), dtype=np.int64)
+    u, v = topo["edges"][:, 0], topo["edges"][:, 1]
+    eid[u, v] = eid[v, u] = np.arange(E)
+    nbrs = [np.flatnonzero(eid[x] >= 0) for x in range(n)]
+
+    parent = -np.ones((n, n), dtype=np.int64)
+    hops = np.zeros((n, n), dtype=np.int64)
+    for s in range(n):
+        seen = np.zeros(n, dtype=bool)
+        seen[s] = True
+        todo = deque([s])
+        while todo:
+            x = todo.popleft()
+            for y in nbrs[x]:
+                if not seen[y]:
+                    seen[y] = True
+                    parent[s, y] = x
+                    hops[s, y] = hops[s, x] + 1
+                    todo.append(y)
+
+    H = int(hops.max())
+    path_eids = np.full((n, n, H), E, dtype=np.int64)
+    src = np.repeat(np.arange(n), n)
+    cur = np.tile(np.arange(n), n)
+    for h in range(H):
+        prev = parent[src, cur]
+        live = prev >= 0
+        path_eids.reshape(n * n, H)[live, h] = eid[prev[live], cur[live]]
+        cur = np.where(live, prev, cur)
+
+    p_edge = np.append(np.exp(-topo["alpha"] * topo["length"]), 1.0)
+    path_p = p_edge[path_eids]
+    swap_p = np.where(hops > 0, topo["q"] ** np.maximum(hops - 1, 0), 0.0)
+    return hops, path_eids, path_p, swap_p
+
+
+def success_table(path_p: np.ndarray, swap_p: np.ndarray, w_max: int = DEMAND_MAX) -> np.ndarray:
+    """sf[s, d, w, y-1] = P(端到端成功数 >= y | 分配 w)，y = 1..w_max。
+    各跳 X_h ~ Binomial(w, p_h) 独立，M = min_h X_h，P(M >= x) = prod_h P(X_h >= x)；
+    再经交换 Binomial(M, q^(hops-1))。
+    """
+    n = np.arange(w_max + 1)
+    comb = np.array([[math.comb(a, b) for b in n] for a in n], dtype=np.float64)      # C(a, b)
+
+    def pmf(p):
+        """p [...] -> Binomial(a, p) 在 b 处的概率 [..., a, b]"""
+        p = p[..., None, None]
+        k = n[None, :]
+        m = np.clip(n[:, None] - k, 0, None)
+        return np.where(k <= n[:, None], comb * p ** k * (1 - p) ** m, 0.0)
+
+    hop_sf = pmf(path_p)[..., ::-1].cumsum(-1)[..., ::-1]                           # [N, N, H, a, x] P(X >= x)
+    min_sf = hop_sf.prod(axis=2)                                                     # [N, N, a, x]
+    min_pmf = min_sf - np.concatenate([min_sf[..., 1:], np.zeros_like(min_sf[..., :1])], axis=-1)
+    out_pmf = np.einsum("ijam,ijmy->ijay", min_pmf, pmf(swap_p))                     # [N, N, a, y]
+    out_sf = out_pmf[..., ::-1].cumsum(-1)[..., ::-1]
+    return np.ascontiguousarray(out_sf[..., 1:])
+
+
+def _gather_rows(a: np.ndarray, idx: np.ndarray) -> np.ndarray:
+    """out[k, j] = a[k, idx[k, j]]；展平成一维下标后一次取，比 take_along_axis 快"""
+    K, L = a.shape[:2]
+    flat = idx + (np.arange(K) * L)[:, None]
+    return a.reshape(K * L, *a.shape[2:])[flat]
+
+
+def step_reward(demand, at, priority, wt, a_demand, w_max, w, ratio, succ):
+    """RewardCalculator.calcStepReward 的逐元素版本（所有参数为同形数组）"""
+    fd = np.maximum(a_demand, 1.0)
+    finish_ratio = succ / fd
+    waste = np.maximum(w - succ, 0)
+    w_max_f = np.maximum(w_max, 1)
+    r = (1.2 * finish_ratio
+         - 0.25 * np.where(w_max > 0, waste / w_max_f, 0.0)
+         - 0.03 * (wt / (wt + 10.0))
+         + 0.3 * finish_ratio * (np.maximum(priority, 0) / 3.0)
+         - 0.05 * (ratio - 0.5) ** 2
+         + 0.25 * np.where(w_max > 0, w / w_max_f, 0.0) * finish_ratio)
+    r = np.where(w == 0, -0.8, r)
+    r = r - 0.3 * ((succ == 0) & (w > 0))
+    r = r + 0.5 * (succ >= a_demand)
+    return np.clip(r, -1.0, 2.0)
+
+
+class VecQNetEnv:
+    """K 个独立的调度回合（共享同一拓扑），每步推进一个时隙，到 horizon 个时隙后自动重置。
+    - obs [K, QP_MAX*REQ_FEATURES + GLOBAL_FEATURES + QP_MAX]：
+        每个 Qp 位置 (Dd/5, aDemand/5, AT/5, Pi/5, WT/10, hops/H, 静态路径宽度/7, 每对期望成功率)，
+        全局 (|Qc|/15, |Qp|/10, t/horizon)，最后是有效位 mask
+    - action [K, QP_MAX]，填充位忽略；self.mask [K, QP_MAX] 为当前 Qp 的有效位
+    - info：succ_pairs / waste / finished / failed（超时 + 溢出）/ n_qp / util，均为 [K]
+    """
+
+    def __init__(self, num_envs: int = 64, n_nodes: int = 80, degree: int = 6, alpha: float = 0.01,
+                 q: float = 0.9, lam: float = 20.0, horizon: int = 100, seed: int = 0,
+                 topo_seed: int = 0, timeout_penalty: float = 0.0):
+        self.K = int(num_envs)
+        self.H = int(horizon)
+        self.lam = float(lam)
+        self.timeout_penalty = float(timeout_penalty)
+        self.rng = np.random.default_rng(seed)
+
+        self.topo = make_topology(n_nodes, degree, alpha, q, seed=topo_seed)
+        self.N = n_nodes
+        self.E = len(self.topo["edges"])
+        self.hops, self.path_eids, path_p, swap_p = route_tables(self.topo)
+        self.max_hops = self.path_eids.shape[-1]
+        self.succ_sf = success_table(path_p, swap_p)
+        # 虚拟链路 E 的容量足够大，不影响 min
+        self.link_width = np.append(self.topo["width"], np.iinfo(np.int32).max).astype(np.int32)
+        qb = self.topo["qubits"]
+        self.end_width = np.minimum(qb[:, None], qb[None, :])
+        static_width = np.where(
+            self.hops > 0, np.minimum(self.link_width[self.path_eids].min(axis=-1), self.end_width), 0)
+        quality = np.where(self.hops > 0, path_p.prod(axis=-1) * swap_p, 0.0)
+        # 每个节点对的静态观测特征 [N*N, 3]：跳数、静态路径宽度、每对期望成功率
+        self.pair_features = np.stack([
+            self.hops / self.max_hops, static_width / 7.0, quality], axis=-1).reshape(-1, 3).astype(np.float32)
+
+        self.action_dim = QP_MAX
+        self.obs_dim = QP_MAX * REQ_FEATURES + GLOBAL_FEATURES + QP_MAX
+
+        self.t = np.zeros(self.K, dtype=np.int64)
+        self.queue = np.zeros((self.K, QC_MAX, NUM_FIELDS), dtype=np.int16)       # 各字段都很小，用 int16 减少搬运
+        self.valid = np.zeros((self.K, QC_MAX), dtype=bool)
+        self.qp_idx = np.zeros((self.K, QP_MAX), dtype=np.int64)
+        self.mask = np.zeros((self.K, QP_MAX), dtype=bool)
+        self.qp = np.zeros((self.K, QP_MAX, NUM_FIELDS), dtype=np.int16)
+        self.pair = np.zeros((self.K, QP_MAX), dtype=np.intp)
+        self._overflow = np.zeros(self.K, dtype=np.int64)
+
+    # ---------- P1：到达与 Qc 更新 ----------
+    def _arrive(self):
+        K = self.K
+        n_new = np.minimum(self.rng.poisson(self.lam, size=K), ARRIVAL_MAX)
+        A = max(int(n_new.max()), 1)                                    # 只生成本时隙用得到的列
+        new_valid = np.arange(A)[None, :] < n_new[:, None]
+        new = np.zeros((K, A, NUM_FIELDS), dtype=np.int16)
+        new[..., SRC] = self.rng.integers(0, self.N, size=(K, A), dtype=np.int16)
+        new[..., DST] = self.rng.integers(0, self.N, size=(K, A), dtype=np.int16)
+        new[..., DEMAND] = self.rng.integers(1, DEMAND_MAX + 1, size=(K, A), dtype=np.int16)
+        new[..., AT] = self.rng.integers(1, 6, size=(K, A), dtype=np.int16)
+        new[..., PRIO] = self.rng.integers(1, 6, size=(K, A), dtype=np.int16)
+        new[..., A_DEMAND] = new[..., DEMAND]
+
+        merged = np.concatenate([self.queue, new], axis=1)
+        valid = np.concatenate([self.valid, new_valid], axis=1)
+        pd = merged[..., PRIO] + merged[..., DEMAND] + merged[..., AT]
+        pd[~valid] = np.iinfo(np.int16).max
+        order = np.argsort(pd, axis=1, kind="stable")[:, :QC_MAX]      # Pd 的 /3 不影响顺序；旧队列在前，同 Pd 先到先留
+        self.queue = _gather_rows(merged, order)
+        self.valid = _gather_rows(valid, order)
+        self._overflow = valid.sum(axis=1) - self.valid.sum(axis=1)
+
+    # ---------- P2：选 Qp ----------
+    def _select(self):
+        """Qc 已按 Pd 升序；逐位置贪心选不冲突的请求（循环 QC_MAX 次，每次对 K 个环境向量化）。
+        结果：qp_idx / mask [K, QP_MAX]，以及选中请求的字段 self.qp 和节点对下标 self.pair = src*N + dst。
+        """
+        K = self.K
+        rows = np.arange(K)
+        limit = np.where(self.valid.sum(axis=1) <= 10, 8, 10)
+        used = np.zeros(K * self.N, dtype=bool)
+        base = (rows * self.N)[:, None]
+        src, dst = self.queue[..., SRC] + base, self.queue[..., DST] + base    # 展平后的 used 下标
+        count = np.zeros(K, dtype=np.int64)
+        self.qp_idx = np.zeros((K, QP_MAX), dtype=np.int64)
+        self.mask = np.zeros((K, QP_MAX), dtype=bool)
+        for i in range(QC_MAX):
+            s, d = src[:, i], dst[:, i]
+            take = self.valid[:, i] & ~used[s] & ~used[d] & (count < limit)
+            r, c = rows[take], count[take]
+            self.qp_idx[r, c] = i
+            self.mask[r, c] = True
+            used[s[take]] = True
+            used[d[take]] = True
+            count += take
+        self.qp = _gather_rows(self.queue, self.qp_idx)
+        self.pair = self.qp[..., SRC].astype(np.intp) * self.N + self.qp[..., DST]
+
+    def _obs(self):
+        K = self.K
+        qp = self.qp
+        feats = np.empty((K, QP_MAX, REQ_FEATURES), dtype=np.float32)
+        feats[..., 0] = qp[..., DEMAND] / 5.0
+        feats[..., 1] = qp[..., A_DEMAND] / 5.0
+        feats[..., 2] = qp[..., AT] / 5.0
+        feats[..., 3] = qp[..., PRIO] / 5.0
+        feats[..., 4] = qp[..., WT] / 10.0
+        feats[..., 5:] = self.pair_features[self.pair]
+        feats *= self.mask[..., None]
+        obs = np.empty((K, self.obs_dim), dtype=np.float32)
+        obs[:, :QP_MAX * REQ_FEATURES] = feats.reshape(K, -1)
+        o = QP_MAX * REQ_FEATURES
+        obs[:, o] = self.valid.sum(axis=1) / QC_MAX
+        obs[:, o + 1] = self.mask.sum(axis=1) / QP_MAX
+        obs[:, o + 2] = self.t / self.H
+        obs[:, o + GLOBAL_FEATURES:] = self.mask
+        return obs
+
+    def _next_slot(self):
+        self._arrive()
+        self._select()
+        return self._obs()
+
+    def reset(self):
+        self.t[:] = 0
+        self.valid[:] = False
+        return self._next_slot()
+
+    def step(self, action):
+        K = self.K
+        a = np.clip(np.asarray(action, dtype=np.float64), 0.0, 1.0)
+        assert a.shape == (K, QP_MAX), f"action shape {a.shape} != ({K}, {QP_MAX})"
+        qp, pair = self.qp, self.pair
+        demand = qp[..., DEMAND]
+
+        # P3：按 Qp 顺序占用链路信道（本时隙内有效）。cap 展平成一维，按 Qp 位置主序逐个请求取 / 扣
+        cap = np.tile(self.link_width, K)
+        flat = self.path_eids.reshape(self.N * self.N, -1)[pair.T] + (np.arange(K) * (self.E + 1))[:, None]
+        routable = self.mask & (self.hops.ravel()[pair] > 0)
+        limit = (np.minimum(self.end_width.ravel()[pair], demand) * routable).T    # [QP_MAX, K]
+        ratio = a.T
+        w_max = np.empty((QP_MAX, K), dtype=np.int64)
+        w = np.empty((QP_MAX, K), dtype=np.int64)
+        for j in range(QP_MAX):
+            e = flat[j]                                                          # [K, H]
+            w_max[j] = np.minimum(cap.take(e).min(axis=1), limit[j])
+            w[j] = ratio[j] * w_max[j]                                           # floor（非负）
+            cap[e] -= w[j][:, None]                      # 同一请求的路径不重复经过同一链路
+        w_max, w = w_max.T, w.T
+        routable &= w_max > 0                            # Kotlin 中无候选路径的请求直接跳过
+
+        # 端到端成功数：查 (src, dst, w) 的分布，每个请求一个均匀数
+        u = self.rng.random((K, QP_MAX))
+        sf = self.succ_sf.reshape(-1, DEMAND_MAX)[pair * (DEMAND_MAX + 1) + w]
+        succ = (u[..., None] < sf).sum(axis=-1) * routable
+
+        r = step_reward(demand, qp[..., AT], qp[..., PRIO], qp[..., WT], qp[..., A_DEMAND], w_max, w, a, succ)
+        n_r = routable.sum(axis=1)
+        reward = np.where(n_r > 0, (r * routable).sum(axis=1) / np.maximum(n_r, 1), 0.0)
+
+        # 时隙末：WT / AT 推进，完成 / 超时
+        succ_q = np.zeros((K, QC_MAX + 1), dtype=np.int64)                # 末列接住填充位
+        np.put_along_axis(succ_q, np.where(self.mask, self.qp_idx, QC_MAX), succ, axis=1)
+        succ_q = succ_q[:, :QC_MAX]
+        self.queue[..., WT] += 1
+        self.queue[..., AT] -= 1
+        finished = self.valid & (self.queue[..., DEMAND] <= succ_q)
+        expired = self.valid & (self.queue[..., AT] <= 0) & ~finished
+        keep = self.valid & ~finished & ~expired
+        self.queue[..., DEMAND] -= succ_q * keep
+        failed = expired.sum(axis=1) + self._overflow
+        reward = reward - self.timeout_penalty * failed
+        self.valid = keep
+
+        info = {
+            "succ_pairs": succ.sum(axis=1),
+            "waste": np.maximum(w - succ, 0).sum(axis=1),
+            "finished": finished.sum(axis=1),
+            "failed": failed,
+            "n_qp": self.mask.sum(axis=1),
+            "util": np.where(w_max.sum(axis=1) > 0, w.sum(axis=1) / np.maximum(w_max.sum(axis=1), 1), 0.0),
+        }
+
+        # 下一时隙（结束的回合自动重置）
+        self.t += 1
+        done = self.t >= self.H
+        self.t[done] = 0
+        self.valid[done] = False
+        return self._next_slot(), reward.astype(np.float32), done, info
+
+
+class QNetEnv:
+    """单环境版本（接口同 ToyAllocEnv）：obs [obs_dim]，step 返回 (obs, float, bool, info)，mask [QP_MAX]"""
+
+    def __init__(self, seed: int = 0, **kwargs):
+        self.vec = VecQNetEnv(num_envs=1, seed=seed, **kwargs)
+        self.action_dim = self.vec.action_dim
+        self.obs_dim = self.vec.obs_dim
+
+    @property
+    def mask(self):
+        return self.vec.mask[0]
+
+    def reset(self):
+        return self.vec.reset()[0]
+
+    def step(self, action):
+        obs, reward, done, info = self.vec.step(np.asarray(action)[None])
+        return obs[0], float(reward[0]), bool(done[0]), {k: v[0] for k, v in info.items()}
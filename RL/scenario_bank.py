@@ -0,0 +1,170 @@
+# scenario_bank.py
+# -*- coding: utf-8 -*-
+"""
+ToyAllocEnv 的容量轨迹场景库：一次向量化生成成千上万个回合的容量序列，存成内存映射文件，
+环境按游标回放（step 只是下标访问），不同机器、不同训练 / 评估进程用的是同一批场景。
+
+容量过程（与 ToyAllocEnv 一致的取值范围 [0, cap_max]）：
+  uniform  每步独立 U{0..cap_max}
+  ar1      caps_0 ~ U{0..cap_max}，caps_t = clip(round(rho*caps_{t-1} + (1-rho)*cap_max/2 + N(0,1)))，同 ToyAllocEnv 的 AR(1)
+  bursty   每个请求一条两状态马尔可夫链：平稳时 U{ceil(cap_max/2)..cap_max}，突发（拥塞）时 U{0..cap_max//2}；
+           平稳 -> 突发的概率 p_burst，突发 -> 平稳的概率 p_calm
+另外每步生成有效请求数 n_active ~ U{min_requests..n}，供变长请求集（max_requests）使用。
+
+目录结构：
+  root/
+    meta.json       process / 参数 / num_scenarios / horizon / n / cap_max / seed / numpy 版本
+    caps.bin        int8 [S, H, n]
+    n_active.bin    int8 [S, H]
+
+生成按固定大小的块进行，块 i 用 SeedSequence(seed).spawn 的第 i 个子序列，结果与块在哪台机器上生成无关。
+
+用法：
+    python scenario_bank.py build scenarios/ --process ar1 --num 4096 --horizon 64 --n 8
+    python scenario_bank.py info scenarios/
+    bank = ScenarioBank("scenarios/")
+    env = ToyAllocEnv(n_requests=8, cap_max=5, horizon=64, scenarios=bank, scenario_start=0)
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+PROCESSES = ("uniform", "ar1", "bursty")
+CHUNK_SCENARIOS = 1024      # 每块生成的场景数（改动会改变生成结果）
+
+
+def generate_caps(rng: np.random.Generator, process: str, num: int, horizon: int, n: int, cap_max: int,
+                  ar_rho: float = 0.9, p_burst: float = 0.05, p_calm: float = 0.25) -> np.ndarray:
+    """num 个场景的容量轨迹 int8 [num, horizon, n]；只在时间维上循环，场景和请求维一次算完"""
+    shape = (num, horizon, n)
+    if process == "uniform":
+        return rng.integers(0, cap_max + 1, size=shape, dtype=np.int8)
+    if process == "ar1":
+        caps = np.empty(shape, dtype=np.int8)
+        cur = rng.integers(0, cap_max + 1, size=(num, n)).astype(np.float64)
+        noise = rng.normal(0.0, 1.0, size=(horizon - 1, num, n))
+        caps[:, 0] = cur
+        for t in range(1, horizon):
+            cur = np.clip(np.round(ar_rho * cur + (1 - ar_rho) * (cap_max / 2) + noise[t - 1]), 0, cap_max)
+            caps[:, t] = cur
+        return caps
+    if process == "bursty":
+        flip = rng.random(shape)
+        burst = np.empty(shape, dtype=bool)
+        state = rng.random((num, n)) < p_burst / (p_burst + p_calm)      # 从平稳分布起步
+        for t in range(horizon):
+            if t > 0:
+                state = np.where(state, flip[:, t] >= p_calm, flip[:, t] < p_burst)
+            burst[:, t] = state
+        high = rng.integers((cap_max + 1) // 2, cap_max + 1, size=shape, dtype=np.int8)
+        low = rng.integers(0, cap_max // 2 + 1, size=shape, dtype=np.int8)
+        return np.where(burst, low, high)
+    raise ValueError(f"unknown process {process!r}, expected one of {PROCESSES}")
+
+
+class ScenarioBank:
+    """只读打开一个场景库：bank.caps [S, H, n]、bank.n_active [S, H] 是只读内存映射上的 ndarray 视图
+    （去掉 np.memmap 子类，逐步下标访问不走 memmap 的 __array_finalize__）。
+    pickle / deepcopy 时只带目录路径（在采样进程里重新映射，checkpoint 里也不会复制整份数据）。
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        with open(os.path.join(root, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        S, H, n = self.meta["num_scenarios"], self.meta["horizon"], self.meta["n"]
+        self.num_scenarios, self.horizon, self.n, self.cap_max = S, H, n, self.meta["cap_max"]
+        self.caps = np.asarray(np.memmap(os.path.join(root, "caps.bin"), dtype=np.int8, mode="r", shape=(S, H, n)))
+        self.n_active = np.asarray(np.memmap(os.path.join(root, "n_active.bin"), dtype=np.int8, mode="r",
+                                             shape=(S, H)))
+
+    def __len__(self):
+        return self.num_scenarios
+
+    def __getitem__(self, i: int):
+        """第 i 个场景：(caps [H, n], n_active [H])，内存映射视图"""
+        return self.caps[i], self.n_active[i]
+
+    def __getstate__(self):
+        return {"root": self.root}
+
+    def __setstate__(self, state):
+        self.__init__(state["root"])
+
+    def __deepcopy__(self, memo):
+        return self
+
+    @classmethod
+    def build(cls, root: str, process: str = "ar1", num_scenarios: int = 4096, horizon: int = 64, n: int = 8,
+              cap_max: int = 5, seed: int = 0, min_requests: int = 1, ar_rho: float = 0.9,
+              p_burst: float = 0.05, p_calm: float = 0.25) -> "ScenarioBank":
+        if process not in PROCESSES:
+            raise ValueError(f"unknown process {process!r}, expected one of {PROCESSES}")
+        if not 0 <= cap_max <= np.iinfo(np.int8).max or not 1 <= n <= np.iinfo(np.int8).max:
+            raise ValueError("cap_max and n must fit in int8")
+        os.makedirs(root, exist_ok=True)
+        S = int(num_scenarios)
+        caps = np.memmap(os.path.join(root, "caps.bin"), dtype=np.int8, mode="w+", shape=(S, horizon, n))
+        n_active = np.memmap(os.path.join(root, "n_active.bin"), dtype=np.int8, mode="w+", shape=(S, horizon))
+        n_chunks = -(-S // CHUNK_SCENARIOS)
+        for i, child in enumerate(np.random.SeedSequence(seed).spawn(n_chunks)):
+            rng = np.random.default_rng(child)
+            a, b = i * CHUNK_SCENARIOS, min((i + 1) * CHUNK_SCENARIOS, S)
+            caps[a:b] = generate_caps(rng, process, b - a, horizon, n, cap_max,
+                                      ar_rho=ar_rho, p_burst=p_burst, p_calm=p_calm)
+            n_active[a:b] = rng.integers(min_requests, n + 1, size=(b - a, horizon), dtype=np.int8)
+        caps.flush()
+        n_active.flush()
+        del caps, n_active
+
+        meta = {"process": process, "num_scenarios": S, "horizon": int(horizon), "n": int(n),
+                "cap_max": int(cap_max), "seed": int(seed), "min_requests": int(min_requests),
+                "ar_rho": float(ar_rho), "p_burst": float(p_burst), "p_calm": float(p_calm),
+                "chunk_scenarios": CHUNK_SCENARIOS, "numpy": np.__version__}
+        tmp = os.path.join(root, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp, os.path.join(root, "meta.json"))
+        return cls(root)
+
+    def check_env(self, n: int, cap_max: int, horizon: int):
+        """环境参数与场景库不匹配时报错"""
+        if n != self.n or cap_max != self.cap_max or horizon > self.horizon:
+            raise ValueError(f"scenario bank {self.root} (n={self.n}, cap_max={self.cap_max}, horizon={self.horizon}) "
+                             f"does not fit env (n={n}, cap_max={cap_max}, horizon={horizon})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ToyAllocEnv 容量轨迹场景库")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="生成场景库")
+    b.add_argument("root")
+    b.add_argument("--process", choices=PROCESSES, default="ar1")
+    b.add_argument("--num", type=int, default=4096, help="场景（回合）数")
+    b.add_argument("--horizon", type=int, default=64)
+    b.add_argument("--n", type=int, default=8, help="请求数（变长时为 max_requests）")
+    b.add_argument("--cap-max", type=int, default=5)
+    b.add_argument("--seed", type=int, default=0)
+    b.add_argument("--min-requests", type=int, default=1)
+    b.add_argument("--ar-rho", type=float, default=0.9)
+    b.add_argument("--p-burst", type=float, default=0.05)
+    b.add_argument("--p-calm", type=float, default=0.25)
+    i = sub.add_parser("info", help="打印场景库参数与容量统计")
+    i.add_argument("root")
+    args = parser.parse_args()
+
+    if args.cmd == "build":
+        bank = ScenarioBank.build(args.root, process=args.process, num_scenarios=args.num, horizon=args.horizon,
+                                  n=args.n, cap_max=args.cap_max, seed=args.seed, min_requests=args.min_requests,
+                                  ar_rho=args.ar_rho, p_burst=args.p_burst, p_calm=args.p_calm)
+        print(f"Built {len(bank)} scenarios in {args.root}")
+    else:
+        bank = ScenarioBank(args.root)
+        print(json.dumps(bank.meta, indent=2))
+        print(f"caps mean={float(bank.caps.mean()):.3f}  n_active mean={float(bank.n_active.mean()):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+# serve.py
+# -*- coding: utf-8 -*-
+"""
+多进程策略服务 + 模型目录热更新：server.py 的 app 跑在 N 个 uvicorn worker 进程里（共享监听端口），
+新模型落进目录后所有 worker 不重启、不丢请求地切换过去，每个响应都带 model_version。
+
+进程结构：
+  supervisor（本脚本主进程）
+    - 轮询模型目录（默认 *.npz 与 ppo_ep*.pt，即训练时直接写进 ckpt/ 的 checkpoint），
+      最新文件两次轮询间大小 / mtime 不变才算写完；按 sha256 去重，
+      server.check_policy 适配不了的维度（见 policy_adapter）记一次日志后跳过
+    - 每个新版本的权重只写一次，放进一块新的共享内存（SharedMemory），然后更新控制块
+    - 只保留最近 KEEP_VERSIONS 个版本的共享内存；已映射的 worker 在 unlink 之后仍能继续读
+  worker（uvicorn 按 "serve:app" 导入本模块）
+    - 后台线程每 RL_RELOAD_POLL_MS 毫秒读一次控制块；版本变了就只读映射新块，
+      权重直接是共享内存上的 ndarray 视图（不拷贝），先做一次预热前向，再 server.set_model 整体替换快照
+    - 请求路径上只读一次 server.MODEL 引用，不做任何加载 / 加锁，换模型时没有延迟尖刺
+
+控制块（小端，seqlock：只有 supervisor 写；写前 seq 变奇数、写完变偶数，读方两次 seq 相同且为偶数才采用）：
+  0   4s   magic b"QCTL"
+  4   u32  layout version (= 1)
+  8   u64  seq
+  16  u64  model version（0 = 尚无模型，走规则策略）
+  24  64s  权重共享内存块名（\\0 填充）
+
+权重块：
+  0   4s   magic b"QPW1"
+  4   u32  JSON 头长度 L
+  8   L    JSON：version / source / sha256 / obs_dim / act_dim / hidden_size / arrays [[offset, shape], ...]
+  之后 64 字节对齐的 float32 数组，依次为 W0, b0, W1, b1, ..., W_mu, b_mu（W 为 [in, out]，同 .npz）
+
+用法：
+    python serve.py --model-dir ckpt/ --workers 4 --port 8000
+    python ppo_training.py --headless --save-dir ckpt/             # 每存一个 ppo_ep*.pt，各 worker 随后切到新版本
+    python export_policy.py some_ckpt.pt -o ckpt/policy_v2.npz     # 导出的 .npz 同样会被切上
+    curl localhost:8000/model
+"""
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import server
+from np_policy import NumpyPolicy
+from threads import THREAD_ENV_VARS
+
+CTL_ENV = "RL_SERVE_CTL"
+POLL_ENV = "RL_RELOAD_POLL_MS"
+CTL_MAGIC = b"QCTL"
+CTL_LAYOUT = 1
+CTL = struct.Struct("<4sIQQ64s")
+_SEQ_OFF, _SEQ = 8, struct.Struct("<Q")
+WEIGHTS_MAGIC = b"QPW1"
+_WHEAD = struct.Struct("<4sI")
+ALIGN = 64
+KEEP_VERSIONS = 2
+DEFAULT_PATTERNS = ("*.npz", "ppo_ep*.pt")
+
+
+_ATTACH_LOCK = threading.Lock()
+
+
+def _attach(name: str) -> SharedMemory:
+    """只映射不拥有：不向 resource_tracker 登记。worker 和 supervisor 共用一个 tracker，
+    映射方登记 / 注销会打乱创建方的登记；独立的 tracker 则会在 worker 退出时把块 unlink 掉。
+    """
+    try:
+        return SharedMemory(name=name, track=False)          # Python 3.13+
+    except TypeError:
+        pass
+    with _ATTACH_LOCK:
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args, **kwargs: None
+        try:
+            return SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+# ========== 权重块 ==========
+def _policy_arrays(policy: NumpyPolicy) -> List[np.ndarray]:
+    arrays = []
+    for W, b in policy.hidden:
+        arrays += [W, b]
+    return arrays + [policy.W_mu, policy.b_mu]
+
+
+def write_weights(policy: NumpyPolicy, name: str, version: int, **info) -> SharedMemory:
+    arrays = _policy_arrays(policy)
+    layout, off = [], 0
+    for a in arrays:
+        layout.append([off, list(a.shape)])
+        off += -(-a.nbytes // ALIGN) * ALIGN
+    header = json.dumps({"version": version, "obs_dim": policy.obs_dim, "act_dim": policy.act_dim,
+                         "hidden_size": policy.hidden_size, "arrays": layout, **info}).encode("utf-8")
+    base = -(-(_WHEAD.size + len(header)) // ALIGN) * ALIGN
+    shm = SharedMemory(name=name, create=True, size=base + off)
+    _WHEAD.pack_into(shm.buf, 0, WEIGHTS_MAGIC, len(header))
+    shm.buf[_WHEAD.size:_WHEAD.size + len(header)] = header
+    for a, (o, shape) in zip(arrays, layout):
+        np.ndarray(shape, dtype=np.float32, buffer=shm.buf, offset=base + o)[...] = a
+    return shm
+
+
+def read_weights(shm: SharedMemory) -> Tuple[NumpyPolicy, dict]:
+    """共享内存上的只读 ndarray 视图 -> (NumpyPolicy, 头里的 source / sha256 等信息)。
+    数组已是 float32 且连续，NumpyPolicy 不会再拷贝一份。
+    """
+    magic, n = _WHEAD.unpack_from(shm.buf, 0)
+    if magic != WEIGHTS_MAGIC:
+        raise ValueError(f"bad weights magic {magic!r} in {shm.name}")
+    header = json.loads(bytes(shm.buf[_WHEAD.size:_WHEAD.size + n]))
+    header.pop("version", None)
+    base = -(-(_WHEAD.size + n) // ALIGN) * ALIGN
+    arrays = []
+    for o, shape in header.pop("arrays"):
+        a = np.ndarray(shape, dtype=np.float32, buffer=shm.buf, offset=base + o)
+        a.flags.writeable = False
+        arrays.append(a)
+    hidden = [(arrays[i], arrays[i + 1]) for i in range(0, len(arrays) - 2, 2)]
+    policy = NumpyPolicy(hidden, (arrays[-2], arrays[-1]), obs_dim=header["obs_dim"],
+                         act_dim=header["act_dim"], hidden_size=header["hidden_size"])
+    return policy, header
+
+
+def load_policy_file(path: str) -> NumpyPolicy:
+    """.npz（export_policy.py 导出）或训练 checkpoint .pt（按需导入 torch）"""
+    if path.endswith(".npz"):
+        return NumpyPolicy.from_npz(path)
+    from export_policy import load_checkpoint, numpy_policy
+    return numpy_policy(*load_checkpoint(path))
+
+
+# ========== 控制块 ==========
+class ControlBlock:
+
+    def __init__(self, shm: SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+
+    @classmethod
+    def create(cls, name: Optional[str] = None) -> "ControlBlock":
+        shm = SharedMemory(name=name, create=True, size=CTL.size)
+        CTL.pack_into(shm.buf, 0, CTL_MAGIC, CTL_LAYOUT, 0, 0, b"")
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "ControlBlock":
+        shm = _attach(name)
+        magic, layout = struct.unpack_from("<4sI", shm.buf, 0)
+        if magic != CTL_MAGIC or layout != CTL_LAYOUT:
+            raise ValueError(f"{name} is not a serve.py control block")
+        return cls(shm, owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def seq(self) -> int:
+        return _SEQ.unpack_from(self.shm.buf, _SEQ_OFF)[0]
+
+    def publish(self, version: int, block: str):
+        seq = self.seq()
+        _SEQ.pack_into(self.shm.buf, _SEQ_OFF, seq + 1)              # 奇数：写入中
+        CTL.pack_into(self.shm.buf, 0, CTL_MAGIC, CTL_LAYOUT, seq + 1, version, block.encode("ascii"))
+        _SEQ.pack_into(self.shm.buf, _SEQ_OFF, seq + 2)
+
+    def read(self) -> Tuple[int, int, str]:
+        """(seq, model version, 权重块名)，读到写了一半的内容就重读"""
+        while True:
+            s1 = self.seq()
+            if s1 % 2 == 0:
+                _, _, _, version, block = CTL.unpack_from(self.shm.buf, 0)
+                if self.seq() == s1:
+                    return s1, version, block.rstrip(b"\0").decode("ascii")
+            time.sleep(0)
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# ========== supervisor ==========
+class ModelPublisher:
+    """每个版本一块权重共享内存，写好后再切控制块；只保留最近 keep 个版本"""
+
+    def __init__(self, keep: int = KEEP_VERSIONS):
+        self.ctl = ControlBlock.create()
+        self.keep = max(1, keep)
+        self.version = 0
+        self._blocks: Dict[int, SharedMemory] = {}
+
+    def publish(self, policy: NumpyPolicy, **info) -> int:
+        server.check_policy(policy, info.get("source", "policy"))
+        version = self.version + 1
+        shm = write_weights(policy, f"qpw_{os.getpid()}_{version}", version, **info)
+        self._blocks[version] = shm
+        self.ctl.publish(version, shm.name)
+        self.version = version
+        for v in sorted(self._blocks)[:-self.keep]:
+            old = self._blocks.pop(v)
+            old.close()
+            old.unlink()
+        return version
+
+    def close(self):
+        for shm in self._blocks.values():
+            shm.close()
+            shm.unlink()
+        self._blocks.clear()
+        self.ctl.close()
+
+
+class DirWatcher(threading.Thread):
+    """轮询模型目录，最新且已写完（两次轮询间大小 / mtime 不变）的新文件发布为新版本"""
+
+    def __init__(self, model_dir: str, publisher: ModelPublisher, patterns=DEFAULT_PATTERNS, poll: float = 1.0):
+        super().__init__(name="model-dir-watcher", daemon=True)
+        self.model_dir = model_dir
+        self.publisher = publisher
+        self.patterns = tuple(patterns)
+        self.poll = float(poll)
+        self._halt = threading.Event()
+        self._pending: Optional[tuple] = None
+        self._current: Optional[tuple] = None  # 最近处理过的 (mtime_ns, path, size)
+        self._seen: Dict[str, str] = {}      # sha256 -> 结果（"published v3" / 失败原因），同一内容只处理一次
+
+    def _newest(self) -> Optional[tuple]:
+        if not os.path.isdir(self.model_dir):
+            return None
+        best = None
+        for name in os.listdir(self.model_dir):
+            if not any(fnmatch.fnmatch(name, p) for p in self.patterns):
+                continue
+            path = os.path.join(self.model_dir, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            key = (st.st_mtime_ns, path, st.st_size)
+            if best is None or key > best:
+                best = key
+        return best
+
+    def scan(self, require_stable: bool = True) -> Optional[int]:
+        """检查一次；发布了新版本时返回版本号"""
+        newest = self._newest()
+        if newest is None or newest == self._current:
+            self._pending = None
+            return None
+        if require_stable and newest != self._pending:
+            self._pending = newest          # 下一次轮询仍不变再加载
+            return None
+        self._pending = None
+        self._current = newest
+        path = newest[1]
+        with open(path, "rb") as f:
+            sha = hashlib.sha256(f.read()).hexdigest()
+        if sha in self._seen:
+            return None
+        try:
+            policy = load_policy_file(path)
+            version = self.publisher.publish(policy, source=os.path.abspath(path), sha256=sha,
+                                             published_at=time.time())
+        except Exception as e:
+            self._seen[sha] = f"{type(e).__name__}: {e}"
+            print(f"[serve] skip {path}: {self._seen[sha]}", flush=True)
+            return None
+        self._seen[sha] = f"published v{version}"
+        print(f"[serve] published {path} as model_version {version}", flush=True)
+        return version
+
+    def run(self):
+        while not self._halt.wait(self.poll):
+            try:
+                self.scan()
+            except Exception as e:          # 目录暂时不可读等：下次轮询再试
+                print(f"[serve] watcher error: {type(e).__name__}: {e}", flush=True)
+
+    def stop(self):
+        self._halt.set()
+
+
+# ========== worker ==========
+class WorkerReloader(threading.Thread):
+    """worker 进程里的热更新线程：控制块版本变化 -> 映射新权重块 -> 预热 -> server.set_model"""
+
+    def __init__(self, ctl_name: str, poll_ms: float = 50.0):
+        super().__init__(name="model-reloader", daemon=True)
+        self.ctl = ControlBlock.attach(ctl_name)
+        self.poll = poll_ms / 1e3
+        self.seq = -1
+        self.version = 0
+        self._maps: List[SharedMemory] = []     # 当前版本在最后；旧版本等在途请求放手后再 close
+
+    def check(self):
+        seq = self.ctl.seq()
+        if seq == self.seq:
+            return
+        seq, version, block = self.ctl.read()
+        if version != self.version and version > 0:
+            try:
+                shm = _attach(block)
+            except FileNotFoundError:       # 刚被更新的版本顶掉了，下次轮询读到新块
+                return
+            policy, info = read_weights(shm)
+            adapted = server.check_policy(policy, info.get("source", "policy"))
+            adapted.ratios(np.zeros((1, server.FEATURE_DIM), dtype=np.float32), np.zeros(1))   # 预热：触页 + 首次前向
+            server.set_model(adapted, version, **info)
+            self._maps.append(shm)
+            self.version = version
+        self.seq = seq
+        self._release_old()
+
+    def _release_old(self):
+        """旧块上的 ndarray 视图还被在途请求引用时 close 会抛 BufferError，留到下次再试"""
+        keep = []
+        for shm in self._maps[:-1]:
+            try:
+                shm.close()
+            except BufferError:
+                keep.append(shm)
+        self._maps = keep + self._maps[-1:]
+
+    def run(self):
+        while True:
+            time.sleep(self.poll)
+            try:
+                self.check()
+            except Exception as e:
+                print(f"[serve] reload error in pid {os.getpid()}: {type(e).__name__}: {e}", flush=True)
+
+
+app = server.app
+
+# uvicorn worker 导入本模块时（supervisor 已设置 RL_SERVE_CTL）：先同步装上当前版本，再开后台热更新
+if os.environ.get(CTL_ENV):
+    RELOADER = WorkerReloader(os.environ[CTL_ENV], float(os.environ.get(POLL_ENV, 50)))
+    RELOADER.check()
+    RELOADER.start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多 worker 策略服务，监视模型目录并原子热更新")
+    parser.add_argument("--model-dir", required=True, help="监视的模型目录（.npz 或训练 checkpoint）")
+    parser.add_argument("--pattern", nargs="+", default=list(DEFAULT_PATTERNS), help="文件名匹配模式")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--threads-per-worker", type=int, default=1, help="每个 worker 的 BLAS 线程数")
+    parser.add_argument("--poll", type=float, default=1.0, help="目录轮询间隔（秒）")
+    parser.add_argument("--reload-poll-ms", type=float, default=50.0, help="worker 检查控制块的间隔（毫秒）")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    publisher = ModelPublisher()
+    watcher = DirWatcher(args.model_dir, publisher, patterns=args.pattern, poll=args.poll)
+    watcher.scan(require_stable=False)      # 启动时已在目录里的文件视为写完
+    if publisher.version == 0:
+        print(f"[serve] no usable model in {args.model_dir} yet, serving the rule policy", flush=True)
+    watcher.start()
+
+    # worker 由 uvicorn 以 spawn 方式启动，继承这些环境变量
+    os.environ[CTL_ENV] = publisher.ctl.name
+    os.environ[POLL_ENV] = str(args.reload_poll_ms)
+    os.environ.pop("RL_POLICY_NPZ", None)
+    for k in THREAD_ENV_VARS:
+        os.environ[k] = str(args.threads_per_worker)
+    try:
+        uvicorn.run("serve:app", host=args.host, port=args.port, workers=args.workers,
+                    app_dir=os.path.dirname(os.path.abspath(__file__)))
+    finally:
+        watcher.stop()
+        publisher.close()
+
+
+if __name__ == "__main__":
+    main()
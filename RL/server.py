@@ -1,9 +1,20 @@
 # RL/server.py
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, Response
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, NamedTuple, Optional
+import itertools
+import os
+import time
 import numpy as np
 
+from decision_cache import DecisionCache
+from metrics import BATCH_BUCKETS, Counter, Histogram, render_prometheus
+from microbatch import MicroBatcher
+from np_policy import NumpyPolicy
+from policy_adapter import FEATURE_DIM, RequestPolicy, adapt
+import wire
+
 app = FastAPI()
 
 class PredictReq(BaseModel):
@@ -21,6 +32,57 @@ class PredictReq(BaseModel):
 
 class PredictResp(BaseModel):
     w: int
+    model_version: Optional[int] = None     # 算出这个 w 的策略版本（规则策略时为 None）
+
+class PredictBatchReq(BaseModel):
+    reqs: List[PredictReq]
+
+class PredictBatchResp(BaseModel):
+    w: List[int]
+    model_version: Optional[int] = None
+
+# 可选的决策缓存：RL_CACHE_SIZE>0 时启用（键为按 RL_CACHE_QUANT 量化后的特征）
+_cache_size = int(os.environ.get("RL_CACHE_SIZE", 0))
+_cache_quant = float(os.environ.get("RL_CACHE_QUANT", 1e-3))
+
+def _new_cache() -> Optional[DecisionCache]:
+    return DecisionCache(_cache_size, quant=_cache_quant) if _cache_size > 0 else None
+
+class ServedModel(NamedTuple):
+    """当前服务的模型快照。请求开始时取一次 MODEL，推理、缓存和返回的版本号都来自同一个快照；
+    换模型只是整体替换 MODEL 这一个引用，正在处理的请求继续用它拿到的旧快照。
+    """
+    policy: Optional[RequestPolicy]     # 适配到逐请求接口的策略（见 policy_adapter）；None 时退回规则策略
+    version: Optional[int]
+    cache: Optional[DecisionCache]      # 每个模型一份，旧模型的决策随旧快照一起作废
+    info: dict
+
+# 已加载的 PPO 策略。通过环境变量 RL_POLICY_NPZ 指定 export_policy.py 导出的权重；多进程热更新见 serve.py
+MODEL = ServedModel(None, None, _new_cache(), {})
+
+def check_policy(policy: NumpyPolicy, source: str = "policy") -> RequestPolicy:
+    """按维度把策略适配到逐请求接口：11 -> 1 的请求策略，或 ppo_training.py 训练的 toy（9 -> 8 等）/ qnet（93 -> 10）
+    时隙策略（一个批按 n 个请求一组拼观测）。维度都对不上时抛 ValueError"""
+    return adapt(policy, source)
+
+def set_model(policy, version: Optional[int] = None, **info) -> ServedModel:
+    """policy 为 NumpyPolicy（在这里适配）或已适配的 RequestPolicy；None 时退回规则策略"""
+    global MODEL
+    if policy is not None and not isinstance(policy, RequestPolicy):
+        policy = check_policy(policy, info.get("source", "policy"))
+    cache = _new_cache()
+    if policy is not None:
+        info = {"layout": policy.layout, **info}
+        if policy.layout != "request":
+            cache = None        # 时隙策略的决策取决于同批的其他请求，不能按单条请求的特征缓存
+    MODEL = ServedModel(policy, version, cache, {"version": version, **info})
+    return MODEL
+
+def load_policy(path: str, version: Optional[int] = 1) -> NumpyPolicy:
+    """加载 .npz 策略并换上（见 check_policy）"""
+    policy = NumpyPolicy.from_npz(path)
+    set_model(policy, version, source=path)
+    return policy
 
 def featurize(req: PredictReq) -> np.ndarray:
     return np.array([
@@ -37,13 +99,210 @@ def featurize(req: PredictReq) -> np.ndarray:
         req.recent_success_rate or 0.0
     ], dtype=np.float32)
 
+def featurize_batch(reqs: List[PredictReq]) -> np.ndarray:
+    """把一个时隙的 Qp 一次性拼成 (N, 11) float32 矩阵，列顺序与 featurize 一致。
+    per_edge_free_links 是不等长的：先展平成一维，再按每条请求的起点做 reduceat 求 min / sum。
+    """
+    N = len(reqs)
+    X = np.zeros((N, FEATURE_DIM), dtype=np.float32)
+    if N == 0:
+        return X
+
+    X[:, 0] = [r.demand for r in reqs]
+    X[:, 1] = [r.path_width_candidate for r in reqs]
+    X[:, 2] = [len(r.path) for r in reqs]
+    X[:, 5] = [r.src_remaining_qubits for r in reqs]
+    X[:, 6] = [r.dst_remaining_qubits for r in reqs]
+    X[:, 7] = [r.priority or 0 for r in reqs]
+    X[:, 8] = [r.wait_time or 0 for r in reqs]
+    X[:, 9] = [r.global_load or 0.0 for r in reqs]
+    X[:, 10] = [r.recent_success_rate or 0.0 for r in reqs]
+
+    # 不等长 per_edge_free_links：空列表保持 0（与 featurize 一致）
+    lens = np.fromiter((len(r.per_edge_free_links) for r in reqs), dtype=np.int64, count=N)
+    total = int(lens.sum())
+    if total > 0:
+        flat = np.fromiter(
+            itertools.chain.from_iterable(r.per_edge_free_links for r in reqs),
+            dtype=np.float32, count=total
+        )
+        _edge_min_mean(X, lens, flat)
+    return X
+
+def _edge_min_mean(X: np.ndarray, lens: np.ndarray, flat: np.ndarray):
+    """把展平的 per_edge_free_links 按段求 min / mean 写入 X 的第 3、4 列（空段保持 0）"""
+    nz = lens > 0
+    if not nz.any():
+        return
+    starts = (np.cumsum(lens) - lens)[nz]   # 空段不占元素，直接跳过即可
+    X[nz, 3] = np.minimum.reduceat(flat, starts)
+    X[nz, 4] = np.add.reduceat(flat, starts) / lens[nz]
+
+def featurize_wire(cols) -> np.ndarray:
+    """wire.decode_requests 的列式视图 -> (N, 11) 特征矩阵，列顺序与 featurize 一致"""
+    ints, floats = cols["ints"], cols["floats"]
+    N = ints.shape[1]
+    X = np.zeros((N, FEATURE_DIM), dtype=np.float32)
+    X[:, 0:3] = ints[0:3].T          # demand, width_cand, path_len
+    X[:, 5:9] = ints[3:7].T          # src/dst remaining, priority, wait_time
+    X[:, 9:11] = floats.T            # global_load, recent_success_rate
+    _edge_min_mean(X, cols["edge_counts"].astype(np.int64), cols["edges"])
+    return X
+
 def policy_infer(x: np.ndarray) -> int:
-    # 先用规则：w = min(demand, width_cand, min_edge_free)
-    demand = int(x[0]); width_cand = int(x[1]); min_edge = int(x[3])
-    return max(0, min(demand, width_cand, min_edge))
+    return int(policy_infer_batch(x[None, :])[0])
+
+def policy_infer_batch(X: np.ndarray, model: Optional[ServedModel] = None) -> np.ndarray:
+    """X 为 (N, 11)，返回 (N,) int 宽度（model 默认当前 MODEL）。
+    规则上界 Wmax = min(demand, width_cand, min_edge_free)；
+    加载了 PPO 策略时按比例动作分配 w = floor(a * Wmax)（与 mainRL.kt 的映射一致；时隙策略把整批当作一个时隙的 Qp）。
+    """
+    policy = (model or MODEL).policy
+    cols = X[:, [0, 1, 3]].astype(np.int64)   # demand, width_cand, min_edge（与 int() 一样向零截断）
+    w_max = np.maximum(cols.min(axis=1), 0)
+    if policy is None:
+        return w_max
+    a = policy.ratios(X, w_max)
+    return np.floor(a * w_max).astype(np.int64)
+
+def decide_batch(X: np.ndarray, model: Optional[ServedModel] = None) -> np.ndarray:
+    """带缓存的 policy_infer_batch（未启用缓存时直接推理）"""
+    model = model or MODEL
+    if model.cache is None:
+        return policy_infer_batch(X, model)
+    return model.cache.lookup(X, lambda Xm: policy_infer_batch(Xm, model))
+
+if os.environ.get("RL_POLICY_NPZ"):
+    load_policy(os.environ["RL_POLICY_NPZ"])
+
+# ========== 指标（/metrics，Prometheus 文本格式） ==========
+REQUESTS = Counter("rl_requests_total", "Requests handled per endpoint", labels=("endpoint",))
+PARSE_SECONDS = Histogram("rl_parse_seconds", "Body receive + JSON decode + validation time",
+                          labels=("endpoint",))
+FEATURIZE_SECONDS = Histogram("rl_featurize_seconds", "Featurize time per policy pass", labels=("endpoint",))
+INFER_SECONDS = Histogram("rl_infer_seconds", "Policy (and cache) time per policy pass", labels=("endpoint",))
+BATCH_SIZE = Histogram("rl_batch_size", "Requests per policy pass", buckets=BATCH_BUCKETS, labels=("endpoint",))
+
+class RecvTimerMiddleware:
+    """ASGI 中间件：记下请求进入应用的时刻，端点里据此算出解析（含 pydantic 校验）耗时"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            scope.setdefault("state", {})["t_recv"] = time.perf_counter()
+        await self.app(scope, receive, send)
+
+app.add_middleware(RecvTimerMiddleware)
+
+def observe_parse(request: Request, endpoint: str):
+    REQUESTS.inc(endpoint)
+    t_recv = getattr(request.state, "t_recv", None)
+    if t_recv is not None:
+        PARSE_SECONDS.observe(time.perf_counter() - t_recv, endpoint)
+
+def timed_featurize(reqs: List[PredictReq], endpoint: str) -> np.ndarray:
+    t0 = time.perf_counter()
+    X = featurize_batch(reqs)
+    FEATURIZE_SECONDS.observe(time.perf_counter() - t0, endpoint)
+    return X
+
+def timed_decide(X: np.ndarray, endpoint: str, model: ServedModel) -> np.ndarray:
+    t0 = time.perf_counter()
+    w = decide_batch(X, model)
+    INFER_SECONDS.observe(time.perf_counter() - t0, endpoint)
+    BATCH_SIZE.observe(len(X), endpoint)
+    return w
+
+def infer_reqs(reqs: List[PredictReq]) -> List[tuple]:
+    """featurize_batch + decide_batch：微批队列的批处理函数，每条返回 (w, model_version)"""
+    model = MODEL
+    w = timed_decide(timed_featurize(reqs, "predict_async"), "predict_async", model)
+    return [(wi, model.version) for wi in w.tolist()]
+
+# 并发单条请求的微批：RL_BATCH_MAX_SIZE 条或等待 RL_BATCH_MAX_WAIT_US 微秒后一起推理
+BATCHER = MicroBatcher(
+    infer_reqs,
+    max_batch_size=int(os.environ.get("RL_BATCH_MAX_SIZE", 32)),
+    max_wait_us=int(os.environ.get("RL_BATCH_MAX_WAIT_US", 500)),
+)
 
 @app.post("/predict", response_model=PredictResp)
-def predict(req: PredictReq):
+def predict(req: PredictReq, request: Request):
+    observe_parse(request, "predict")
+    model = MODEL
+    t0 = time.perf_counter()
     x = featurize(req)
-    w = policy_infer(x)
-    return PredictResp(w=w)
+    FEATURIZE_SECONDS.observe(time.perf_counter() - t0, "predict")
+    w = int(timed_decide(x[None, :], "predict", model)[0])
+    return PredictResp(w=w, model_version=model.version)
+
+@app.post("/predict_batch", response_model=PredictBatchResp)
+def predict_batch(req: PredictBatchReq, request: Request):
+    """一次评估整个时隙的 Qp，返回的 w 与 reqs 顺序一一对应"""
+    observe_parse(request, "predict_batch")
+    model = MODEL
+    X = timed_featurize(req.reqs, "predict_batch")
+    w = timed_decide(X, "predict_batch", model)
+    return PredictBatchResp(w=w.tolist(), model_version=model.version)
+
+@app.post("/predict_async", response_model=PredictResp)
+async def predict_async(req: PredictReq, request: Request):
+    """与 /predict 相同的输入输出，但在事件循环里排队，和并发请求一起微批推理"""
+    observe_parse(request, "predict_async")
+    w, version = await BATCHER.submit(req)
+    return PredictResp(w=int(w), model_version=version)
+
+@app.post("/predict_bin")
+async def predict_bin(request: Request):
+    """二进制协议（格式见 wire.py）：请求体为打包的 1..N 条请求，响应为 int32[N] 小端宽度；
+    模型版本放在响应头 X-Model-Version（规则策略时为 "none"）
+    """
+    body = await request.body()
+    try:
+        cols = wire.decode_requests(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    observe_parse(request, "predict_bin")
+    model = MODEL
+    t0 = time.perf_counter()
+    X = featurize_wire(cols)
+    FEATURIZE_SECONDS.observe(time.perf_counter() - t0, "predict_bin")
+    w = timed_decide(X, "predict_bin", model)
+    return Response(content=wire.encode_widths(w), media_type="application/octet-stream",
+                    headers={"X-Model-Version": "none" if model.version is None else str(model.version)})
+
+@app.get("/cache_stats")
+def cache_stats():
+    """当前模型的决策缓存的命中/未命中/淘汰计数（未启用时 enabled=False）"""
+    cache = MODEL.cache
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+@app.get("/model")
+def model_info():
+    """本进程当前服务的模型：版本、来源文件等（多进程时每个 worker 各自回答）"""
+    return {**MODEL.info, "version": MODEL.version, "policy": MODEL.policy is not None, "pid": os.getpid()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus 文本格式：请求数、解析/特征/推理延迟直方图、批大小分布、缓存与微批计数"""
+    model = MODEL
+    extra = ["# TYPE rl_model_version gauge", f"rl_model_version {model.version or 0}"]
+    if model.cache is not None:
+        # size/max_size 是当前值（gauge），hits/misses/evictions 只增不减（counter，随模型切换换新缓存时归零）
+        for k, v in model.cache.stats().items():
+            if k in ("hits", "misses", "evictions"):
+                extra += [f"# TYPE rl_cache_{k}_total counter", f"rl_cache_{k}_total {v}"]
+            else:
+                extra += [f"# TYPE rl_cache_{k} gauge", f"rl_cache_{k} {v}"]
+    extra += [
+        "# TYPE rl_microbatch_batches_total counter", f"rl_microbatch_batches_total {BATCHER.batches}",
+        "# TYPE rl_microbatch_items_total counter", f"rl_microbatch_items_total {BATCHER.items}",
+    ]
+    return PlainTextResponse(
+        render_prometheus([REQUESTS, PARSE_SECONDS, FEATURIZE_SECONDS, INFER_SECONDS, BATCH_SIZE], extra),
+        media_type="text/plain; version=0.0.4",
+    )
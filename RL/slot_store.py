@@ -0,0 +1,286 @@
+# slot_store.py
+# -*- coding: utf-8 -*-
+"""
+RLStateWriter / GraphEncoding 时隙日志（JSON Lines）的流式导入与内存映射读取。
+
+导入：逐行解析，常数内存，按 shard_slots 个时隙一个分片写成列式二进制文件（CSR 风格）：
+  shard_XXXXX/
+    slots.bin          int64 [S, 5]   (slot, solver_id, node_end, edge_end, req_end)  —— 各表的累计偏移
+    node_features.bin  float32 [ΣN, node_dim]
+    edge_features.bin  float32 [ΣE, edge_dim]
+    edge_index.bin     int32 [ΣE, 3]  (id, u, v)
+    requests.bin       int32 [ΣR, 6]  (src, dst, Dd, AT, WT, priority)
+    embeds.bin         float32 [M, embed_dim]   GraphEncoding.process 写的 {"slot","solver","embed"} 行
+    embed_slots.bin    int64 [M, 2]   (slot, solver_id)
+    meta.json          行数 / 维度 / solver 名表
+读取：SlotStore(out_dir) 用 np.memmap 打开全部分片，store[i] / store.range(a, b) 直接返回视图，不再解析 JSON。
+
+用法：
+    python slot_store.py ingest states.jsonl [more.jsonl ...] -o slot_store/
+    python slot_store.py info slot_store/
+"""
+import argparse
+import gzip
+import json
+import os
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+REQUEST_FIELDS = ("src", "dst", "Dd", "AT", "WT", "priority")
+
+_TABLES = {
+    # 名字: (dtype, 列数 或 meta 中的维度键)
+    "slots":         (np.int64, 5),
+    "node_features": (np.float32, "node_dim"),
+    "edge_features": (np.float32, "edge_dim"),
+    "edge_index":    (np.int32, 3),
+    "requests":      (np.int32, len(REQUEST_FIELDS)),
+    "embeds":        (np.float32, "embed_dim"),
+    "embed_slots":   (np.int64, 2),
+}
+
+
+def _open_text(path: str):
+    return gzip.open(path, "rt", encoding="utf-8") if path.endswith(".gz") else open(path, "r", encoding="utf-8")
+
+
+def _rows(rows: List[List[float]], dim: int, dtype, what: str) -> np.ndarray:
+    a = np.asarray(rows, dtype=dtype)
+    if a.size == 0:
+        return a.reshape(0, dim)
+    if a.ndim != 2 or a.shape[1] != dim:
+        raise ValueError(f"{what}: expected rows of width {dim}, got shape {a.shape}")
+    return a
+
+
+class _ShardWriter:
+
+    def __init__(self, shard_dir: str):
+        os.makedirs(shard_dir, exist_ok=True)
+        self.dir = shard_dir
+        self.files = {name: open(os.path.join(shard_dir, f"{name}.bin"), "wb") for name in _TABLES}
+        self.counts = {name: 0 for name in _TABLES}
+
+    def write(self, name: str, arr: np.ndarray):
+        self.files[name].write(np.ascontiguousarray(arr).tobytes())
+        self.counts[name] += arr.shape[0]
+
+    def close(self, dims: Dict[str, int], solvers: List[str]):
+        for f in self.files.values():
+            f.close()
+        meta = {"rows": self.counts, **dims, "solvers": solvers}
+        with open(os.path.join(self.dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+
+def ingest(paths: Iterable[str], out_dir: str, shard_slots: int = 10000) -> int:
+    """把若干 JSONL 文件导入 out_dir，返回导入的时隙数（不含 embed 行）"""
+    os.makedirs(out_dir, exist_ok=True)
+    solvers: List[str] = []
+    solver_ids: Dict[str, int] = {}
+    dims = {"node_dim": None, "edge_dim": None, "embed_dim": None}
+
+    shard_i = 0
+    writer = None
+    n_slots = 0
+    ends = [0, 0, 0]   # 当前分片内 node / edge / request 的累计行数
+
+    def solver_id(name: str) -> int:
+        if name not in solver_ids:
+            solver_ids[name] = len(solvers)
+            solvers.append(name)
+        return solver_ids[name]
+
+    def close_writer():
+        if writer is not None:
+            writer.close({k: (v or 0) for k, v in dims.items()}, solvers)
+
+    for path in paths:
+        with _open_text(path) as f:
+            for lineno, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                rec = json.loads(line)
+                where = f"{path}:{lineno}"
+
+                if writer is None or (writer.counts["slots"] >= shard_slots):
+                    close_writer()
+                    writer = _ShardWriter(os.path.join(out_dir, f"shard_{shard_i:05d}"))
+                    shard_i += 1
+                    ends = [0, 0, 0]
+
+                sid = solver_id(rec.get("solver", ""))
+                if "embed" in rec:
+                    emb = rec["embed"]
+                    if dims["embed_dim"] is None:
+                        dims["embed_dim"] = len(emb)
+                    writer.write("embeds", _rows([emb], dims["embed_dim"], np.float32, where))
+                    writer.write("embed_slots", np.array([[rec["slot"], sid]], dtype=np.int64))
+                    continue
+
+                g = rec["graph"]
+                nf, ef = g["node_features"], g["edge_features"]
+                if dims["node_dim"] is None and nf:
+                    dims["node_dim"] = len(nf[0])
+                if dims["edge_dim"] is None and ef:
+                    dims["edge_dim"] = len(ef[0])
+                nf = _rows(nf, dims["node_dim"] or 0, np.float32, where)
+                ef = _rows(ef, dims["edge_dim"] or 0, np.float32, where)
+                ei = np.array([[e["id"], e["u"], e["v"]] for e in g["edges"]], dtype=np.int32).reshape(-1, 3)
+                rq = np.array([[r[k] for k in REQUEST_FIELDS] for r in rec["requests"]], dtype=np.int32)
+                rq = rq.reshape(-1, len(REQUEST_FIELDS))
+                if ei.shape[0] != ef.shape[0]:
+                    raise ValueError(f"{where}: {ei.shape[0]} edges but {ef.shape[0]} edge_features rows")
+
+                writer.write("node_features", nf)
+                writer.write("edge_features", ef)
+                writer.write("edge_index", ei)
+                writer.write("requests", rq)
+                ends[0] += nf.shape[0]
+                ends[1] += ef.shape[0]
+                ends[2] += rq.shape[0]
+                writer.write("slots", np.array([[rec["slot"], sid, *ends]], dtype=np.int64))
+                n_slots += 1
+
+    close_writer()
+    return n_slots
+
+
+class _Shard:
+
+    def __init__(self, shard_dir: str):
+        with open(os.path.join(shard_dir, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.tables: Dict[str, np.ndarray] = {}
+        for name, (dtype, width) in _TABLES.items():
+            width = self.meta[width] if isinstance(width, str) else width
+            rows = self.meta["rows"][name]
+            path = os.path.join(shard_dir, f"{name}.bin")
+            if rows == 0 or width == 0:
+                self.tables[name] = np.zeros((rows, width), dtype=dtype)
+            else:
+                self.tables[name] = np.memmap(path, dtype=dtype, mode="r", shape=(rows, width))
+        slots = self.tables["slots"]
+        # CSR 偏移：ptr[k][i] .. ptr[k][i+1] 为第 i 个时隙在表 k 中的行范围
+        zero = np.zeros(1, dtype=np.int64)
+        self.node_ptr = np.concatenate([zero, slots[:, 2]])
+        self.edge_ptr = np.concatenate([zero, slots[:, 3]])
+        self.req_ptr = np.concatenate([zero, slots[:, 4]])
+
+    @classmethod
+    def empty(cls) -> "_Shard":
+        """没有任何分片时的占位（各表 0 行，维度未知的表宽度为 0）"""
+        sh = cls.__new__(cls)
+        sh.meta = {"rows": {name: 0 for name in _TABLES}, "solvers": []}
+        sh.tables = {name: np.zeros((0, width if isinstance(width, int) else 0), dtype=dtype)
+                     for name, (dtype, width) in _TABLES.items()}
+        sh.node_ptr = sh.edge_ptr = sh.req_ptr = np.zeros(1, dtype=np.int64)
+        return sh
+
+    def __len__(self):
+        return self.tables["slots"].shape[0]
+
+
+class SlotStore:
+    """按全局下标访问已导入的时隙；返回的数组都是内存映射视图"""
+
+    def __init__(self, out_dir: str):
+        names = sorted(d for d in os.listdir(out_dir) if d.startswith("shard_"))
+        self.shards = [_Shard(os.path.join(out_dir, d)) for d in names]
+        self.solvers = self.shards[-1].meta["solvers"] if self.shards else []
+        sizes = np.array([len(s) for s in self.shards], dtype=np.int64)
+        self._starts = np.concatenate([np.zeros(1, dtype=np.int64), np.cumsum(sizes)])
+
+    def __len__(self):
+        return int(self._starts[-1])
+
+    def _locate(self, i: int):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"slot index {i} out of range [0, {len(self)})")
+        k = int(np.searchsorted(self._starts, i, side="right")) - 1
+        return self.shards[k], i - int(self._starts[k])
+
+    def __getitem__(self, i: int) -> Dict[str, object]:
+        sh, j = self._locate(i)
+        t = sh.tables
+        n0, n1 = sh.node_ptr[j], sh.node_ptr[j + 1]
+        e0, e1 = sh.edge_ptr[j], sh.edge_ptr[j + 1]
+        r0, r1 = sh.req_ptr[j], sh.req_ptr[j + 1]
+        return {
+            "slot": int(t["slots"][j, 0]),
+            "solver": self.solvers[int(t["slots"][j, 1])],
+            "node_features": t["node_features"][n0:n1],
+            "edge_features": t["edge_features"][e0:e1],
+            "edge_index": t["edge_index"][e0:e1, 1:],
+            "edge_id": t["edge_index"][e0:e1, 0],
+            "requests": t["requests"][r0:r1],
+        }
+
+    def range(self, start: int, stop: int) -> Dict[str, np.ndarray]:
+        """取 [start, stop) 的时隙，各表拼成连续块并附带 CSR 偏移（从 0 开始）。
+        区间落在单个分片内时返回视图，跨分片时拼接；空区间返回 0 行的数组（列数不变），各 ptr 为 [0]。
+        """
+        parts = []
+        i = start
+        while i < stop:
+            sh, j = self._locate(i)
+            j_end = min(len(sh), j + (stop - i))
+            parts.append((sh, j, j_end))
+            i += j_end - j
+        if not parts:
+            # 空区间：取第一个分片的 0 行切片，列数与 dtype 与非空结果一致
+            parts.append((self.shards[0] if self.shards else _Shard.empty(), 0, 0))
+
+        out = {k: [] for k in ("slot", "solver_id", "node_features", "edge_features", "edge_index", "requests")}
+        ptrs = {"node_ptr": [np.zeros(1, dtype=np.int64)], "edge_ptr": [np.zeros(1, dtype=np.int64)],
+                "req_ptr": [np.zeros(1, dtype=np.int64)]}
+        base = {"node_ptr": 0, "edge_ptr": 0, "req_ptr": 0}
+        for sh, a, b in parts:
+            t = sh.tables
+            out["slot"].append(t["slots"][a:b, 0])
+            out["solver_id"].append(t["slots"][a:b, 1])
+            for key, tables in (("node_ptr", ("node_features",)),
+                                ("edge_ptr", ("edge_features", "edge_index")),
+                                ("req_ptr", ("requests",))):
+                p = getattr(sh, key)
+                lo, hi = p[a], p[b]
+                ptrs[key].append(p[a + 1:b + 1] - lo + base[key])
+                base[key] += int(hi - lo)
+                for table in tables:
+                    out[table].append(t[table][lo:hi])
+
+        def join(xs):
+            return xs[0] if len(xs) == 1 else np.concatenate(xs, axis=0)
+
+        res = {k: join(v) for k, v in out.items()}
+        res.update({k: np.concatenate(v) for k, v in ptrs.items()})
+        return res
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RLStateWriter JSONL -> 内存映射列式分片")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_in = sub.add_parser("ingest", help="流式导入 JSONL（支持 .gz）")
+    p_in.add_argument("inputs", nargs="+")
+    p_in.add_argument("-o", "--out", required=True)
+    p_in.add_argument("--shard-slots", type=int, default=10000, help="每个分片的时隙数")
+    p_info = sub.add_parser("info", help="打印已导入数据的规模")
+    p_info.add_argument("store")
+    args = parser.parse_args()
+
+    if args.cmd == "ingest":
+        n = ingest(args.inputs, args.out, shard_slots=args.shard_slots)
+        print(f"Ingested {n} slots into {args.out}")
+    else:
+        store = SlotStore(args.store)
+        rows = {k: sum(s.meta["rows"][k] for s in store.shards) for k in _TABLES}
+        print(f"{len(store)} slots in {len(store.shards)} shards, solvers={store.solvers}")
+        print(json.dumps(rows))
+
+
+if __name__ == "__main__":
+    main()
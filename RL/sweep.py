@@ -0,0 +1,273 @@
+# sweep.py
+# -*- coding: utf-8 -*-
+"""
+超参搜索：在 TrainConfig 上做网格 / 随机搜索，进程池并行跑 ppo_training.train，结果汇总成一张表。
+
+- 每个 trial 的完整 TrainConfig 显式传给 spawn 出来的进程（不靠子进程重新导入模块拿默认值），
+  trial 目录里有自己的 checkpoint、metrics.jsonl 和 train.log。
+- 每个 trial 限制线程数（OMP/MKL/OpenBLAS 环境变量 + torch.set_num_threads），
+  并行数默认 cpu_count // threads_per_trial，避免多个 trial 抢同一批核。
+- 中位数停止规则：每 report_every 个回合各 trial 把最近回合平均回报写进 Manager 共享字典；
+  过了 grace_episodes 之后，若某 trial 在同一进度上低于其它 trial（至少 min_trials 个）的中位数就提前结束。
+- 结果：out/results.jsonl（每个 trial 一行，含学习曲线）、out/results.csv（不含曲线）和终端上的排序表。
+
+用法：
+    python sweep.py --out sweeps/lr --grid pi_lr=1e-4,3e-4,1e-3 clip_ratio=0.1,0.2 --set max_episodes=400
+    python sweep.py --out sweeps/rs --random pi_lr=loguniform:1e-5:1e-3 minibatch=choice:32,64,128 \\
+        --trials 16 --seeds 0 1 --threads-per-trial 2
+"""
+import argparse
+import contextlib
+import csv
+import itertools
+import json
+import multiprocessing as mp
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import replace
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ppo_training import TrainConfig, parse_value, train
+from threads import thread_env
+
+DISTRIBUTIONS = ("uniform", "loguniform", "int", "choice")
+
+
+# ========== 搜索空间 ==========
+def grid_space(space: Dict[str, list]) -> List[dict]:
+    """{key: [v1, v2, ...]} 的笛卡尔积"""
+    keys = list(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+
+
+def random_space(space: Dict[str, tuple], num_trials: int, seed: int = 0) -> List[dict]:
+    """{key: (dist, *args)}，dist 为 uniform(lo, hi) / loguniform(lo, hi) / int(lo, hi 含) / choice(values)"""
+    rng = np.random.default_rng(seed)
+    trials = []
+    for _ in range(num_trials):
+        params = {}
+        for key, (dist, *args) in space.items():
+            if dist == "uniform":
+                params[key] = float(rng.uniform(args[0], args[1]))
+            elif dist == "loguniform":
+                params[key] = float(np.exp(rng.uniform(np.log(args[0]), np.log(args[1]))))
+            elif dist == "int":
+                params[key] = int(rng.integers(args[0], args[1] + 1))
+            elif dist == "choice":
+                params[key] = args[0][int(rng.integers(len(args[0])))]
+            else:
+                raise ValueError(f"unknown distribution {dist!r}, expected one of {DISTRIBUTIONS}")
+        trials.append(params)
+    return trials
+
+
+def parse_grid(items: List[str]) -> Dict[str, list]:
+    """["pi_lr=1e-4,3e-4", ...] -> {"pi_lr": [1e-4, 3e-4]}"""
+    space = {}
+    for item in items:
+        key, values = item.split("=", 1)
+        space[key] = [parse_value(v) for v in values.split(",")]
+    return space
+
+
+def parse_random(items: List[str]) -> Dict[str, tuple]:
+    """["pi_lr=loguniform:1e-5:1e-3", "minibatch=choice:32,64"] -> {"pi_lr": ("loguniform", 1e-5, 1e-3), ...}"""
+    space = {}
+    for item in items:
+        key, spec = item.split("=", 1)
+        dist, _, rest = spec.partition(":")
+        if dist == "choice":
+            space[key] = (dist, [parse_value(v) for v in rest.split(",")])
+        elif dist in DISTRIBUTIONS:
+            space[key] = (dist, *(parse_value(v) for v in rest.split(":")))
+        else:
+            raise ValueError(f"unknown distribution {dist!r}, expected one of {DISTRIBUTIONS}")
+    return space
+
+
+# ========== 中位数停止 ==========
+class MedianStopper:
+    """中位数停止规则。shared 是 Manager().dict()：trial_id -> {进度档: 最近回合平均回报}。
+    可 pickle（DictProxy 在子进程里自动重连），作为 trial 参数传给进程池。
+    """
+
+    def __init__(self, shared, report_every: int = 50, grace_episodes: int = 100, min_trials: int = 3):
+        self.shared = shared
+        self.report_every = report_every
+        self.grace_episodes = grace_episodes
+        self.min_trials = min_trials
+
+    def progress_fn(self, trial_id: str):
+        """给 train(progress_fn=...) 的回调：每跨过一个 report_every 档上报一次并判断是否停止"""
+        last = [0]
+
+        def report(episode_i: int, global_step: int, avg_reward: float) -> bool:
+            rung = episode_i // self.report_every
+            if rung <= last[0] or not np.isfinite(avg_reward):
+                return False
+            last[0] = rung
+            history = dict(self.shared.get(trial_id, {}))
+            history[rung] = avg_reward
+            self.shared[trial_id] = history          # 代理字典里的值要整体重新赋值才会同步
+            if episode_i < self.grace_episodes:
+                return False
+            others = [h[rung] for tid, h in self.shared.items() if tid != trial_id and rung in h]
+            return len(others) >= self.min_trials and avg_reward < float(np.median(others))
+
+        return report
+
+
+# ========== 单个 trial（在进程池里运行） ==========
+def _curve(ep_rewards: List[float], every: int, window: int) -> List[float]:
+    """每 every 个回合取一次最近 window 个回合的平均回报"""
+    return [float(np.mean(ep_rewards[max(0, e - window):e])) for e in range(every, len(ep_rewards) + 1, every)]
+
+
+def _run_trial(trial_id: str, params: dict, cfg: TrainConfig, save_dir: str,
+               stopper: Optional[MedianStopper], curve_every: int) -> dict:
+    os.makedirs(save_dir, exist_ok=True)
+    row = {"trial": trial_id, "params": params, "seed": cfg.seed, "save_dir": save_dir}
+    t0 = time.perf_counter()
+    try:
+        with open(os.path.join(save_dir, "train.log"), "w", encoding="utf-8") as log, \
+                contextlib.redirect_stdout(log):
+            summary = train(cfg, save_dir=save_dir,
+                            progress_fn=stopper.progress_fn(trial_id) if stopper is not None else None)
+    except Exception:
+        with open(os.path.join(save_dir, "error.log"), "w", encoding="utf-8") as f:
+            f.write(traceback.format_exc())
+        row.update(status="failed", wall_time=time.perf_counter() - t0)
+        return row
+    ep_rewards = summary["ep_rewards"]
+    curve = _curve(ep_rewards, curve_every, cfg.reward_buffer_size)
+    row.update(
+        status="stopped" if summary["stopped"] else "completed",
+        final_avg_reward=summary["final_avg_reward"],
+        best_avg_reward=max(curve) if curve else summary["final_avg_reward"],
+        mean_reward=float(np.mean(ep_rewards)) if ep_rewards else float("nan"),   # 学习曲线下面积 / 回合数
+        episodes=summary["episodes"],
+        global_step=summary["global_step"],
+        n_update=summary["n_update"],
+        wall_time=time.perf_counter() - t0,
+        curve=curve,
+    )
+    return row
+
+
+# ========== 搜索 ==========
+def run_sweep(
+    base: TrainConfig,
+    trials: List[dict],
+    out_dir: str,
+    seeds: Optional[List[int]] = None,
+    max_parallel: Optional[int] = None,
+    threads_per_trial: int = 1,
+    median_stop: bool = True,
+    report_every: int = 50,
+    grace_episodes: int = 100,
+    min_trials: int = 3,
+) -> List[dict]:
+    """每组参数 x 每个种子一个 trial；返回按 final_avg_reward 降序的结果行，同时写 results.jsonl / results.csv"""
+    os.makedirs(out_dir, exist_ok=True)
+    seeds = list(seeds) if seeds else [base.seed]
+    max_parallel = max_parallel or max(1, (os.cpu_count() or 1) // threads_per_trial)
+    base = replace(base, headless=True, num_threads=threads_per_trial)
+    jobs = []
+    for i, params in enumerate(trials):
+        for seed in seeds:
+            trial_id = f"t{i:03d}_s{seed}"
+            jobs.append((trial_id, params, replace(base.override(params), seed=seed),
+                         os.path.join(out_dir, trial_id)))
+    with open(os.path.join(out_dir, "sweep.json"), "w", encoding="utf-8") as f:
+        json.dump({"base": base.to_dict(), "trials": trials, "seeds": seeds, "median_stop": median_stop,
+                   "report_every": report_every, "grace_episodes": grace_episodes, "min_trials": min_trials},
+                  f, indent=2)
+
+    ctx = mp.get_context("spawn")
+    rows = []
+    with contextlib.ExitStack() as stack:
+        manager = stack.enter_context(ctx.Manager()) if median_stop else None
+        stopper = MedianStopper(manager.dict(), report_every, grace_episodes, min_trials) if median_stop else None
+        stack.enter_context(thread_env(threads_per_trial))
+        pool = stack.enter_context(ProcessPoolExecutor(max_workers=max_parallel, mp_context=ctx))
+        futures = [pool.submit(_run_trial, trial_id, params, cfg, save_dir, stopper, report_every)
+                   for trial_id, params, cfg, save_dir in jobs]
+        with open(os.path.join(out_dir, "results.jsonl"), "w", encoding="utf-8") as f:
+            for fut in as_completed(futures):
+                row = fut.result()
+                rows.append(row)
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+                f.flush()
+                print(f"[{len(rows)}/{len(jobs)}] {row['trial']} {row['status']} "
+                      f"final={row.get('final_avg_reward', float('nan')):.3f} {row['params']}")
+
+    rows.sort(key=lambda r: -r["final_avg_reward"] if np.isfinite(r.get("final_avg_reward", np.nan)) else np.inf)
+    _write_csv(rows, os.path.join(out_dir, "results.csv"))
+    return rows
+
+
+_COLUMNS = ("trial", "status", "seed", "final_avg_reward", "best_avg_reward", "mean_reward",
+            "episodes", "global_step", "wall_time")
+
+
+def _write_csv(rows: List[dict], path: str):
+    keys = sorted({k for r in rows for k in r["params"]})
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(list(_COLUMNS) + keys)
+        for r in rows:
+            w.writerow([r.get(c, "") for c in _COLUMNS] + [r["params"].get(k, "") for k in keys])
+
+
+def print_table(rows: List[dict]):
+    keys = sorted({k for r in rows for k in r["params"]})
+    header = ["trial", "status", *keys, "final", "best", "mean", "episodes", "time(s)"]
+    lines = [header]
+    for r in rows:
+        lines.append([r["trial"], r["status"], *(f"{r['params'].get(k, '')}" for k in keys),
+                      *(f"{r[c]:.3f}" if c in r else "-" for c in ("final_avg_reward", "best_avg_reward", "mean_reward")),
+                      str(r.get("episodes", "-")), f"{r['wall_time']:.0f}"])
+    widths = [max(len(line[i]) for line in lines) for i in range(len(header))]
+    for line in lines:
+        print("  ".join(cell.ljust(w) for cell, w in zip(line, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PPO 超参搜索（网格 / 随机 + 中位数停止）")
+    parser.add_argument("--out", required=True, help="输出目录（每个 trial 一个子目录 + results.jsonl/csv）")
+    parser.add_argument("--grid", nargs="*", default=[], metavar="KEY=V1,V2",
+                        help="网格搜索维度，例如 pi_lr=1e-4,3e-4 clip_ratio=0.1,0.2")
+    parser.add_argument("--random", nargs="*", default=[], metavar="KEY=DIST:ARGS",
+                        help="随机搜索维度：uniform:lo:hi / loguniform:lo:hi / int:lo:hi / choice:a,b,c")
+    parser.add_argument("--trials", type=int, default=16, help="随机搜索的采样组数")
+    parser.add_argument("--sample-seed", type=int, default=0, help="随机搜索采样用的种子")
+    parser.add_argument("--seeds", type=int, nargs="*", default=None, help="每组参数跑的训练种子（默认 TrainConfig.seed）")
+    parser.add_argument("--set", nargs="*", default=[], metavar="KEY=VALUE", help="所有 trial 共用的 TrainConfig 覆盖")
+    parser.add_argument("--max-parallel", type=int, default=None, help="同时运行的 trial 数（默认 cpu_count // threads）")
+    parser.add_argument("--threads-per-trial", type=int, default=1)
+    parser.add_argument("--no-median-stop", action="store_true")
+    parser.add_argument("--report-every", type=int, default=50, help="每多少回合上报 / 记录一次学习曲线")
+    parser.add_argument("--grace-episodes", type=int, default=100, help="这之前不做中位数停止")
+    parser.add_argument("--min-trials", type=int, default=3, help="至少有几个其它 trial 在同一进度上报过才比较")
+    args = parser.parse_args()
+
+    if bool(args.grid) == bool(args.random):
+        parser.error("exactly one of --grid / --random is required")
+    if args.grid:
+        trials = grid_space(parse_grid(args.grid))
+    else:
+        trials = random_space(parse_random(args.random), args.trials, seed=args.sample_seed)
+
+    rows = run_sweep(TrainConfig().override(args.set), trials, args.out, seeds=args.seeds,
+                     max_parallel=args.max_parallel, threads_per_trial=args.threads_per_trial,
+                     median_stop=not args.no_median_stop, report_every=args.report_every,
+                     grace_episodes=args.grace_episodes, min_trials=args.min_trials)
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
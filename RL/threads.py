@@ -0,0 +1,25 @@
+# threads.py
+# -*- coding: utf-8 -*-
+"""
+子进程的 BLAS / OpenMP 线程数（不依赖 torch）：numpy、torch 在导入时读取这些环境变量，
+多进程服务（serve.py）、并行 sweep / 评估按进程限制线程数时都从这里取。
+"""
+import contextlib
+import os
+
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+@contextlib.contextmanager
+def thread_env(threads: int):
+    """子进程启动时继承的 BLAS / OpenMP 线程数（numpy、torch 在导入时读取）"""
+    old = {k: os.environ.get(k) for k in THREAD_ENV_VARS}
+    os.environ.update({k: str(threads) for k in THREAD_ENV_VARS})
+    try:
+        yield
+    finally:
+        for k, v in old.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
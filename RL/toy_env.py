@@ -10,10 +10,20 @@ class ToyAllocEnv:
     - 奖励: util - LAMBDA * unfair
       util   = sum(alloc)/max(sum(caps),1)
       unfair = std(alloc')，其中 alloc' = alloc / max(1, sum(alloc))
+    - 变长请求集（max_requests 不为 None）：每个时隙的有效请求数在 [min_requests, max_requests] 间随机，
+      观测/动作都按 max_requests 填充，前 n_active 个有效；self.mask 为当前观测对应的有效位（bool [max_requests]），
+      观测为 [caps*mask/CAP_MAX, global_sum, mask]，填充位不参与分配和奖励。定长时 mask 为 None
+    - 场景回放（scenarios 为 scenario_bank.ScenarioBank）：容量和有效请求数按游标从场景库里逐步读取，
+      每次 reset 换下一个场景；scenario_start 为第一个场景的下标（None 时由 seed 决定）
     """
 
-    def __init__(self, n_requests=8, cap_max=5, horizon=64, seed=42, unfair_lambda=0.2, ar_rho: float | None = None):
-        self.n = int(n_requests)
+    def __init__(self, n_requests=8, cap_max=5, horizon=64, seed=42, unfair_lambda=0.2, ar_rho: float | None = None,
+                 vary_per_step: bool = True, max_requests: int | None = None, min_requests: int = 1,
+                 scenarios=None, scenario_start: int | None = None):
+        self.variable = max_requests is not None
+        self.n = int(max_requests if self.variable else n_requests)
+        self.min_requests = int(min_requests)
+        self.mask = None
         self.action_dim = self.n
         self.CAP_MAX = int(cap_max)
         self.H = int(horizon)
@@ -22,15 +32,45 @@ class ToyAllocEnv:
         self.t = 0
         self.caps = None
         self.ar_rho = ar_rho
+        self.vary_per_step = vary_per_step
+        self.scenarios = scenarios
+        if scenarios is not None:
+            scenarios.check_env(self.n, self.CAP_MAX, self.H)
+            self.cursor = int(self.rng.integers(len(scenarios)) if scenario_start is None else scenario_start)
+            self.scenario = -1
 
     def _obs(self):
-        caps_norm = self.caps / self.CAP_MAX
-        gsum = np.array([self.caps.sum() / (self.n * self.CAP_MAX)], dtype=np.float32)
-        return np.concatenate([caps_norm.astype(np.float32), gsum], axis=0)
+        caps = self._active_caps()
+        caps_norm = caps / self.CAP_MAX
+        gsum = np.array([caps.sum() / (self.n * self.CAP_MAX)], dtype=np.float32)
+        if not self.variable:
+            return np.concatenate([caps_norm.astype(np.float32), gsum], axis=0)
+        return np.concatenate([caps_norm.astype(np.float32), gsum, self.mask.astype(np.float32)], axis=0)
+
+    def _active_caps(self):
+        return self.caps if self.mask is None else self.caps * self.mask
+
+    def _draw_mask(self):
+        if self.variable:
+            n_active = self.rng.integers(self.min_requests, self.n + 1)
+            self.mask = np.arange(self.n) < n_active
+
+    def _replay(self):
+        """从场景库读当前时刻的容量 / 有效请求数"""
+        self.caps = self._ep_caps[self.t].astype(np.int64)
+        if self.variable:
+            self.mask = np.arange(self.n) < self._ep_active[self.t]
 
     def reset(self):
         self.t = 0
+        if self.scenarios is not None:
+            self.scenario = self.cursor % len(self.scenarios)
+            self.cursor += 1
+            self._ep_caps, self._ep_active = self.scenarios[self.scenario]
+            self._replay()
+            return self._obs()
         self.caps = self.rng.integers(low=0, high=self.CAP_MAX+1, size=self.n, endpoint=False)
+        self._draw_mask()
         return self._obs()
 
     def step(self, action):
@@ -39,17 +79,19 @@ class ToyAllocEnv:
         assert a.shape == (self.n,), f"action shape {a.shape} != ({self.n},)"
         a = np.clip(a, 0.0, 1.0)
 
-        # 2) 投影为整数分配
-        alloc = np.floor(a * self.caps).astype(np.int32)
+        # 2) 投影为整数分配（填充位容量为 0，分配也为 0）
+        caps = self._active_caps()
+        mask = self.mask
+        alloc = np.floor(a * caps).astype(np.int32)
 
         # 3) 计算奖励
-        cap_sum = int(self.caps.sum())
+        cap_sum = int(caps.sum())
         alloc_sum = int(alloc.sum())
         util = (alloc_sum / cap_sum) if cap_sum > 0 else 0.0
 
         if alloc_sum > 0:
             alloc_ratio = alloc / alloc_sum
-            unfair = float(np.std(alloc_ratio))
+            unfair = float(np.std(alloc_ratio if mask is None else alloc_ratio[mask]))
         else:
             unfair = 0.0
 
@@ -58,7 +100,9 @@ class ToyAllocEnv:
         # 4) 下一状态
         self.t += 1
         done = (self.t >= self.H)
-        if not done:
+        if not done and self.scenarios is not None:
+            self._replay()
+        elif not done:
             if self.ar_rho is None:
                 if self.vary_per_step:
                     self.caps = self.rng.integers(low=0, high=self.CAP_MAX + 1, size=self.n)
@@ -68,6 +112,7 @@ class ToyAllocEnv:
                 cont = self.ar_rho * self.caps + (1 - self.ar_rho) * (self.CAP_MAX / 2) + noise
                 cont = np.clip(np.round(cont), 0, self.CAP_MAX)
                 self.caps = cont.astype(int)
+            self._draw_mask()
         next_obs = self._obs()
 
         # 5) info 里打印检查的上下文
@@ -77,4 +122,154 @@ class ToyAllocEnv:
             "util": util,
             "unfair": unfair
         }
+        if mask is not None:
+            info["mask"] = mask
         return next_obs, float(reward), bool(done), info
+
+
+class VecToyAllocEnv:
+    """
+    ToyAllocEnv 的向量化版本：K 个相互独立的环境放在 (K, n) 数组里一起步进。
+    - reset()      -> obs [K, n+1]
+    - step(action) -> (next_obs [K, n+1], reward [K], done [K], info)
+      action 形状 [K, n]，投影/奖励与 ToyAllocEnv 相同，只是对 K 个环境一次性计算
+    - 自动重置：某个环境到达 horizon 后，返回的 next_obs 已是它新回合的初始观测
+      （info["caps"]/["alloc"] 等仍是本步的值）
+    - 容量过程：ar_rho=None 时每步均匀重采样（vary_per_step=False 则回合内不变），否则 AR(1)
+    - 变长请求集（max_requests 不为 None）：同 ToyAllocEnv，mask 为 [K, max_requests]，观测宽度 2*max_requests+1
+    - 场景回放（scenarios）：同 ToyAllocEnv；第 k 个环境从 scenario_start + k 开始，之后每个结束的回合取游标处的下一个场景
+    """
+
+    def __init__(self, num_envs=8, n_requests=8, cap_max=5, horizon=64, seed=42, unfair_lambda=0.2,
+                 ar_rho: float | None = None, vary_per_step: bool = True,
+                 max_requests: int | None = None, min_requests: int = 1,
+                 scenarios=None, scenario_start: int | None = None):
+        self.K = int(num_envs)
+        self.variable = max_requests is not None
+        self.n = int(max_requests if self.variable else n_requests)
+        self.min_requests = int(min_requests)
+        self.mask = None
+        self.action_dim = self.n
+        self.CAP_MAX = int(cap_max)
+        self.H = int(horizon)
+        self.unfair_lambda = float(unfair_lambda)
+        self.rng = np.random.default_rng(seed)
+        self.ar_rho = ar_rho
+        self.vary_per_step = vary_per_step
+        self.t = np.zeros(self.K, dtype=np.int64)
+        self.caps = np.zeros((self.K, self.n), dtype=np.int64)
+        self.scenarios = scenarios
+        if scenarios is not None:
+            scenarios.check_env(self.n, self.CAP_MAX, self.H)
+            self.cursor = int(self.rng.integers(len(scenarios)) if scenario_start is None else scenario_start)
+            self.scenario = np.zeros(self.K, dtype=np.int64)
+
+    def _obs(self):
+        caps = self._active_caps()
+        obs = np.empty((self.K, 2 * self.n + 1 if self.variable else self.n + 1), dtype=np.float32)
+        obs[:, :self.n] = caps / self.CAP_MAX
+        obs[:, self.n] = caps.sum(axis=1) / (self.n * self.CAP_MAX)
+        if self.variable:
+            obs[:, self.n + 1:] = self.mask
+        return obs
+
+    def _active_caps(self):
+        return self.caps if self.mask is None else self.caps * self.mask
+
+    def _draw_uniform(self, k):
+        return self.rng.integers(low=0, high=self.CAP_MAX + 1, size=(k, self.n))
+
+    def _draw_mask(self, k):
+        n_active = self.rng.integers(self.min_requests, self.n + 1, size=(k, 1))
+        return np.arange(self.n)[None, :] < n_active
+
+    def _next_scenarios(self, k):
+        idx = (self.cursor + np.arange(k)) % len(self.scenarios)
+        self.cursor += k
+        return idx
+
+    def _replay(self):
+        """K 个环境各自场景在各自时刻的容量 / 有效请求数（一次花式下标读取）"""
+        self.caps = self.scenarios.caps[self.scenario, self.t].astype(np.int64)
+        if self.variable:
+            self.mask = np.arange(self.n)[None, :] < self.scenarios.n_active[self.scenario, self.t][:, None]
+
+    def reset(self):
+        self.t[:] = 0
+        if self.scenarios is not None:
+            self.scenario = self._next_scenarios(self.K)
+            self._replay()
+            return self._obs()
+        self.caps = self._draw_uniform(self.K)
+        if self.variable:
+            self.mask = self._draw_mask(self.K)
+        return self._obs()
+
+    def step(self, action):
+        # 1) 规范输入，确保 [0,1]^(K,n)
+        a = np.asarray(action, dtype=np.float32)
+        assert a.shape == (self.K, self.n), f"action shape {a.shape} != ({self.K}, {self.n})"
+        a = np.clip(a, 0.0, 1.0)
+
+        # 2) 投影为整数分配（填充位容量为 0，分配也为 0）
+        caps = self._active_caps()
+        mask = self.mask
+        alloc = np.floor(a * caps).astype(np.int32)
+
+        # 3) 计算奖励（逐环境）
+        cap_sum = caps.sum(axis=1)
+        alloc_sum = alloc.sum(axis=1)
+        util = np.where(cap_sum > 0, alloc_sum / np.maximum(cap_sum, 1), 0.0)
+        alloc_ratio = alloc / np.maximum(alloc_sum, 1)[:, None]
+        if mask is None:
+            spread = alloc_ratio.std(axis=1)
+        else:
+            # 只在有效位上求标准差
+            cnt = np.maximum(mask.sum(axis=1), 1)
+            mean = (alloc_ratio * mask).sum(axis=1) / cnt
+            spread = np.sqrt((((alloc_ratio - mean[:, None]) ** 2) * mask).sum(axis=1) / cnt)
+        unfair = np.where(alloc_sum > 0, spread, 0.0)
+        reward = (util - self.unfair_lambda * unfair).astype(np.float32)
+
+        caps_now = caps.copy() if mask is not None else self.caps.copy()
+
+        # 4) 下一状态（所有环境一起推进，结束的环境随后重置）
+        self.t += 1
+        done = self.t >= self.H
+        if self.scenarios is not None:
+            if done.any():
+                self.t[done] = 0
+                self.scenario[done] = self._next_scenarios(int(done.sum()))
+            self._replay()
+            return self._obs(), reward, done, self._info(caps_now, alloc, util, unfair, mask)
+
+        if self.ar_rho is None:
+            if self.vary_per_step:
+                self.caps = self._draw_uniform(self.K)
+        else:
+            # AR(1): caps = rho*caps + noise
+            noise = self.rng.normal(loc=0.0, scale=1.0, size=(self.K, self.n))
+            cont = self.ar_rho * self.caps + (1 - self.ar_rho) * (self.CAP_MAX / 2) + noise
+            self.caps = np.clip(np.round(cont), 0, self.CAP_MAX).astype(np.int64)
+
+        if self.variable:
+            self.mask = self._draw_mask(self.K)
+
+        # 5) 自动重置结束的环境
+        if done.any():
+            self.t[done] = 0
+            self.caps[done] = self._draw_uniform(int(done.sum()))
+        next_obs = self._obs()
+        return next_obs, reward, done, self._info(caps_now, alloc, util, unfair, mask)
+
+    @staticmethod
+    def _info(caps, alloc, util, unfair, mask):
+        info = {
+            "caps": caps,
+            "alloc": alloc,
+            "util": util,
+            "unfair": unfair
+        }
+        if mask is not None:
+            info["mask"] = mask
+        return info
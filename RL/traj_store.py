@@ -0,0 +1,155 @@
+# traj_store.py
+# -*- coding: utf-8 -*-
+"""
+落盘的轨迹仓库：把每次 update 前的 (state, action, logprob, value, reward, done) 追加到 np.memmap 分片，
+训练结束后仍可随机读取，用于离线 / 行为克隆训练和用真实采样数据评估旧 ckpt。
+
+目录结构：
+  root/
+    index.json            obs_dim / act_dim / 分片容量 / 各分片行数（每次 append 后原子更新）
+    episode_ends.bin      int64，done=1 的行的下一行全局下标（回合边界）
+    segment_ends.bin      int64，每段连续轨迹的结束下标（多环境按环境拆开存，段与段之间不连续）
+    shard_00000/{states,actions,logprobs,values,rewards,dones}.bin   float32，容量 shard_rows 行
+
+用法：
+    store = TrajectoryStore("traj/", obs_dim=9, act_dim=8)
+    store.append(*agent.replay_buffer.sample())      # [T, ...] 或 [T, K, ...]
+    batch = TrajectoryStore("traj/").sample(256)      # dict of np.ndarray
+"""
+import json
+import os
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+FIELDS = ("states", "actions", "logprobs", "values", "rewards", "dones")
+
+
+class TrajectoryStore:
+
+    def __init__(self, root: str, obs_dim: Optional[int] = None, act_dim: Optional[int] = None,
+                 shard_rows: int = 1 << 16):
+        self.root = root
+        self._index_path = os.path.join(root, "index.json")
+        if os.path.exists(self._index_path):
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                self.index = json.load(f)
+            if obs_dim is not None and obs_dim != self.index["obs_dim"]:
+                raise ValueError(f"obs_dim {obs_dim} != stored {self.index['obs_dim']}")
+            if act_dim is not None and act_dim != self.index["act_dim"]:
+                raise ValueError(f"act_dim {act_dim} != stored {self.index['act_dim']}")
+        else:
+            if obs_dim is None or act_dim is None:
+                raise ValueError(f"{root} has no index.json; obs_dim/act_dim are required to create a store")
+            os.makedirs(root, exist_ok=True)
+            self.index = {"obs_dim": int(obs_dim), "act_dim": int(act_dim),
+                          "shard_rows": int(shard_rows), "shards": []}
+        self.obs_dim = self.index["obs_dim"]
+        self.act_dim = self.index["act_dim"]
+        self.shard_rows = self.index["shard_rows"]
+        # (分片号, 是否可写) -> 各字段的映射；读写分开缓存，先读后写同一分片时不会拿到只读映射
+        self._maps: Dict[Tuple[int, bool], Dict[str, np.memmap]] = {}
+
+    # ---------- 布局 ----------
+    def _width(self, field: str) -> Tuple[int, ...]:
+        if field == "states":
+            return (self.obs_dim,)
+        if field == "actions":
+            return (self.act_dim,)
+        return ()
+
+    def _shard(self, k: int, mode: str = "r+") -> Dict[str, np.memmap]:
+        key = (k, mode != "r")
+        if key not in self._maps:
+            d = os.path.join(self.root, f"shard_{k:05d}")
+            if mode == "w+":
+                os.makedirs(d, exist_ok=True)
+            self._maps[key] = {
+                f: np.memmap(os.path.join(d, f"{f}.bin"), dtype=np.float32, mode=mode,
+                             shape=(self.shard_rows,) + self._width(f))
+                for f in FIELDS
+            }
+        return self._maps[key]
+
+    def __len__(self):
+        return sum(self.index["shards"])
+
+    # ---------- 写 ----------
+    def append(self, states, actions, logprobs, values, rewards, dones):
+        """追加一段轨迹。输入为 [T, ...]，或多环境的 [T, K, ...]（按环境拆成 K 段依次写入）"""
+        cols = [np.asarray(x.detach().cpu().numpy() if hasattr(x, "detach") else x, dtype=np.float32)
+                for x in (states, actions, logprobs, values, rewards, dones)]
+        if cols[4].ndim == 2:
+            for k in range(cols[4].shape[1]):
+                self._append_segment([c[:, k] for c in cols])
+        else:
+            self._append_segment(cols)
+        self._flush_index()
+
+    def _append_segment(self, cols):
+        T = cols[4].shape[0]
+        start = len(self)
+        done_rows = np.flatnonzero(cols[5] > 0.5) + start + 1
+        written = 0
+        while written < T:
+            if not self.index["shards"] or self.index["shards"][-1] >= self.shard_rows:
+                self.index["shards"].append(0)
+                self._shard(len(self.index["shards"]) - 1, mode="w+")
+            k = len(self.index["shards"]) - 1
+            pos = self.index["shards"][k]
+            n = min(T - written, self.shard_rows - pos)
+            m = self._shard(k)
+            for f, c in zip(FIELDS, cols):
+                m[f][pos:pos + n] = c[written:written + n]
+            self.index["shards"][k] += n
+            written += n
+        self._append_i64("episode_ends.bin", done_rows)
+        self._append_i64("segment_ends.bin", np.array([start + T], dtype=np.int64))
+
+    def _append_i64(self, name: str, arr: np.ndarray):
+        with open(os.path.join(self.root, name), "ab") as f:
+            f.write(np.asarray(arr, dtype=np.int64).tobytes())
+
+    def _flush_index(self):
+        for (_, writable), m in self._maps.items():
+            if writable:
+                for a in m.values():
+                    a.flush()
+        tmp = self._index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        os.replace(tmp, self._index_path)
+
+    # ---------- 读 ----------
+    def _ends(self, name: str) -> np.ndarray:
+        path = os.path.join(self.root, name)
+        if not os.path.exists(path):
+            return np.zeros(0, dtype=np.int64)
+        return np.fromfile(path, dtype=np.int64)
+
+    def rows(self, idx: np.ndarray) -> Dict[str, np.ndarray]:
+        """按全局行号随机读取（结果为拷贝，顺序与 idx 一致）"""
+        idx = np.asarray(idx, dtype=np.int64)
+        shard_of = idx // self.shard_rows
+        local = idx % self.shard_rows
+        out = {f: np.empty((len(idx),) + self._width(f), dtype=np.float32) for f in FIELDS}
+        for k in np.unique(shard_of):
+            sel = shard_of == k
+            m = self._shard(int(k), mode="r")
+            for f in FIELDS:
+                out[f][sel] = m[f][local[sel]]
+        return out
+
+    def sample(self, batch_size: int, rng: Optional[np.random.Generator] = None) -> Dict[str, np.ndarray]:
+        """均匀随机采一个 minibatch（直接从映射文件读取）"""
+        rng = rng or np.random.default_rng()
+        return self.rows(rng.integers(0, len(self), size=batch_size))
+
+    def episodes(self) -> Iterator[Tuple[int, int]]:
+        """按回合/分段边界给出 [start, end) 行区间（未结束的段也会作为一段给出）"""
+        bounds = np.union1d(self._ends("episode_ends.bin"), self._ends("segment_ends.bin"))
+        start = 0
+        for end in bounds.tolist():
+            if end > start:
+                yield start, end
+            start = end
@@ -0,0 +1,107 @@
+# wire.py
+# -*- coding: utf-8 -*-
+"""
+/predict_bin 的二进制请求格式（全部小端，4 字节对齐），一次可携带 1..N 条请求：
+
+  偏移  类型         内容
+  0     char[4]      magic = b"QRW1"
+  4     uint16       version = 1
+  6     uint16       flags = 0（保留）
+  8     uint32       n        请求条数
+  12    uint32       n_edges  所有请求 per_edge_free_links 的总长度
+  16    int32[7][n]  按列：demand, path_width_candidate, path_len,
+                     src_remaining_qubits, dst_remaining_qubits, priority, wait_time
+  ..    float32[2][n] 按列：global_load, recent_success_rate
+  ..    int32[n]     edge_counts    每条请求的 per_edge_free_links 长度
+  ..    int32[n_edges] per_edge_free_links 依次拼接
+
+与 JSON 的 PredictReq 相比：path 只传长度、sd 不传（特征里都用不到）。
+响应体为 int32[n] 小端宽度，顺序与请求一致。
+
+服务端 decode_requests 用 np.frombuffer 直接在请求体上建视图，不做拷贝；
+encode_requests / decode_widths 是给调用方和测试用的参考实现。
+"""
+import struct
+from typing import Dict, Iterable, Mapping
+
+import numpy as np
+
+MAGIC = b"QRW1"
+VERSION = 1
+HEADER = struct.Struct("<4sHHII")
+INT_FIELDS = ("demand", "path_width_candidate", "path_len",
+              "src_remaining_qubits", "dst_remaining_qubits", "priority", "wait_time")
+FLOAT_FIELDS = ("global_load", "recent_success_rate")
+
+_I32 = np.dtype("<i4")
+_F32 = np.dtype("<f4")
+
+
+def _get(r, key, default=0):
+    v = r.get(key, default) if isinstance(r, Mapping) else getattr(r, key, default)
+    return default if v is None else v
+
+
+def encode_requests(reqs: Iterable) -> bytes:
+    """reqs 为 dict 或 PredictReq（字段名同 PredictReq；path 可给列表或直接给 path_len）"""
+    reqs = list(reqs)
+    n = len(reqs)
+    ints = np.zeros((len(INT_FIELDS), n), dtype=_I32)
+    floats = np.zeros((len(FLOAT_FIELDS), n), dtype=_F32)
+    counts = np.zeros(n, dtype=_I32)
+    edges = []
+    for i, r in enumerate(reqs):
+        for j, f in enumerate(INT_FIELDS):
+            if f == "path_len":
+                path = _get(r, "path", None)
+                ints[j, i] = len(path) if path is not None else _get(r, "path_len")
+            else:
+                ints[j, i] = _get(r, f)
+        for j, f in enumerate(FLOAT_FIELDS):
+            floats[j, i] = _get(r, f, 0.0)
+        links = _get(r, "per_edge_free_links", [])
+        counts[i] = len(links)
+        edges.extend(links)
+    edge_arr = np.asarray(edges, dtype=_I32)
+    return b"".join([
+        HEADER.pack(MAGIC, VERSION, 0, n, len(edge_arr)),
+        ints.tobytes(), floats.tobytes(), counts.tobytes(), edge_arr.tobytes(),
+    ])
+
+
+def decode_requests(buf) -> Dict[str, np.ndarray]:
+    """解析请求体，返回只读视图：
+    ints [7, n] int32, floats [2, n] float32, edge_counts [n] int32, edges [n_edges] int32。
+    格式不对时抛 ValueError。
+    """
+    mv = memoryview(buf)
+    if len(mv) < HEADER.size:
+        raise ValueError(f"payload too short for header: {len(mv)} bytes")
+    magic, version, _flags, n, n_edges = HEADER.unpack_from(mv, 0)
+    if magic != MAGIC:
+        raise ValueError(f"bad magic {magic!r}")
+    if version != VERSION:
+        raise ValueError(f"unsupported version {version}")
+    expect = HEADER.size + 4 * (len(INT_FIELDS) * n + len(FLOAT_FIELDS) * n + n + n_edges)
+    if len(mv) != expect:
+        raise ValueError(f"payload size {len(mv)} != expected {expect} for n={n}, n_edges={n_edges}")
+
+    off = HEADER.size
+    ints = np.frombuffer(mv, dtype=_I32, count=len(INT_FIELDS) * n, offset=off).reshape(len(INT_FIELDS), n)
+    off += ints.nbytes
+    floats = np.frombuffer(mv, dtype=_F32, count=len(FLOAT_FIELDS) * n, offset=off).reshape(len(FLOAT_FIELDS), n)
+    off += floats.nbytes
+    counts = np.frombuffer(mv, dtype=_I32, count=n, offset=off)
+    off += counts.nbytes
+    edges = np.frombuffer(mv, dtype=_I32, count=n_edges, offset=off)
+    if int(counts.sum()) != n_edges or (counts < 0).any():
+        raise ValueError("edge_counts do not add up to n_edges")
+    return {"ints": ints, "floats": floats, "edge_counts": counts, "edges": edges}
+
+
+def encode_widths(w: np.ndarray) -> bytes:
+    return np.asarray(w, dtype=_I32).tobytes()
+
+
+def decode_widths(buf) -> np.ndarray:
+    return np.frombuffer(buf, dtype=_I32)